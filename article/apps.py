@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class ArticleConfig(AppConfig):
     name = 'article'
+
+    def ready(self):
+        from . import signals  # noqa: F401
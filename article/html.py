@@ -0,0 +1,135 @@
+import re
+from html import escape
+from html.parser import HTMLParser
+from urllib.parse import urlparse
+
+# summernoteで作られるタグのうち残すもの
+ALLOWED_TAGS = {
+    'a', 'b', 'blockquote', 'br', 'code', 'div', 'em', 'font', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+    'hr', 'i', 'img', 'li', 'ol', 'p', 'pre', 's', 'span', 'strike', 'strong', 'sub', 'sup',
+    'table', 'tbody', 'td', 'th', 'thead', 'tr', 'u', 'ul',
+}
+# 閉じタグのないタグ
+VOID_TAGS = {'br', 'hr', 'img'}
+# 中身ごと捨てるタグ
+DROP_CONTENT_TAGS = {'script', 'style', 'iframe', 'object', 'embed', 'noscript', 'template'}
+
+ALLOWED_ATTRIBUTES = {
+    '*': {'style', 'class'},
+    'a': {'href', 'title', 'target'},
+    'img': {'src', 'alt', 'title', 'width', 'height'},
+    'font': {'color', 'face', 'size'},
+    'td': {'colspan', 'rowspan'},
+    'th': {'colspan', 'rowspan'},
+}
+ALLOWED_STYLES = {
+    'background-color', 'color', 'float', 'font-family', 'font-size', 'font-style', 'font-weight',
+    'height', 'line-height', 'margin-left', 'text-align', 'text-decoration', 'width',
+}
+ALLOWED_SCHEMES = {'', 'http', 'https', 'mailto'}
+
+# コメントを挟んだ exp/**/ression( も弾く
+_UNSAFE_STYLE_RE = re.compile(r'url\s*\(|expression\s*\(|javascript:|/\*|[<>\\]', re.IGNORECASE)
+
+
+def _safe_url(value):
+    # 制御文字や空白を挟んだ javascript: も弾く
+    compact = re.sub(r'[\x00-\x20]', '', value)
+    try:
+        return urlparse(compact).scheme.lower() in ALLOWED_SCHEMES
+    except ValueError:
+        return False
+
+
+def _clean_style(value):
+    declarations = []
+    for declaration in value.split(';'):
+        name, _, css = declaration.partition(':')
+        name, css = name.strip().lower(), css.strip()
+        if name in ALLOWED_STYLES and css and not _UNSAFE_STYLE_RE.search(css):
+            declarations.append(f'{name}: {css}')
+    return '; '.join(declarations)
+
+
+class _Sanitizer(HTMLParser):
+    """ 許可したタグ・属性だけを残してHTMLを組み立て直す """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.out = []
+        self.open_tags = []
+        self.dropping = 0
+
+    def clean_attrs(self, tag, attrs):
+        allowed = ALLOWED_ATTRIBUTES['*'] | ALLOWED_ATTRIBUTES.get(tag, set())
+        cleaned = {}
+        for name, value in attrs:
+            name = name.lower()
+            value = value or ''
+            if name not in allowed:
+                continue
+            if name in ('href', 'src') and not _safe_url(value):
+                continue
+            if name == 'style':
+                value = _clean_style(value)
+                if not value:
+                    continue
+            cleaned[name] = value
+
+        # 後処理: 別タブのリンクはopenerを渡さない、画像は遅延読み込み
+        if tag == 'a' and cleaned.get('target') == '_blank':
+            cleaned['rel'] = 'noopener noreferrer'
+        elif tag == 'a':
+            cleaned.pop('target', None)
+        if tag == 'img':
+            if 'src' not in cleaned:
+                return None
+            cleaned['loading'] = 'lazy'
+        return cleaned
+
+    def emit_start(self, tag, attrs, closed=False):
+        attrs = self.clean_attrs(tag, attrs)
+        if attrs is None:
+            return
+        rendered = ''.join(f' {name}="{escape(value)}"' for name, value in attrs.items())
+        self.out.append(f'<{tag}{rendered}>')
+        if tag not in VOID_TAGS and not closed:
+            self.open_tags.append(tag)
+
+    def handle_starttag(self, tag, attrs):
+        if tag in DROP_CONTENT_TAGS:
+            self.dropping += 1
+        elif not self.dropping and tag in ALLOWED_TAGS:
+            self.emit_start(tag, attrs)
+
+    def handle_startendtag(self, tag, attrs):
+        if not self.dropping and tag in ALLOWED_TAGS:
+            self.emit_start(tag, attrs, closed=True)
+
+    def handle_endtag(self, tag):
+        if tag in DROP_CONTENT_TAGS:
+            self.dropping = max(0, self.dropping - 1)
+        elif not self.dropping and tag in self.open_tags:
+            # 閉じ忘れたタグも一緒に閉じる
+            while self.open_tags:
+                open_tag = self.open_tags.pop()
+                self.out.append(f'</{open_tag}>')
+                if open_tag == tag:
+                    break
+
+    def handle_data(self, data):
+        if not self.dropping:
+            self.out.append(escape(data, quote=False))
+
+    def close(self):
+        super().close()
+        while self.open_tags:
+            self.out.append(f'</{self.open_tags.pop()}>')
+        return ''.join(self.out)
+
+
+def sanitize(html):
+    """ summernoteのHTMLから危険なタグ・属性を取り除き、表示用に整える """
+    parser = _Sanitizer()
+    parser.feed(html or '')
+    return parser.close()
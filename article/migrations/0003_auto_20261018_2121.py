@@ -0,0 +1,34 @@
+# Generated by Django 3.1.6 on 2026-10-18 12:21
+
+from django.db import migrations, models
+
+from article.html import sanitize
+
+
+def fill_text_html(apps, schema_editor):
+    Article = apps.get_model('article', 'Article')
+    articles = list(Article.objects.only('pk', 'text'))
+    for article in articles:
+        article.text_html = sanitize(article.text)
+    Article.objects.bulk_update(articles, ['text_html'], batch_size=100)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('article', '0002_auto_20210218_0123'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='text_html',
+            field=models.TextField(default='', editable=False),
+        ),
+        migrations.AlterField(
+            model_name='article',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='更新日'),
+        ),
+        migrations.RunPython(fill_text_html, migrations.RunPython.noop),
+    ]
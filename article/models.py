@@ -1,15 +1,26 @@
 from django.db import models
 
+from .html import sanitize
+
 
 class Article(models.Model):
     title = models.CharField('タイトル', max_length=50)
     text = models.TextField('テキスト')
+    # 表示用に無害化したtext(保存時に作る)
+    text_html = models.TextField(editable=False, default='')
     created_at = models.DateField('作成日', auto_now_add=True)
-    updated_at = models.DateField('更新日', auto_now=True)
+    updated_at = models.DateTimeField('更新日', auto_now=True)
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        self.text_html = sanitize(self.text)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'text' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'text_html'}
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = 'article'
-        verbose_name_plural = '記事'
\ No newline at end of file
+        verbose_name_plural = '記事'
@@ -0,0 +1,12 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from project import pagecache
+
+from .models import Article
+
+
+@receiver([post_save, post_delete], sender=Article, dispatch_uid='article_invalidate_pages')
+def invalidate_pages(sender, **kwargs):
+    """ 記事一覧のキャッシュを無効にする(詳細ページは更新日時がキーなので自然に変わる) """
+    pagecache.invalidate('article')
@@ -1,3 +1,135 @@
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TransactionTestCase
 
-# Create your tests here.
+from project.testing import QueryBudgetTestCase
+
+from .html import sanitize
+from .models import Article
+
+User = get_user_model()
+
+
+class QueryCountTests(QueryBudgetTestCase):
+    query_budgets = {
+        'article:index': 4,
+        'article:detail': 5,
+        'article:add_form': 2,
+    }
+
+    def add_articles(self, count):
+        for _ in range(count):
+            Article.objects.create(title='記事', text='<p>本文</p>')
+
+    def test_index(self):
+        self.assertQueryBudget('article:index', grow=self.add_articles)
+
+    def test_detail(self):
+        article = Article.objects.create(title='記事', text='<p>本文</p>')
+        self.assertQueryBudget('article:detail', args=[article.pk])
+
+    def test_add_form(self):
+        # 記事を書けるのはスーパーユーザーだけ
+        User.objects.filter(pk=self.user.pk).update(is_superuser=True)
+        self.assertQueryBudget('article:add_form')
+
+
+class SanitizeTests(SimpleTestCase):
+
+    def assertSanitized(self, cases):
+        for html, expected in cases:
+            with self.subTest(html):
+                self.assertEqual(sanitize(html), expected)
+
+    def test_keeps_summernote_markup(self):
+        self.assertSanitized([
+            ('<p><b>太字</b>と<a href="https://example.com/" target="_blank">リンク</a></p>',
+             '<p><b>太字</b>と<a href="https://example.com/" target="_blank" rel="noopener noreferrer">リンク</a></p>'),
+            ('<img src="/media/a.png" alt="a">', '<img src="/media/a.png" alt="a" loading="lazy">'),
+            ('<p>1 < 2 & "3"</p>', '<p>1 &lt; 2 &amp; "3"</p>'),
+            ('<ul><li>閉じ忘れ', '<ul><li>閉じ忘れ</li></ul>'),
+        ])
+
+    def test_obfuscated_javascript_urls(self):
+        self.assertSanitized([
+            ('<a href="javascript:alert(1)">x</a>', '<a>x</a>'),
+            ('<a href="JaVaScRiPt:alert(1)">x</a>', '<a>x</a>'),
+            ('<a href=" javascript:alert(1)">x</a>', '<a>x</a>'),
+            ('<a href="java\nscript:alert(1)">x</a>', '<a>x</a>'),
+            ('<a href="jav&#x09;ascript:alert(1)">x</a>', '<a>x</a>'),
+            ('<a href="&#106;avascript:alert(1)">x</a>', '<a>x</a>'),
+            ('<a href="&#x6A;&#x61;vascript&#58;alert(1)">x</a>', '<a>x</a>'),
+            ('<a href="javascript&colon;alert(1)">x</a>', '<a>x</a>'),
+            ('<a href="vbscript:msgbox(1)">x</a>', '<a>x</a>'),
+            ('<img src="data:image/svg+xml;base64,PHN2Zz4=">', ''),
+        ])
+
+    def test_event_handler_attributes(self):
+        self.assertSanitized([
+            ('<img src="a.png" onerror="alert(1)">', '<img src="a.png" loading="lazy">'),
+            ('<p onclick="alert(1)" ONMOUSEOVER=alert(1)>t</p>', '<p>t</p>'),
+            ('<a href="/" onfocus=alert(1) autofocus>x</a>', '<a href="/">x</a>'),
+        ])
+
+    def test_unsafe_styles(self):
+        self.assertSanitized([
+            ('<p style="color: red; background-color: url(javascript:alert(1))">t</p>', '<p style="color: red">t</p>'),
+            ('<p style="width: expression(alert(1))">t</p>', '<p>t</p>'),
+            ('<p style="width: EXPRESSION (alert(1))">t</p>', '<p>t</p>'),
+            ('<p style="width: exp/**/ression(alert(1))">t</p>', '<p>t</p>'),
+            ('<p style="color: &#117;rl(x)">t</p>', '<p>t</p>'),
+            ('<p style="color: \\75rl(x)">t</p>', '<p>t</p>'),
+            ('<p style="background-image: none">t</p>', '<p>t</p>'),
+        ])
+
+    def test_scripts_inside_foreign_content(self):
+        self.assertSanitized([
+            ('<svg><script>alert(1)</script></svg>', ''),
+            ('<svg onload="alert(1)"><a href="javascript:alert(1)"><text>x</text></a></svg>', '<a>x</a>'),
+            ('<math><mi xlink:href="javascript:alert(1)">x</mi></math>', 'x'),
+            ('<math><style><img src=x onerror=alert(1)></style></math>', ''),
+        ])
+
+    def test_comment_tricks(self):
+        self.assertSanitized([
+            ('<!--<script>alert(1)</script>-->ok', 'ok'),
+            ('<!--><script>alert(1)</script>-->ok', 'ok'),
+            ('<!--[if IE]><script>alert(1)</script><![endif]-->ok', 'ok'),
+            ('<![CDATA[<script>alert(1)</script>]]>ok', 'ok'),
+            ('<p>a<!-- x --></p>', '<p>a</p>'),
+        ])
+
+    def test_dropped_content(self):
+        self.assertSanitized([
+            ('<script>alert(1)', ''),
+            ('<scr<script>ipt>alert(1)</script>', 'ipt&gt;alert(1)'),
+            ('<iframe src="https://example.com/"></iframe>ok', 'ok'),
+            ('<style>@import url(x)</style>ok', 'ok'),
+        ])
+
+
+class TextHtmlMigrationTests(TransactionTestCase):
+    """ 既存の記事のtext_htmlをマイグレーションで作る """
+    before = ('article', '0002_auto_20210218_0123')
+    after = ('article', '0003_auto_20261018_2121')
+
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate([target])
+        return executor.loader.project_state([target]).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes('article')[0])
+
+    def test_fills_text_html(self):
+        apps = self.migrate(self.before)
+        OldArticle = apps.get_model('article', 'Article')
+        text = '<p onclick="alert(1)">本文<script>alert(1)</script></p>'
+        pk = OldArticle.objects.create(title='記事', text=text).pk
+
+        self.migrate(self.after)
+        article = Article.objects.get(pk=pk)
+        self.assertEqual(article.text_html, '<p>本文</p>')
+        self.assertEqual(article.text, text)
@@ -1,29 +1,52 @@
+from django.conf import settings
+from django.db.models import Max
 from django.http import Http404
 from django.shortcuts import redirect
 from django.views import generic
 from django.urls import reverse_lazy
 
+from project.pagecache import ConditionalPageMixin
+from project.pagination import CursorPaginationMixin
+
 from .models import Article
 from .forms import ArticleForm
 
 
-class Index(generic.ListView):
+class Index(ConditionalPageMixin, CursorPaginationMixin, generic.ListView):
     """ 記事一覧の表示 """
     template_name = 'article/index.html'
     model = Article
     context_object_name = 'article'
+    cursor_ordering = ('-id',)
+    page_namespaces = ('article',)
 
-    def get_context_data(self, **kwargs):
-        ctx = super().get_context_data()
-        ctx['article'] = Article.objects.order_by('-id')
-        return ctx
+    def get_last_modified(self):
+        return Article.objects.aggregate(last_modified=Max('updated_at'))['last_modified']
+
+    def get_queryset(self):
+        """ 一覧には本文を読み込まない """
+        return Article.objects.only('id', 'title', 'created_at')
 
 
-class Detail(generic.DetailView):
+class Detail(ConditionalPageMixin, generic.DetailView):
     """ 投稿内容の表示 """
     template_name = 'article/detail.html'
     model = Article
     context_object_name = 'objects'
+    # 本文の表示部分をキャッシュする秒数(キーに更新日時を含むので、更新されれば作り直される)
+    cache_timeout = getattr(settings, 'ARTICLE_CACHE_TIMEOUT', 60 * 60 * 24)
+
+    def get_last_modified(self):
+        return Article.objects.filter(pk=self.kwargs['pk']).values_list('updated_at', flat=True).first()
+
+    def get_queryset(self):
+        """ 本文はキャッシュがない時だけ読み込む """
+        return Article.objects.defer('text', 'text_html')
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        ctx['cache_timeout'] = self.cache_timeout
+        return ctx
 
 
 class Add_form(generic.CreateView):
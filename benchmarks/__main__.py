@@ -0,0 +1,135 @@
+""" よく使われるページのベンチマーク
+
+    python -m benchmarks --scales 1000,10000 --requests 50
+
+seed_datasetで作ったデータの規模ごとに、各ページのレイテンシ(p50/p95/p99)・スループット・
+クエリ数を測ってJSONに書き出し、ベースラインよりクエリ数が増えていれば終了コード1で終わる。
+レイテンシも比べる時は、計測するマシンで --save-baseline を付けてベースラインを作り直してから
+--compare-latency を付けること(p99は --requests 100 以上の時だけ比べる)
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import time
+
+import django
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description=__doc__.splitlines()[0])
+    parser.add_argument('--scales', default='1000,5000',
+                        help='Comma separated user counts; the database is grown to each in turn.')
+    parser.add_argument('--requests', type=int, default=30, help='Measured requests per view and scale.')
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--only', default=None, help='Comma separated scenario names to run.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help='Where to write the results (default: BENCHMARK_DIR).')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='Store these results as the new baseline.')
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help='Allowed latency slowdown as a fraction of the baseline.')
+    parser.add_argument('--compare-latency', action='store_true',
+                        help='Also fail on latency regressions; only meaningful with a baseline saved on this machine.')
+    parser.add_argument('--reuse', action='store_true', help='Keep the database from the previous run.')
+    parser.add_argument('--verbose', action='store_true', help='Show seed_dataset progress.')
+    return parser.parse_args(argv)
+
+
+def prepare(settings, reuse):
+    """ ベンチマーク用のDBとキャッシュを作り直す """
+    from django.core.management import call_command
+
+    if not reuse:
+        shutil.rmtree(settings.BENCHMARK_DIR, ignore_errors=True)
+    os.makedirs(settings.BENCHMARK_DIR, exist_ok=True)
+    call_command('migrate', verbosity=0)
+
+
+def grow(scale, seed, verbose):
+    """ ユーザー数がscaleになるまでデータを足す """
+    from django.contrib.auth import get_user_model
+    from django.core.management import call_command
+
+    missing = scale - get_user_model().objects.count()
+    if missing > 0:
+        started = time.perf_counter()
+        call_command('seed_dataset', users=missing, seed=seed + scale,
+                     stdout=sys.stdout if verbose else io.StringIO())
+        print(f'seeded {missing} users in {time.perf_counter() - started:.1f}s')
+
+
+def report(name, result):
+    print(f'  {name:<20} p50 {result["p50_ms"]:>7.1f}ms  p95 {result["p95_ms"]:>7.1f}ms  '
+          f'p99 {result["p99_ms"]:>7.1f}ms  {result["throughput_rps"]:>7.1f} req/s  '
+          f'{result["queries"]:>3} queries')
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+    django.setup()
+    from django.conf import settings
+
+    from benchmarks import runner
+    from benchmarks.scenarios import SCENARIOS, Subjects
+
+    scenarios = SCENARIOS
+    if args.only:
+        names = args.only.split(',')
+        unknown = set(names) - {scenario.name for scenario in SCENARIOS}
+        if unknown:
+            sys.exit(f'unknown scenarios: {", ".join(sorted(unknown))}')
+        scenarios = [scenario for scenario in SCENARIOS if scenario.name in names]
+
+    prepare(settings, args.reuse)
+    rng = random.Random(args.seed)
+    results = {}
+    for scale in sorted(int(scale) for scale in args.scales.split(',')):
+        grow(scale, args.seed, args.verbose)
+        print(f'{scale} users')
+        results[str(scale)] = runner.run(scenarios, Subjects(), rng, args.requests, args.warmup)
+        for name, result in results[str(scale)].items():
+            report(name, result)
+
+    output = args.output or os.path.join(settings.BENCHMARK_DIR, 'results.json')
+    document = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'requests': args.requests,
+        'scales': results,
+    }
+    with open(output, 'w') as f:
+        json.dump(document, f, indent=2)
+    print(f'wrote {output}')
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(document, f, indent=2)
+        print(f'saved baseline to {args.baseline}')
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f'no baseline at {args.baseline}; run with --save-baseline to create one')
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)['scales']
+    regressions = runner.compare(results, baseline, args.tolerance, args.compare_latency)
+    if regressions:
+        print(f'\nPERFORMANCE REGRESSION ({len(regressions)}):', file=sys.stderr)
+        for regression in regressions:
+            print(f'  {regression}', file=sys.stderr)
+        return 1
+    print('no regressions against the baseline' + ('' if args.compare_latency else ' (queries only)'))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,92 @@
+import statistics
+import time
+from contextlib import ExitStack
+
+from django.db import connections
+from django.test import Client
+
+from project.instrumentation import QueryRecorder
+
+# ベースラインと比べる指標(大きいほど悪い)
+LATENCY_METRICS = ('p50_ms', 'p95_ms', 'p99_ms')
+# これより小さい差はノイズとして無視する
+MIN_LATENCY_DELTA_MS = 2.0
+# p99はこれより少ない回数だとほぼ最大値になるので比べない
+MIN_P99_SAMPLES = 100
+
+
+def percentile(values, p):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def measure(client, scenario, subjects, rng, requests, warmup):
+    """ scenarioをwarmup + requests回実行し、後ろのrequests回の集計を返す """
+    latencies = []
+    queries = []
+    elapsed = 0.0
+    for i in range(warmup + requests):
+        method, path, data = scenario.request(subjects, rng)
+        recorder = QueryRecorder()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            started = time.perf_counter()
+            response = getattr(client, method)(path, data)
+            seconds = time.perf_counter() - started
+        if response.status_code not in scenario.expected:
+            raise AssertionError(f'{scenario.name}: {method.upper()} {path} returned {response.status_code}')
+        if i < warmup:
+            continue
+        elapsed += seconds
+        latencies.append(seconds * 1000)
+        queries.append(recorder.count)
+    return {
+        'requests': requests,
+        'mean_ms': statistics.mean(latencies),
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'p99_ms': percentile(latencies, 99),
+        'throughput_rps': requests / elapsed if elapsed else 0,
+        'queries': max(queries),
+        'queries_min': min(queries),
+    }
+
+
+def run(scenarios, subjects, rng, requests, warmup):
+    """ {scenario名: 集計} 読み込みを先に計測する """
+    client = Client()
+    client.force_login(subjects.viewer)
+    results = {}
+    for scenario in sorted(scenarios, key=lambda scenario: scenario.write):
+        results[scenario.name] = measure(client, scenario, subjects, rng, requests, warmup)
+    return results
+
+
+def compare(results, baseline, tolerance, latency=False):
+    """ ベースラインより悪くなったものの説明のリスト
+
+    クエリ数は1つでも増えたら回帰とする。レイテンシはマシンによって違うので、
+    latencyがTrueの時だけtoleranceの割合を超えて遅くなったものを回帰とする
+    """
+    regressions = []
+    for scale, scenarios in results.items():
+        for name, current in scenarios.items():
+            previous = baseline.get(scale, {}).get(name)
+            if previous is None:
+                continue
+            if current['queries'] > previous['queries']:
+                regressions.append(f'{name} @ {scale} users: {current["queries"]} queries '
+                                   f'(baseline {previous["queries"]})')
+            if not latency:
+                continue
+            for metric in LATENCY_METRICS:
+                if metric == 'p99_ms' and min(current['requests'], previous['requests']) < MIN_P99_SAMPLES:
+                    continue
+                limit = previous[metric] * (1 + tolerance)
+                if current[metric] > limit and current[metric] - previous[metric] > MIN_LATENCY_DELTA_MS:
+                    regressions.append(f'{name} @ {scale} users: {metric} {current[metric]:.1f} '
+                                       f'(baseline {previous[metric]:.1f}, limit {limit:.1f})')
+    return regressions
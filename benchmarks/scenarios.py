@@ -0,0 +1,62 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Max, Min
+from django.urls import reverse
+
+from relationship.models import Post
+from seekforadvice.models import Seek
+
+User = get_user_model()
+
+
+class Subjects:
+    """ 計測に使うユーザー・投稿・相談(データが一番多いものを選ぶ) """
+
+    def __init__(self):
+        # フォロワーが一番多いユーザーで見る(フォロワー一覧が一番重い)
+        self.viewer = User.objects.filter(is_active=True).order_by('-followers_count', 'pk').first()
+        self.post = Post.objects.order_by('-comment_count', 'pk').first()
+        self.seek = Seek.objects.order_by('-advice_count', 'pk').first()
+        bounds = User.objects.aggregate(low=Min('pk'), high=Max('pk'))
+        self.user_pks = range(bounds['low'], bounds['high'] + 1)
+
+    def random_account_name(self, rng):
+        """ viewer以外のユーザーのaccount_nameを1つ選ぶ """
+        while True:
+            pk = rng.choice(self.user_pks)
+            if pk == self.viewer.pk:
+                continue
+            account_name = User.objects.filter(pk=pk).values_list('account_name', flat=True).first()
+            if account_name is not None:
+                return account_name
+
+
+class Scenario:
+    """ 1つのエンドポイントへのリクエストの作り方
+
+    requestは(subjects, rng)から(method, path, data)を返す。作る時のクエリは計測に含めない
+    """
+
+    def __init__(self, name, request, expected=(200,), write=False):
+        self.name = name
+        self.request = request
+        self.expected = expected
+        self.write = write
+
+
+SCENARIOS = [
+    Scenario('PostList', lambda s, rng: ('get', reverse('relationship:home'), None)),
+    Scenario('PostDetail', lambda s, rng: ('get', reverse('relationship:post_detail', args=[s.post.pk]), None)),
+    Scenario('FollowerList', lambda s, rng: ('get', reverse('relationship:follower'), None)),
+    Scenario('UserDetail', lambda s, rng: ('get', reverse('register:user_detail', args=[s.viewer.pk]), None)),
+    Scenario('TopPage', lambda s, rng: ('get', reverse('index:top'), None)),
+    Scenario('SoA_details', lambda s, rng: ('get', reverse('seekforadvice:detail', args=[s.seek.pk]), None)),
+    Scenario('article.Index', lambda s, rng: ('get', reverse('article:index'), None)),
+    # 書き込みは読み込みの計測が終わってから行う
+    Scenario('PostDetail.follow', lambda s, rng: (
+        'post', reverse('relationship:post_detail', args=[s.post.pk]), {'follow': s.random_account_name(rng)},
+    ), expected=(200, 302), write=True),
+    Scenario('PostDetail.comment', lambda s, rng: (
+        'post', reverse('relationship:post_detail', args=[s.post.pk]),
+        {'confirm': '', 'content': f'ベンチマークのコメント{rng.randrange(10 ** 6)}'},
+    ), expected=(302,), write=True),
+]
@@ -0,0 +1,30 @@
+""" ベンチマーク用の設定(開発用のDB・キャッシュとは別の場所を使う) """
+import os
+import tempfile
+
+from project.settings import *  # noqa: F401,F403
+from project.settings import CACHES, INSTALLED_APPS, MIDDLEWARE
+
+# データとキャッシュの置き場所
+BENCHMARK_DIR = os.environ.get('BENCHMARK_DIR', os.path.join(tempfile.gettempdir(), 'watoson-benchmarks'))
+
+DEBUG = False
+ALLOWED_HOSTS = ['testserver', 'localhost', '127.0.0.1']
+
+# debug_toolbarは計測の邪魔になるので外す
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app != 'debug_toolbar']
+MIDDLEWARE = [middleware for middleware in MIDDLEWARE if not middleware.startswith('debug_toolbar')]
+# クエリはベンチマークの側で数える
+INSTRUMENTATION_ENABLED = False
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BENCHMARK_DIR, 'db.sqlite3'),
+    }
+}
+
+CACHES = dict(CACHES, pages={
+    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+    'LOCATION': os.path.join(BENCHMARK_DIR, 'pages'),
+})
@@ -0,0 +1,271 @@
+import bisect
+import itertools
+import math
+import random
+import time
+from array import array
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.core.management.color import no_style
+from django.db import connections, router, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from article.html import sanitize
+from article.models import Article
+from project import pagecache
+from register.models import UploadImage
+from relationship.models import Comment, Follow, Intimate, IntimateEdge, Post
+from seekforadvice.models import Advice, Seek
+
+User = get_user_model()
+
+PHRASES = (
+    '今日は', '仕事で', '転職について', '週末は', '久しぶりに', '友達と', '家族で', '朝から', '夜遅くまで',
+    '勉強した', 'カフェに行った', 'ラーメンを食べた', '映画を観た', '本を読んだ', '走った', '料理をした',
+    '悩んでいます', '相談させてください', 'どう思いますか', 'おすすめはありますか', '楽しかった', '疲れた',
+    'Pythonで', 'Djangoの', 'SQLiteが', '面接が', '上司に', '資格の', '英語を', '旅行の計画を立てた',
+)
+
+
+def sentence(rng, low, high):
+    return ''.join(rng.choice(PHRASES) for _ in range(rng.randint(low, high))) + '。'
+
+
+def heavy_tailed(rng, mean, sigma=1.0, limit=None):
+    """ 平均がmeanの対数正規分布の整数(少数のユーザーが大部分を占める) """
+    if mean <= 0:
+        return 0
+    value = int(rng.lognormvariate(math.log(mean) - sigma ** 2 / 2, sigma))
+    return min(value, limit) if limit is not None else value
+
+
+def parents(start, dates):
+    """ create_posts・create_seeksが返した(最初のpk, 投稿日時のタイムスタンプ)から(pk, 投稿日時)を順に返す
+
+    件数が多くなるので、日時はdatetimeではなくfloatの配列で持っている
+    """
+    for pk, timestamp in enumerate(dates, start):
+        yield pk, datetime.fromtimestamp(timestamp, timezone.utc)
+
+
+@contextmanager
+def explicit_dates(model):
+    """ withの中ではmodelのauto_now・auto_now_addを切り、渡した日時のままbulk_createできるようにする """
+    fields = [field for field in model._meta.concrete_fields
+              if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    """ 負荷試験用のユーザー・フォロー・投稿などをまとめて作る
+
+    乱数のシードを指定すれば同じデータになる。bulk_createで入れるので、画像のリサイズ・
+    カウンターの加算・検索の索引付けなどは行わず、最後に再計算コマンドでまとめて作る
+    """
+    help = 'Generate a reproducible synthetic dataset (users, follows, posts, comments, ...) for load testing.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--follows-per-user', type=float, default=50,
+                            help='Mean out-degree; followers follow a power law.')
+        parser.add_argument('--follow-exponent', type=float, default=1.0,
+                            help='Zipf exponent for how often the n-th most popular user is followed.')
+        parser.add_argument('--posts-per-user', type=float, default=5)
+        parser.add_argument('--comments-per-post', type=float, default=2)
+        parser.add_argument('--intimates-per-user', type=float, default=1)
+        parser.add_argument('--seeks-per-user', type=float, default=0.5)
+        parser.add_argument('--advices-per-seek', type=float, default=3)
+        parser.add_argument('--articles', type=int, default=100)
+        parser.add_argument('--days', type=int, default=365, help='Spread dates over this many past days.')
+        parser.add_argument('--password', default='password')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--skip-derived', action='store_true',
+                            help='Do not rebuild counters, timelines and the search index afterwards.')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        self.span = options['days'] * 24 * 60 * 60
+        started = time.perf_counter()
+
+        users = self.create_users(options['users'], options['password'])
+        self.create_follows(users, options['follows_per_user'], options['follow_exponent'])
+        posts = self.create_posts(users, options['posts_per_user'])
+        self.create_comments(users, posts, options['comments_per_post'])
+        self.create_intimates(users, options['intimates_per_user'])
+        seeks = self.create_seeks(users, options['seeks_per_user'])
+        self.create_advices(users, seeks, options['advices_per_seek'])
+        self.create_articles(options['articles'])
+
+        if not options['skip_derived']:
+            self.stdout.write('rebuilding derived data')
+            call_command('rebuild_follow_counts', stdout=self.stdout)
+            call_command('rebuild_comment_counts', stdout=self.stdout)
+            call_command('rebuild_advice_counts', stdout=self.stdout)
+            call_command('rebuild_timeline', stdout=self.stdout)
+            call_command('rebuild_search_index', stdout=self.stdout)
+        for namespace in ('article', 'seek', 'advice'):
+            pagecache.invalidate(namespace)
+        self.stdout.write(self.style.SUCCESS(f'seeded in {time.perf_counter() - started:.1f}s'))
+
+    def random_date(self, after=None):
+        if after is None:
+            return self.now - timedelta(seconds=self.rng.randrange(self.span))
+        return after + timedelta(seconds=self.rng.randrange(max(1, int((self.now - after).total_seconds()))))
+
+    def next_pk(self, model):
+        return (model.objects.aggregate(pk=Max('pk'))['pk'] or 0) + 1
+
+    def insert(self, model, rows, total=None):
+        """ rowsをbatch_sizeずつトランザクションに分けてbulk_createする """
+        label = model._meta.verbose_name_plural
+        using = router.db_for_write(model)
+        started = time.perf_counter()
+        count = 0
+        rows = iter(rows)
+        while True:
+            batch = list(itertools.islice(rows, self.batch_size))
+            if not batch:
+                break
+            with transaction.atomic(using=using):
+                model.objects.using(using).bulk_create(batch, batch_size=self.batch_size, ignore_conflicts=True)
+            count += len(batch)
+            rate = count / (time.perf_counter() - started)
+            progress = f'{count}/{total}' if total else str(count)
+            self.stdout.write(f'{label}: {progress} ({rate:.0f}/s)')
+        # pkを指定して入れたので、PostgreSQLなどではシーケンスを進めておく
+        connection = connections[using]
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [model]):
+                cursor.execute(sql)
+        return count
+
+    def create_users(self, count, password):
+        start = self.next_pk(User)
+        # ハッシュ化は遅いので全員同じパスワードにする
+        password = make_password(password)
+
+        def rows():
+            for pk in range(start, start + count):
+                yield User(pk=pk, email=f'seed{pk}@example.com', account_name=f'seed{pk}', password=password,
+                           date_joined=self.random_date(), is_active=True)
+        self.insert(User, rows(), count)
+        # 本登録の時と同じく画像アップロード用のインスタンスも作る(画像はデフォルトのまま)
+        self.insert(UploadImage, (UploadImage(user_id=pk) for pk in range(start, start + count)), count)
+        return range(start, start + count)
+
+    def create_follows(self, users, mean, exponent):
+        """ 人気の順位nのユーザーが 1/n^exponent に比例してフォローされる """
+        # 人気の順位はユーザーidと無関係にしておく
+        ranking = list(users)
+        self.rng.shuffle(ranking)
+        cumulative = list(itertools.accumulate(1 / (rank + 1) ** exponent for rank in range(len(ranking))))
+        limit = len(ranking) - 1
+
+        def rows():
+            for user in users:
+                targets = set()
+                for _ in range(heavy_tailed(self.rng, mean, limit=limit)):
+                    target = ranking[bisect.bisect(cumulative, self.rng.random() * cumulative[-1])]
+                    if target != user:
+                        targets.add(target)
+                for target in sorted(targets):
+                    yield Follow(user_id=user, follow_user_id=target, date=self.random_date())
+        with explicit_dates(Follow):
+            self.insert(Follow, rows(), int(len(users) * mean))
+
+    def create_posts(self, users, mean):
+        start = self.next_pk(Post)
+        dates = array('d')
+
+        def rows():
+            pk = start
+            for user in users:
+                for _ in range(heavy_tailed(self.rng, mean)):
+                    date = self.random_date()
+                    dates.append(date.timestamp())
+                    yield Post(pk=pk, author_id=user, content=sentence(self.rng, 2, 8), date_posted=date)
+                    pk += 1
+        self.insert(Post, rows(), int(len(users) * mean))
+        return start, dates
+
+    def create_comments(self, users, posts, mean):
+        def rows():
+            for post, posted in parents(*posts):
+                for _ in range(heavy_tailed(self.rng, mean, sigma=1.5)):
+                    yield Comment(post_connected_id=post, author_id=self.rng.choice(users),
+                                  content=sentence(self.rng, 1, 4)[:150], date_posted=self.random_date(after=posted))
+        self.insert(Comment, rows(), int(len(posts[1]) * mean))
+
+    def create_intimates(self, users, mean):
+        pairs = set()
+        Status = Intimate.Status
+        statuses = [Status.APPROVED] * 6 + [Status.PENDING] * 2 + [Status.REJECTED, Status.CANCELLED]
+        approved = []
+
+        def rows():
+            for _ in range(int(len(users) * mean / 2)):
+                sender, receiver = self.rng.sample(users, 2)
+                pair = (min(sender, receiver), max(sender, receiver))
+                if pair in pairs:
+                    continue
+                pairs.add(pair)
+                status = self.rng.choice(statuses)
+                date = self.random_date() if status == Status.APPROVED else None
+                if date:
+                    approved.append((sender, receiver, date))
+                yield Intimate(sender_id=sender, receiver_id=receiver, status=status,
+                               user_low=pair[0], user_high=pair[1], date=date)
+        self.insert(Intimate, rows())
+        self.insert(IntimateEdge, (
+            IntimateEdge(user_id=user, friend_id=friend, date=date)
+            for sender, receiver, date in approved
+            for user, friend in ((sender, receiver), (receiver, sender))
+        ), len(approved) * 2)
+
+    def create_seeks(self, users, mean):
+        start = self.next_pk(Seek)
+        count = int(len(users) * mean)
+        dates = array('d')
+
+        def rows():
+            for pk in range(start, start + count):
+                date = self.random_date()
+                dates.append(date.timestamp())
+                yield Seek(pk=pk, author_id=self.rng.choice(users), content=sentence(self.rng, 3, 12),
+                           date_posted=date)
+        self.insert(Seek, rows(), count)
+        return start, dates
+
+    def create_advices(self, users, seeks, mean):
+        def rows():
+            for seek, posted in parents(*seeks):
+                for _ in range(heavy_tailed(self.rng, mean, sigma=1.5)):
+                    yield Advice(post_connected_id=seek, author_id=self.rng.choice(users),
+                                 content=sentence(self.rng, 2, 8), date_posted=self.random_date(after=posted))
+        self.insert(Advice, rows(), int(len(seeks[1]) * mean))
+
+    def create_articles(self, count):
+        def rows():
+            for _ in range(count):
+                text = ''.join(f'<p>{sentence(self.rng, 5, 15)}</p>' for _ in range(self.rng.randint(3, 20)))
+                created = self.random_date()
+                yield Article(title=sentence(self.rng, 1, 3)[:50], text=text, text_html=sanitize(text),
+                              created_at=created.date(), updated_at=self.random_date(after=created))
+        with explicit_dates(Article):
+            self.insert(Article, rows(), count)
@@ -1,3 +1,18 @@
-from django.test import TestCase
+from project.testing import QueryBudgetTestCase, create_user
+from relationship import intimates
 
-# Create your tests here.
+
+class QueryCountTests(QueryBudgetTestCase):
+    query_budgets = {
+        'index:top': 3,
+    }
+
+    def test_top(self):
+        users = iter(create_user(f'friend{i}') for i in range(100))
+
+        def grow(count):
+            for _ in range(count):
+                friend = next(users)
+                intimates.send_request(friend, self.user)
+                intimates.approve(self.user, friend)
+        self.assertQueryBudget('index:top', grow=grow)
@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class ProjectConfig(AppConfig):
+    name = 'project'
+
+    def ready(self):
+        from . import replicas
+        replicas.connect()
@@ -0,0 +1,78 @@
+from functools import reduce
+from operator import or_
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_subquery(model, field):
+    """ modelの行をfield(数える側を指す外部キー)ごとに数える相関サブクエリ(なければ0) """
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')})
+        .order_by().values(field).annotate(c=Count('*')).values('c')
+    ), 0)
+
+
+class Recount:
+    """ 非正規化したカウンターを実際の件数と照合・再計算する
+
+    Recount(Post, comment_count=(Comment, 'post_connected')) のように、
+    カウンターのフィールドごとに(数えるモデル, 外部キー)を渡す。
+    マイグレーションからは履歴モデルを渡して使う
+    """
+
+    def __init__(self, model, **counters):
+        self.model = model
+        self.counters = counters
+
+    def _subqueries(self):
+        return {field: count_subquery(*counted) for field, counted in self.counters.items()}
+
+    def mismatched(self):
+        """ カウンターが実際の件数と違う行(real_<フィールド名>に実際の件数) """
+        queryset = self.model.objects.annotate(**{f'real_{field}': subquery
+                                                  for field, subquery in self._subqueries().items()})
+        return queryset.filter(reduce(or_, (~Q(**{field: F(f'real_{field}')}) for field in self.counters)))
+
+    def rebuild(self):
+        """ 違っている行だけ数え直す。更新した行数を返す """
+        with transaction.atomic():
+            return self.model.objects.filter(pk__in=self.mismatched().values('pk')).update(**self._subqueries())
+
+    def fill(self):
+        """ 全行を数え直す(カウンターを追加したマイグレーション用) """
+        return self.model.objects.update(**self._subqueries())
+
+
+class RecountCommand(BaseCommand):
+    """ recountのカウンターを照合・再計算する管理コマンド(--checkなら照合だけ) """
+    recount = None
+
+    @property
+    def help(self):
+        return (f'Check the denormalized {", ".join(self.recount.counters)} counters of '
+                f'{self.recount.model.__name__} and rebuild them.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Only report mismatched rows; exit with an error if any are found.')
+
+    def handle(self, *args, **options):
+        fields = list(self.recount.counters)
+        name = self.recount.model._meta.model_name
+        if options['check']:
+            values = [value for field in fields for value in (field, f'real_{field}')]
+            rows = list(self.recount.mismatched().values_list('pk', *values))
+            for pk, *counts in rows:
+                self.stdout.write(f'{name} {pk}: ' + ', '.join(
+                    f'{field} {count} != {real_count}'
+                    for field, count, real_count in zip(fields, counts[::2], counts[1::2]) if count != real_count))
+            if rows:
+                raise CommandError(f'{len(rows)} {name} rows have stale counters')
+            self.stdout.write(self.style.SUCCESS(f'{name} counters are consistent'))
+            return
+
+        updated = self.recount.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'rebuilt {", ".join(fields)} for {updated} {name} rows'))
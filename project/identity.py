@@ -0,0 +1,145 @@
+import logging
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Model
+from django.http import Http404
+
+logger = logging.getLogger(__name__)
+
+# モデルごとに、メモリから引けるユニークなキー
+IDENTITY_KEYS = {
+    'register.user': ('pk', 'email', 'account_name'),
+    'register.uploadimage': ('pk', 'user'),
+    'relationship.post': ('pk',),
+}
+
+
+def _field_name(model, name):
+    if name == 'pk':
+        return model._meta.pk.attname
+    return model._meta.get_field(name).attname
+
+
+class IdentityMap:
+    """ 1リクエスト内で一度取得したインスタンスを使い回す """
+
+    def __init__(self, request=None):
+        self.request = request
+        self._objects = {}
+        self._seeded = False
+
+    def _seed(self):
+        """ AuthenticationMiddlewareが読み込んだrequest.userを登録しておく """
+        if self._seeded or self.request is None:
+            return
+        self._seeded = True
+        user = getattr(self.request, 'user', None)
+        if user is not None and user.is_authenticated:
+            self.add(user)
+
+    def add(self, obj):
+        keys = IDENTITY_KEYS.get(obj._meta.label_lower, ('pk',))
+        for name in keys:
+            attname = _field_name(obj._meta.model, name)
+            value = getattr(obj, attname)
+            if value is not None:
+                self._objects[(obj._meta.label_lower, attname, value)] = obj
+        return obj
+
+    def get(self, model, **lookup):
+        """ model._default_manager.get(**lookup)と同じだが、取得済みならクエリを発行しない """
+        if len(lookup) != 1:
+            raise TypeError('IdentityMap.get() takes exactly one lookup')
+        self._seed()
+        (name, value), = lookup.items()
+        if isinstance(value, Model):
+            value = value.pk
+        label = model._meta.label_lower
+        if name in IDENTITY_KEYS.get(label, ('pk',)):
+            key = (label, _field_name(model, name), value)
+            if key in self._objects:
+                return self._objects[key]
+        return self.add(model._default_manager.get(**{name: value}))
+
+    def get_or_404(self, model, **lookup):
+        try:
+            return self.get(model, **lookup)
+        except model.DoesNotExist:
+            raise Http404(f'No {model._meta.object_name} matches the given query.')
+
+    def forget(self, obj):
+        """ 保存し直したインスタンスなどを取り除く """
+        self._objects = {key: value for key, value in self._objects.items() if value is not obj}
+
+
+def get_identity_map(request):
+    """ requestのIdentityMapを返す(ミドルウェアを通っていなければ作る) """
+    identity_map = getattr(request, 'identity_map', None)
+    if identity_map is None:
+        identity_map = IdentityMap(request)
+        request.identity_map = identity_map
+    return identity_map
+
+
+class IdentityMapObjectMixin:
+    """ DetailViewのget_objectをIdentityMap経由にする(request.userのページなら再取得しない) """
+
+    def get_object(self, queryset=None):
+        if queryset is None and self.pk_url_kwarg in self.kwargs:
+            return get_identity_map(self.request).get_or_404(self.model, pk=self.kwargs[self.pk_url_kwarg])
+        return super().get_object(queryset)
+
+
+class DuplicateQueryCounter:
+    """ 同じSQL・パラメータのクエリが何回発行されたか数える """
+
+    def __init__(self):
+        self.counts = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        try:
+            key = (sql, tuple(params) if params is not None and not many else None)
+            hash(key)
+        except TypeError:
+            key = (sql, repr(params))
+        self.counts[key] += 1
+        return execute(sql, params, many, context)
+
+    def duplicates(self):
+        return {key: count for key, count in self.counts.items() if count > 1}
+
+
+class IdentityMapMiddleware:
+    """ request.identity_mapを用意する
+
+    IDENTITY_MAP_CHECK_DUPLICATES(既定はDEBUG)なら、同一クエリの重複をログに出し、
+    IDENTITY_MAP_STRICTならAssertionErrorにする
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.check_duplicates = getattr(settings, 'IDENTITY_MAP_CHECK_DUPLICATES', settings.DEBUG)
+        self.strict = getattr(settings, 'IDENTITY_MAP_STRICT', False)
+
+    def __call__(self, request):
+        request.identity_map = IdentityMap(request)
+        if not self.check_duplicates:
+            return self.get_response(request)
+
+        counter = DuplicateQueryCounter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+            response = self.get_response(request)
+
+        duplicates = counter.duplicates()
+        if duplicates:
+            message = f'{request.path}: {len(duplicates)} queries were repeated: ' + '; '.join(
+                f'{count}x {sql}' for (sql, _), count in duplicates.items())
+            if self.strict:
+                raise AssertionError(message)
+            logger.warning(message)
+        return response
@@ -0,0 +1,304 @@
+import atexit
+import glob
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import Counter, deque
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from .identity import DuplicateQueryCounter
+
+logger = logging.getLogger(__name__)
+
+INSTRUMENTATION_ENABLED = getattr(settings, 'INSTRUMENTATION_ENABLED', True)
+# 計測するリクエストの割合(0.0〜1.0)
+INSTRUMENTATION_SAMPLE_RATE = getattr(settings, 'INSTRUMENTATION_SAMPLE_RATE', 1.0)
+# ビューごとのクエリ数の上限 {'relationship:home': 10, ...}
+INSTRUMENTATION_QUERY_BUDGETS = getattr(settings, 'INSTRUMENTATION_QUERY_BUDGETS', {})
+# 上限を指定していないビューの上限(Noneなら警告しない)
+INSTRUMENTATION_DEFAULT_QUERY_BUDGET = getattr(settings, 'INSTRUMENTATION_DEFAULT_QUERY_BUDGET', 20)
+# 同じSQLがこの回数以上発行されたらN+1とみなす
+INSTRUMENTATION_DUPLICATE_THRESHOLD = getattr(settings, 'INSTRUMENTATION_DUPLICATE_THRESHOLD', 5)
+# 集計を書き出すディレクトリと間隔(秒)
+INSTRUMENTATION_DIR = getattr(settings, 'INSTRUMENTATION_DIR',
+                              os.path.join(tempfile.gettempdir(), 'watoson', 'instrumentation'))
+INSTRUMENTATION_FLUSH_INTERVAL = getattr(settings, 'INSTRUMENTATION_FLUSH_INTERVAL', 30)
+# プロセスごとのファイルがこの大きさ(バイト)を超えたら1行にまとめ直す
+INSTRUMENTATION_MAX_FILE_BYTES = getattr(settings, 'INSTRUMENTATION_MAX_FILE_BYTES', 1024 * 1024)
+# パーセンタイル用に残す直近のサンプル数
+INSTRUMENTATION_SAMPLES = 500
+
+METRICS = ('wall_ms', 'queries', 'db_ms', 'template_ms', 'bytes')
+SAMPLED_METRICS = ('wall_ms', 'queries')
+# dump_instrumentation --resetした時刻を書いておくファイル
+RESET_MARKER = 'reset_at'
+
+
+class QueryRecorder(DuplicateQueryCounter):
+    """ DuplicateQueryCounterに、1リクエストのクエリ数とDB時間の記録を加えたもの """
+
+    def __init__(self):
+        super().__init__()
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return super().__call__(execute, sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+
+    def repeated(self, threshold):
+        """ パラメータだけ違うものも含め、threshold回以上発行されたSQL(N+1の候補) """
+        statements = Counter()
+        for (sql, _), count in self.counts.items():
+            statements[sql] += count
+        return {sql: count for sql, count in statements.items() if count >= threshold}
+
+
+class ViewStats:
+    """ 1つのURL名の集計 """
+
+    def __init__(self):
+        self.requests = 0
+        self.totals = dict.fromkeys(METRICS, 0.0)
+        self.maxima = dict.fromkeys(METRICS, 0.0)
+        self.samples = {metric: deque(maxlen=INSTRUMENTATION_SAMPLES) for metric in SAMPLED_METRICS}
+        self.over_budget = 0
+        self.n_plus_one = 0
+        self.last_n_plus_one = None
+
+    def add(self, values, over_budget, repeated):
+        self.requests += 1
+        for metric in METRICS:
+            self.totals[metric] += values[metric]
+            self.maxima[metric] = max(self.maxima[metric], values[metric])
+        for metric, samples in self.samples.items():
+            samples.append(values[metric])
+        self.over_budget += over_budget
+        if repeated:
+            self.n_plus_one += 1
+            sql, count = max(repeated.items(), key=lambda item: item[1])
+            self.last_n_plus_one = f'{count}x {sql}'
+
+    def as_dict(self):
+        return {
+            'requests': self.requests,
+            'totals': self.totals,
+            'maxima': self.maxima,
+            'samples': {metric: list(samples) for metric, samples in self.samples.items()},
+            'over_budget': self.over_budget,
+            'n_plus_one': self.n_plus_one,
+            'last_n_plus_one': self.last_n_plus_one,
+        }
+
+
+def reset_at():
+    """ 最後にreset_files()した時刻(なければ0)。これより前に書かれた行は読まない """
+    try:
+        with open(os.path.join(INSTRUMENTATION_DIR, RESET_MARKER)) as f:
+            return float(f.read())
+    except (OSError, ValueError):
+        return 0.0
+
+
+def reset_files():
+    """ 集計を捨てる。消したファイルの数を返す
+
+    先にreset_at()を進めるので、消す前に読まれてまとめ直された行が書き戻されても数えない
+    """
+    os.makedirs(INSTRUMENTATION_DIR, exist_ok=True)
+    with open(os.path.join(INSTRUMENTATION_DIR, RESET_MARKER), 'w') as f:
+        f.write(repr(time.time()))
+    paths = glob.glob(os.path.join(INSTRUMENTATION_DIR, '*.jsonl'))
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    return len(paths)
+
+
+def read_deltas(paths, since=0.0):
+    """ ファイルに追記された差分のうちsince以降に書かれたものを順に返す(書き込み途中の行は飛ばす) """
+    for path in paths:
+        try:
+            f = open(path)
+        except FileNotFoundError:
+            continue
+        with f:
+            for line in f:
+                try:
+                    data = json.loads(line)
+                except ValueError:
+                    continue
+                if data.get('written_at', 0) >= since:
+                    yield data
+
+
+def merge(deltas, samples=None):
+    """ 差分をURL名ごとに足し合わせる(ViewStats.as_dict()と同じ形)。samplesを渡すと直近の分だけ残す """
+    merged = {}
+    for data in deltas:
+        for name, stats in data['views'].items():
+            view = merged.setdefault(name, {
+                'requests': 0, 'totals': dict.fromkeys(METRICS, 0.0), 'maxima': dict.fromkeys(METRICS, 0.0),
+                'samples': {metric: [] for metric in SAMPLED_METRICS}, 'over_budget': 0, 'n_plus_one': 0,
+                'last_n_plus_one': None,
+            })
+            view['requests'] += stats['requests']
+            for metric in METRICS:
+                view['totals'][metric] += stats['totals'][metric]
+                view['maxima'][metric] = max(view['maxima'][metric], stats['maxima'][metric])
+            for metric, values in stats['samples'].items():
+                view['samples'][metric].extend(values)
+                if samples is not None:
+                    del view['samples'][metric][:-samples]
+            view['over_budget'] += stats['over_budget']
+            view['n_plus_one'] += stats['n_plus_one']
+            view['last_n_plus_one'] = stats['last_n_plus_one'] or view['last_n_plus_one']
+    return merged
+
+
+class Registry:
+    """ プロセス内の集計。一定間隔でINSTRUMENTATION_DIR/<pid>.jsonlに書き足す
+
+    書き出した分は手元から消し、前回からの差分だけを1行ずつ追記する。
+    ファイルがINSTRUMENTATION_MAX_FILE_BYTESを超えたら1行にまとめ直すので、大きくなり続けない。
+    dump_instrumentation --resetした後は、それ以前の集計は読まれない
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # 書き出しとまとめ直しを同時に行わない
+        self.file_lock = threading.Lock()
+        self.views = {}
+        self.last_flush = time.monotonic()
+        atexit.register(self.flush)
+
+    def record(self, name, values, over_budget, repeated):
+        with self.lock:
+            self.views.setdefault(name, ViewStats()).add(values, over_budget, repeated)
+            due = time.monotonic() - self.last_flush >= INSTRUMENTATION_FLUSH_INTERVAL
+        if due:
+            self.flush()
+
+    def take(self):
+        """ 前回からの集計を取り出して手元から消す """
+        with self.lock:
+            views, self.views = self.views, {}
+        return {name: stats.as_dict() for name, stats in views.items()}
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        delta = self.take()
+        if not delta:
+            return
+        line = json.dumps({'pid': os.getpid(), 'written_at': time.time(), 'views': delta})
+        path = os.path.join(INSTRUMENTATION_DIR, f'{os.getpid()}.jsonl')
+        try:
+            with self.file_lock:
+                os.makedirs(INSTRUMENTATION_DIR, exist_ok=True)
+                with open(path, 'a') as f:
+                    f.write(line + '\n')
+                if os.path.getsize(path) > INSTRUMENTATION_MAX_FILE_BYTES:
+                    self.compact(path)
+        except OSError:
+            logger.exception('failed to write instrumentation to %s', INSTRUMENTATION_DIR)
+
+    def compact(self, path):
+        """ このプロセスのファイルを1行にまとめ直す(リセット前の行は捨てる) """
+        deltas = list(read_deltas([path], reset_at()))
+        if not deltas:
+            os.remove(path)
+            return
+        line = json.dumps({
+            'pid': os.getpid(),
+            'written_at': max(data['written_at'] for data in deltas),
+            'views': merge(deltas, INSTRUMENTATION_SAMPLES),
+        })
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(line + '\n')
+        os.replace(tmp_path, path)
+
+    def reset(self):
+        with self.lock:
+            self.views = {}
+
+
+registry = Registry()
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return '<unresolved>'
+    return match.view_name or match._func_path
+
+
+class InstrumentationMiddleware:
+    """ URL名ごとに処理時間・クエリ数・DB時間・テンプレート描画時間・レスポンスサイズを集計する
+
+    クエリ数がINSTRUMENTATION_QUERY_BUDGETSを超えた時と、同じSQLが繰り返された(N+1)時は警告を出す。
+    集計はdump_instrumentationコマンドで見る
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not INSTRUMENTATION_ENABLED or random.random() >= INSTRUMENTATION_SAMPLE_RATE:
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        request._template_seconds = 0.0
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        wall = time.perf_counter() - started
+
+        name = view_name(request)
+        values = {
+            'wall_ms': wall * 1000,
+            'queries': recorder.count,
+            'db_ms': recorder.seconds * 1000,
+            'template_ms': request._template_seconds * 1000,
+            'bytes': 0 if response.streaming else len(response.content),
+        }
+        budget = INSTRUMENTATION_QUERY_BUDGETS.get(name, INSTRUMENTATION_DEFAULT_QUERY_BUDGET)
+        over_budget = budget is not None and recorder.count > budget
+        if over_budget:
+            logger.warning('%s: %d queries exceed the budget of %d (%s)', name, recorder.count, budget, request.path)
+        repeated = recorder.repeated(INSTRUMENTATION_DUPLICATE_THRESHOLD)
+        if repeated:
+            logger.warning('%s: possible N+1 queries (%s): %s', name, request.path, '; '.join(
+                f'{count}x {sql}' for sql, count in repeated.items()))
+        registry.record(name, values, over_budget, repeated)
+        return response
+
+    def process_template_response(self, request, response):
+        """ テンプレートの描画時間を測るためにrenderを包む """
+        if not hasattr(request, '_template_seconds'):
+            return response
+        render = response.render
+
+        def timed_render():
+            started = time.perf_counter()
+            try:
+                return render()
+            finally:
+                request._template_seconds += time.perf_counter() - started
+        response.render = timed_render
+        return response
@@ -0,0 +1,69 @@
+import glob
+import json
+import os
+
+from django.core.management.base import BaseCommand
+
+from project import instrumentation
+from project.instrumentation import METRICS
+
+
+def percentile(values, p):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+class Command(BaseCommand):
+    """ InstrumentationMiddlewareが書き出したURL名ごとの集計を表示する """
+    help = ('Print per-view latency, query and size statistics collected by InstrumentationMiddleware. '
+            'Each process appends to INSTRUMENTATION_DIR/<pid>.jsonl and compacts the file into one line once it '
+            'exceeds INSTRUMENTATION_MAX_FILE_BYTES; files of exited processes stay until --reset.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true', help='Print the merged statistics as JSON.')
+        parser.add_argument('--sort', default='wall_ms', choices=['requests', 'wall_ms', 'queries', 'db_ms'],
+                            help='Sort views by this mean value (or request count).')
+        parser.add_argument('--reset', action='store_true', help='Delete the collected statistics (every <pid>.jsonl file) afterwards.')
+
+    def load(self):
+        """ プロセスごとのファイルの差分をURL名ごとにまとめる """
+        paths = glob.glob(os.path.join(instrumentation.INSTRUMENTATION_DIR, '*.jsonl'))
+        return instrumentation.merge(instrumentation.read_deltas(paths, instrumentation.reset_at()))
+
+    def handle(self, *args, **options):
+        merged = self.load()
+        rows = []
+        for name, view in merged.items():
+            requests = view['requests'] or 1
+            rows.append({
+                'view': name,
+                'requests': view['requests'],
+                **{metric: view['totals'][metric] / requests for metric in METRICS},
+                'wall_p50': percentile(view['samples']['wall_ms'], 50),
+                'wall_p95': percentile(view['samples']['wall_ms'], 95),
+                'queries_max': view['maxima']['queries'],
+                'over_budget': view['over_budget'],
+                'n_plus_one': view['n_plus_one'],
+                'last_n_plus_one': view['last_n_plus_one'],
+            })
+        rows.sort(key=lambda row: row[options['sort']], reverse=True)
+
+        if options['json']:
+            self.stdout.write(json.dumps(rows, indent=2, ensure_ascii=False))
+        else:
+            self.stdout.write(f'{"view":<36} {"reqs":>6} {"wall":>8} {"p50":>8} {"p95":>8} {"queries":>8} '
+                              f'{"max":>5} {"db":>8} {"tmpl":>8} {"bytes":>8} {"budget":>6} {"n+1":>5}')
+            for row in rows:
+                self.stdout.write(
+                    f'{row["view"]:<36} {row["requests"]:>6} {row["wall_ms"]:>7.1f}ms {row["wall_p50"]:>6.1f}ms '
+                    f'{row["wall_p95"]:>6.1f}ms {row["queries"]:>8.1f} {row["queries_max"]:>5.0f} '
+                    f'{row["db_ms"]:>6.1f}ms {row["template_ms"]:>6.1f}ms {row["bytes"]:>8.0f} '
+                    f'{row["over_budget"]:>6} {row["n_plus_one"]:>5}')
+            for row in rows:
+                if row['last_n_plus_one']:
+                    self.stdout.write(self.style.WARNING(f'{row["view"]}: {row["last_n_plus_one"]}'))
+
+        if options['reset']:
+            self.stdout.write(f'removed {instrumentation.reset_files()} files')
@@ -0,0 +1,106 @@
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers, quote_etag
+from django.utils.http import http_date
+
+# ページを保存するキャッシュ(複数プロセスで共有できるfile-basedを想定)
+PAGE_CACHE_ALIAS = getattr(settings, 'PAGE_CACHE_ALIAS', 'default')
+PAGE_CACHE_TIMEOUT = getattr(settings, 'PAGE_CACHE_TIMEOUT', 60 * 10)
+
+
+def _cache():
+    return caches[PAGE_CACHE_ALIAS]
+
+
+def _namespace_key(namespace):
+    return f'pagecache:ns:{namespace}'
+
+
+def namespace_states(namespaces):
+    """ {namespace: (version, changed_at)} キャッシュから消えていたら今変わったものとして扱う """
+    cache = _cache()
+    keys = {_namespace_key(namespace): namespace for namespace in namespaces}
+    found = cache.get_many(keys)
+    states = {}
+    for key, namespace in keys.items():
+        if key not in found:
+            cache.add(key, (uuid.uuid4().hex, timezone.now()), None)
+            found[key] = cache.get(key)
+        states[namespace] = found[key]
+    return states
+
+
+def invalidate(namespace):
+    """ namespaceのページをまとめて無効にする(記事などが変わった時にシグナルから呼ぶ) """
+    _cache().set(_namespace_key(namespace), (uuid.uuid4().hex, timezone.now()), None)
+
+
+class ConditionalPageMixin:
+    """ ETag/Last-Modifiedを付け、変わっていなければ304を返し、未ログインのページはキャッシュする
+
+    page_namespacesのどれかがinvalidate()されるか、get_last_modified()が変わると別のページになる
+    """
+    page_namespaces = ()
+    page_cache_timeout = PAGE_CACHE_TIMEOUT
+
+    def get_last_modified(self):
+        """ ページの内容の最終更新日時(なければNone) """
+        return None
+
+    def get_page_validators(self):
+        """ (etag, last_modified) """
+        states = namespace_states(self.page_namespaces)
+        candidates = [changed_at for _, changed_at in states.values()]
+        last_modified = self.get_last_modified()
+        if last_modified is not None:
+            candidates.append(last_modified)
+        last_modified = max(candidates) if candidates else None
+
+        user = self.request.user
+        source = '|'.join([
+            self.request.get_full_path(),
+            str(user.pk) if user.is_authenticated else '',
+            ','.join(version for version, _ in states.values()),
+            last_modified.isoformat() if last_modified else '',
+        ])
+        return quote_etag(hashlib.md5(source.encode()).hexdigest()), last_modified
+
+    def set_page_headers(self, response, etag, last_modified):
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified.timestamp())
+        # 毎回確認させて、変わっていなければ304で返す
+        patch_cache_control(response, max_age=0, must_revalidate=True, private=True)
+        patch_vary_headers(response, ('Cookie',))
+        return response
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return super().dispatch(request, *args, **kwargs)
+        etag, last_modified = self.get_page_validators()
+        not_modified = get_conditional_response(
+            request, etag=etag, last_modified=last_modified and int(last_modified.timestamp()))
+        if not_modified is not None:
+            return self.set_page_headers(not_modified, etag, last_modified)
+
+        anonymous = not request.user.is_authenticated
+        key = f'pagecache:page:{etag}'
+        if anonymous:
+            cached = _cache().get(key)
+            if cached is not None:
+                content, content_type = cached
+                return self.set_page_headers(HttpResponse(content, content_type=content_type), etag, last_modified)
+
+        response = super().dispatch(request, *args, **kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+        if response.status_code != 200:
+            return response
+        if anonymous:
+            _cache().set(key, (response.content, response['Content-Type']), self.page_cache_timeout)
+        return self.set_page_headers(response, etag, last_modified)
@@ -0,0 +1,109 @@
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.http import Http404
+
+
+def _flip(field):
+    return field[1:] if field.startswith('-') else f'-{field}'
+
+
+def keyset_filter(ordering, position, reverse=False):
+    """ ordering上でpositionより後ろ(reverse=Trueなら前)の行を表すQを返す
+
+    ('-date_posted', '-id') と (d, 1) なら
+    date_posted < d OR (date_posted = d AND id < 1)
+    """
+    q = Q()
+    for i, field in enumerate(ordering):
+        name = field.lstrip('-')
+        descending = field.startswith('-') != reverse
+        cond = Q(**{f'{name}__{"lt" if descending else "gt"}': position[i]})
+        for prev_field, value in zip(ordering[:i], position[:i]):
+            cond &= Q(**{prev_field.lstrip('-'): value})
+        q |= cond
+    return q
+
+
+class CursorPage:
+    """ カーソルページングの1ページ分 """
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginationMixin:
+    """ ListView用のカーソル(keyset)ページング
+
+    cursor_orderingの値を署名付きカーソルにして次/前のページを辿る。
+    OFFSETもCOUNT(*)も発行しないので、どこまで辿っても同じ速度で返せる
+    """
+    paginate_by = 20
+    cursor_ordering = ('-date_posted', '-id')
+    cursor_kwarg = 'cursor'
+    cursor_salt = 'project.pagination'
+
+    def encode_cursor(self, obj, reverse):
+        position = []
+        for field in self.cursor_ordering:
+            value = getattr(obj, field.lstrip('-'))
+            position.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        return signing.dumps({'p': position, 'r': reverse}, salt=self.cursor_salt, compress=True)
+
+    def decode_cursor(self, cursor):
+        """ カーソルから (position, reverse) を取り出す """
+        if not cursor:
+            return None, False
+        try:
+            data = signing.loads(cursor, salt=self.cursor_salt)
+            position = [self.model._meta.get_field(field.lstrip('-')).to_python(value)
+                        for field, value in zip(self.cursor_ordering, data['p'])]
+        except (signing.BadSignature, KeyError, TypeError, ValueError, ValidationError):
+            raise Http404('Invalid cursor')
+        if len(position) != len(self.cursor_ordering):
+            raise Http404('Invalid cursor')
+        return position, bool(data.get('r'))
+
+    def get_cursor_slice(self, queryset, position, reverse, size):
+        """ positionの次(reverse=Trueなら前)からsize件を取得する """
+        ordering = self.cursor_ordering
+        if reverse:
+            ordering = [_flip(field) for field in ordering]
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(keyset_filter(self.cursor_ordering, position, reverse))
+        return queryset[:size]
+
+    def paginate_queryset(self, queryset, page_size):
+        position, reverse = self.decode_cursor(self.request.GET.get(self.cursor_kwarg))
+        # 1件多く取得して次ページの有無を判定する
+        rows = list(self.get_cursor_slice(queryset, position, reverse, page_size + 1))
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+            has_next, has_previous = position is not None, has_more
+        else:
+            has_next, has_previous = has_more, position is not None
+
+        next_cursor = self.encode_cursor(rows[-1], False) if has_next and rows else None
+        previous_cursor = self.encode_cursor(rows[0], True) if has_previous and rows else None
+        page = CursorPage(rows, next_cursor, previous_cursor)
+        return None, page, rows, page.has_other_pages()
@@ -0,0 +1,231 @@
+import logging
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import user_logged_in
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+# 読み込み専用のレプリカの別名(DATABASESに追加しておく)
+DATABASE_REPLICAS = getattr(settings, 'DATABASE_REPLICAS', [])
+# レプリカの遅れ(秒)がこれを超えたらプライマリから読む
+DATABASE_REPLICA_MAX_LAG = getattr(settings, 'DATABASE_REPLICA_MAX_LAG', 5)
+# 遅れを調べ直す間隔(秒)
+DATABASE_REPLICA_LAG_CHECK_INTERVAL = getattr(settings, 'DATABASE_REPLICA_LAG_CHECK_INTERVAL', 5)
+# 書き込んだ後プライマリに固定する秒数(Noneならブラウザを閉じるまで)。
+# 遅れを調べてから次に調べるまでの間に遅れが増えても追いつく長さにしておく
+DATABASE_REPLICA_PIN_SECONDS = getattr(settings, 'DATABASE_REPLICA_PIN_SECONDS',
+                                       DATABASE_REPLICA_MAX_LAG + DATABASE_REPLICA_LAG_CHECK_INTERVAL)
+# 常にプライマリから読むアプリ(セッションはログイン直後に読むので)。書き込んでもプライマリに固定しない
+DATABASE_PRIMARY_APPS = getattr(settings, 'DATABASE_PRIMARY_APPS', ('sessions',))
+
+PIN_COOKIE = 'primary_pin'
+
+# 書き込むSQLと、その対象のテーブル
+WRITE_SQL_RE = re.compile(r'\s*(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|UPDATE|DELETE\s+FROM|REPLACE\s+INTO)\s+[`"]?(\w+)',
+                          re.IGNORECASE)
+
+# PostgreSQLのスタンバイが最後に反映したトランザクションからの経過秒数(追いついていれば0)
+POSTGRESQL_LAG_SQL = '''
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+'''
+
+
+class _State(threading.local):
+    """ リクエストごとの振り分けの状態 """
+
+    def __init__(self):
+        # ReplicaMiddlewareがGET/HEADの間だけTrueにする(管理コマンドなどは常にプライマリ)
+        self.allow_replicas = False
+        # このリクエストで書き込んだか(DATABASE_PRIMARY_APPSのテーブルとwithout_pin()の中は除く)
+        self.wrote = False
+        # このリクエストで使っているレプリカ
+        self.replica = None
+        self.forced_primary = 0
+        self.unpinned = 0
+
+
+_state = _State()
+
+
+@contextmanager
+def use_primary():
+    """ withの中の読み込みはプライマリから行う(書いた直後の内容を読みたい時など) """
+    _state.forced_primary += 1
+    try:
+        yield
+    finally:
+        _state.forced_primary -= 1
+
+
+@contextmanager
+def without_pin():
+    """ withの中の書き込みではプライマリに固定しない(レプリカで古い値が読めても困らないもの) """
+    _state.unpinned += 1
+    try:
+        yield
+    finally:
+        _state.unpinned -= 1
+
+
+@lru_cache(maxsize=None)
+def primary_tables():
+    """ DATABASE_PRIMARY_APPSのモデルのテーブル名 """
+    return {model._meta.db_table for model in apps.get_models() if model._meta.app_label in DATABASE_PRIMARY_APPS}
+
+
+def record_write(execute, sql, params, many, context):
+    """ プライマリのexecute_wrapper。実際に書き込んだ時だけ以降の読み込みをプライマリにする
+
+    db_for_writeは書き込まない時(検索のDB選びやget_or_createなど)にも呼ばれるので、そこでは決めない
+    """
+    match = WRITE_SQL_RE.match(sql)
+    if match and not _state.unpinned and match.group(1) not in primary_tables():
+        _state.wrote = True
+    return execute(sql, params, many, context)
+
+
+def update_last_login(sender, user, **kwargs):
+    """ last_loginの更新でログインのたびにプライマリに固定しないようにする """
+    from django.contrib.auth.models import update_last_login
+
+    with without_pin():
+        update_last_login(sender, user, **kwargs)
+
+
+def connect():
+    """ django.contrib.authが繋いだupdate_last_loginを差し替える """
+    if user_logged_in.disconnect(dispatch_uid='update_last_login'):
+        user_logged_in.connect(update_last_login, dispatch_uid='update_last_login')
+
+
+class LagGuard:
+    """ レプリカの遅れを一定間隔で調べ、遅れすぎているか繋がらないものを使わない """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checked = {}
+
+    def measure(self, alias):
+        """ 遅れ(秒)。調べ方が分からないバックエンド(SQLiteなど)は0とする """
+        connection = connections[alias]
+        if connection.vendor != 'postgresql':
+            return 0.0
+        with connection.cursor() as cursor:
+            cursor.execute(POSTGRESQL_LAG_SQL)
+            lag, = cursor.fetchone()
+        return float(lag or 0)
+
+    def healthy(self, alias):
+        now = time.monotonic()
+        checked = self.checked.get(alias)
+        if checked is not None and now - checked[0] < DATABASE_REPLICA_LAG_CHECK_INTERVAL:
+            return checked[1]
+        try:
+            lag = self.measure(alias)
+        except DatabaseError:
+            logger.exception('could not check replica %s; reading from the primary', alias)
+            healthy = False
+        else:
+            healthy = lag <= DATABASE_REPLICA_MAX_LAG
+            if not healthy:
+                logger.warning('replica %s is %.1fs behind; reading from the primary', alias, lag)
+        with self.lock:
+            self.checked[alias] = (now, healthy)
+        return healthy
+
+    def reset(self):
+        with self.lock:
+            self.checked = {}
+
+
+lag_guard = LagGuard()
+
+
+def choose_replica():
+    """ 遅れていないレプリカを1つ選ぶ(1リクエストの中では同じものを使う)。なければNone """
+    if _state.replica is not None and lag_guard.healthy(_state.replica):
+        return _state.replica
+    healthy = [alias for alias in DATABASE_REPLICAS if lag_guard.healthy(alias)]
+    _state.replica = random.choice(healthy) if healthy else None
+    return _state.replica
+
+
+class ReplicaRouter:
+    """ GET/HEADのリクエストの読み込みをレプリカへ、それ以外をプライマリ(default)へ振り分ける
+
+    書き込んだ後の読み込みと、トランザクションの中の読み込みはプライマリから行う
+    """
+
+    def can_use_replica(self, model):
+        if not DATABASE_REPLICAS or not _state.allow_replicas or _state.wrote or _state.forced_primary:
+            return False
+        if model._meta.app_label in DATABASE_PRIMARY_APPS:
+            return False
+        return not connections[DEFAULT_DB_ALIAS].in_atomic_block
+
+    def db_for_read(self, model, **hints):
+        if not self.can_use_replica(model):
+            return DEFAULT_DB_ALIAS
+        # 取得済みのインスタンスから辿る時は同じDBを使う
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db is not None:
+            return instance._state.db
+        return choose_replica() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # 書き込んだかはrecord_writeで見る
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        # レプリカへはレプリケーションで反映される
+        if db in DATABASE_REPLICAS:
+            return False
+        return None
+
+
+class ReplicaMiddleware:
+    """ GET/HEADのリクエストだけレプリカから読めるようにする
+
+    書き込んだらPIN_COOKIEを付け、以降のリクエストはプライマリから読む(自分の書いた内容が必ず見える)
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        _state.allow_replicas = request.method in ('GET', 'HEAD') and PIN_COOKIE not in request.COOKIES
+        _state.wrote = False
+        _state.replica = None
+        try:
+            with connections[DEFAULT_DB_ALIAS].execute_wrapper(record_write):
+                response = self.get_response(request)
+            wrote = _state.wrote
+        finally:
+            _state.allow_replicas = False
+            _state.wrote = False
+            _state.replica = None
+
+        if wrote:
+            response.set_cookie(PIN_COOKIE, '1', max_age=DATABASE_REPLICA_PIN_SECONDS, httponly=True,
+                                samesite='Lax')
+        return response
@@ -1,7 +1,10 @@
 import os
+import tempfile
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# ページキャッシュ・計測結果など実行中に書き出すファイルの置き場所(ソースツリーの外)
+RUNTIME_DIR = os.environ.get('WATOSON_RUNTIME_DIR', os.path.join(tempfile.gettempdir(), 'watoson'))
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/2.0/howto/deployment/checklist/
@@ -26,25 +29,44 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    'debug_toolbar',
     'django_summernote',
     'relationship.apps.RelationshipConfig',
     'article.apps.ArticleConfig',
     'index.apps.IndexConfig',
     'seekforadvice.apps.SeekforadviceConfig',
+    'search.apps.SearchConfig',
+    # dump_instrumentationなどの管理コマンドと、レプリカの振り分けの設定
+    'project.apps.ProjectConfig',
 ]
 
 MIDDLEWARE = [
+    'project.instrumentation.InstrumentationMiddleware',
+    'project.replicas.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'project.identity.IdentityMapMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
 ]
 
+# debug_toolbarは開発時だけ使う
+if DEBUG:
+    INSTALLED_APPS.append('debug_toolbar')
+    MIDDLEWARE.append('debug_toolbar.middleware.DebugToolbarMiddleware')
+
+# InstrumentationMiddleware
+# URL名ごとのクエリ数の上限(dump_instrumentationで集計を見る)
+INSTRUMENTATION_QUERY_BUDGETS = {
+    'relationship:home': 10,
+    'relationship:follower': 10,
+    'register:user_detail': 15,
+}
+INSTRUMENTATION_DEFAULT_QUERY_BUDGET = 20
+INSTRUMENTATION_DIR = os.path.join(RUNTIME_DIR, 'instrumentation')
+
 ROOT_URLCONF = 'project.urls'
 
 TEMPLATES = [
@@ -75,6 +97,30 @@ DATABASES = {
     }
 }
 
+# 読み込み専用のレプリカ(DATABASESに別名で追加して並べる)。GET/HEADのリクエストの読み込みだけ使う
+# SQLiteで試す時は同じファイルを指す別名を足し、テストでは'TEST': {'MIRROR': 'default'}にする
+# 'replica': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+#             'TEST': {'MIRROR': 'default'}},
+DATABASE_REPLICAS = []
+DATABASE_ROUTERS = ['project.replicas.ReplicaRouter']
+# レプリカの遅れ(秒)がこれを超えたらプライマリから読む
+DATABASE_REPLICA_MAX_LAG = 5
+
+# Cache
+# 公開ページ(記事・相談一覧)はプロセス間で共有できるようファイルに保存する
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'pages': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(RUNTIME_DIR, 'pages'),
+    },
+}
+PAGE_CACHE_ALIAS = 'pages'
+PAGE_CACHE_TIMEOUT = 60 * 10
+
 # Password validation
 # https://docs.djangoproject.com/en/2.0/ref/settings/#auth-password-validators
 
@@ -0,0 +1,72 @@
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from project.instrumentation import QueryRecorder
+from register.models import UploadImage
+
+User = get_user_model()
+
+# 表示する行数(1ページに収まる数にしておく)
+FIXTURE_SIZES = (2, 10)
+
+
+def create_user(account_name, **fields):
+    """ 本登録済みのユーザー(本登録の時と同じく画像アップロード用のインスタンスも作る) """
+    user = User.objects.create_user(f'{account_name}@example.com', 'password', account_name=account_name, **fields)
+    UploadImage.objects.create(user=user)
+    return user
+
+
+@override_settings(
+    # クエリは自分で数えるので計測用のミドルウェアは外す(集計ファイルも書き出さない)
+    MIDDLEWARE=[middleware for middleware in settings.MIDDLEWARE
+                if middleware != 'project.instrumentation.InstrumentationMiddleware'],
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'default'},
+        'pages': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'pages'},
+    },
+)
+class QueryBudgetTestCase(TestCase):
+    """ ビューのクエリ数がquery_budgets以内で、表示する行数を増やしても変わらないことを確かめる
+
+    query_budgetsは{URL名: クエリ数}。セッションとログインユーザーの取得も数に入る
+    """
+    query_budgets = {}
+
+    def setUp(self):
+        self.user = create_user('viewer')
+        self.client.force_login(self.user)
+
+    def count_queries(self, url, method='get', data=None, status=200):
+        recorder = QueryRecorder()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = getattr(self.client, method)(url, data)
+        self.assertEqual(response.status_code, status, f'{method.upper()} {url}')
+        return recorder.count
+
+    def assertQueryBudget(self, name, args=None, grow=None, key=None, **kwargs):
+        """ nameのURLのクエリ数を調べる
+
+        growを渡すと、grow(n)で行をn件ずつ足しながらFIXTURE_SIZESの各件数で数を比べる。
+        同じURLへのPOSTなどを別の上限にしたい時はkeyでquery_budgetsを引く
+        """
+        key = key or name
+        budget = self.query_budgets[key]
+        url = reverse(name, args=args)
+        counts = {}
+        rows = 0
+        for size in (FIXTURE_SIZES if grow else (0,)):
+            if grow:
+                grow(size - rows)
+                rows = size
+            counts[size] = self.count_queries(url, **kwargs)
+        self.assertLessEqual(max(counts.values()), budget, f'{key}: {counts} queries exceed the budget of {budget}')
+        self.assertEqual(len(set(counts.values())), 1, f'{key}: query count grows with rows {counts}')
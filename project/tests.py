@@ -0,0 +1,551 @@
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.contrib.sessions.models import Session
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError
+from django.core import signing
+from django.core.cache import caches
+from django.db import connection
+from django.http import Http404, HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import parse_http_date
+
+from register import images
+from relationship import follows
+from relationship.models import Comment, Post
+from seekforadvice.models import Advice, Seek
+
+from . import identity, instrumentation, pagination, replicas
+from .testing import create_user
+
+REPLICAS = ['replica1', 'replica2']
+
+
+class ReplicaRouterTests(SimpleTestCase):
+    """ TestCaseはトランザクションの中で動くのでプライマリから読んでしまう。DBを使わずに振り分けだけ確かめる """
+
+    def setUp(self):
+        self.router = replicas.ReplicaRouter()
+        for patcher in (mock.patch.object(replicas, 'DATABASE_REPLICAS', REPLICAS),
+                        mock.patch.object(replicas.lag_guard, 'measure', return_value=0.0)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        replicas.lag_guard.reset()
+
+    def call(self, view, method='get', cookies=None):
+        """ ReplicaMiddlewareを通してviewを呼ぶ """
+        request = getattr(RequestFactory(), method)('/')
+        request.COOKIES.update(cookies or {})
+        return replicas.ReplicaMiddleware(view)(request)
+
+    def write(self, model=Post, sql='UPDATE "{}" SET "id" = 1'):
+        """ modelのテーブルに書き込むSQLを実行したことにする """
+        replicas.record_write(lambda *args: None, sql.format(model._meta.db_table), (), False, {})
+
+    def reads(self, model=Post, count=1, **kwargs):
+        """ リクエストの中でmodelを読む時のDBのリスト """
+        databases = []
+
+        def view(request):
+            databases.extend(self.router.db_for_read(model) for _ in range(count))
+            return HttpResponse()
+        self.call(view, **kwargs)
+        return databases
+
+    def test_outside_requests_read_from_primary(self):
+        self.assertEqual(self.router.db_for_read(Post), 'default')
+
+    def test_get_reads_from_one_replica(self):
+        databases = self.reads(count=5)
+        self.assertIn(databases[0], REPLICAS)
+        self.assertEqual(len(set(databases)), 1)
+
+    def test_post_reads_from_primary(self):
+        self.assertEqual(self.reads(method='post'), ['default'])
+
+    def test_sessions_read_from_primary(self):
+        self.assertEqual(self.reads(Session), ['default'])
+
+    def test_use_primary(self):
+        def view(request):
+            with replicas.use_primary():
+                databases.append(self.router.db_for_read(Post))
+            databases.append(self.router.db_for_read(Post))
+            return HttpResponse()
+        databases = []
+        self.call(view)
+        self.assertEqual(databases[0], 'default')
+        self.assertIn(databases[1], REPLICAS)
+
+    def test_reads_after_write_stick_to_primary(self):
+        def view(request):
+            databases.append(self.router.db_for_read(Post))
+            self.assertEqual(self.router.db_for_write(Post), 'default')
+            self.write()
+            databases.append(self.router.db_for_read(Post))
+            return HttpResponse()
+        databases = []
+        response = self.call(view)
+        self.assertIn(databases[0], REPLICAS)
+        self.assertEqual(databases[1], 'default')
+        self.assertIn(replicas.PIN_COOKIE, response.cookies)
+        # 次のリクエストからもプライマリ
+        self.assertEqual(self.reads(cookies={replicas.PIN_COOKIE: '1'}), ['default'])
+
+    def test_read_only_requests_are_not_pinned(self):
+        response = self.call(lambda request: HttpResponse())
+        self.assertNotIn(replicas.PIN_COOKIE, response.cookies)
+
+    def test_asking_for_the_write_database_does_not_pin(self):
+        def view(request):
+            self.router.db_for_write(Post)
+            self.write(sql='SELECT * FROM "{}"')
+            return HttpResponse()
+        self.assertNotIn(replicas.PIN_COOKIE, self.call(view).cookies)
+
+    def test_pin_outlasts_the_lag_bound(self):
+        def view(request):
+            self.write(sql='INSERT INTO "{}" ("id") VALUES (1)')
+            return HttpResponse()
+        max_age = self.call(view).cookies[replicas.PIN_COOKIE]['max-age']
+        self.assertGreater(max_age, replicas.DATABASE_REPLICA_MAX_LAG)
+
+    def test_unpinned_writes(self):
+        def view(request):
+            self.write(Session, 'DELETE FROM "{}" WHERE "session_key" = 1')
+            with replicas.without_pin():
+                self.write()
+            databases.append(self.router.db_for_read(Post))
+            return HttpResponse()
+        databases = []
+        response = self.call(view)
+        self.assertIn(databases[0], REPLICAS)
+        self.assertNotIn(replicas.PIN_COOKIE, response.cookies)
+
+    def test_lagging_replica_is_skipped(self):
+        replicas.lag_guard.measure.side_effect = lambda alias: 60.0 if alias == 'replica1' else 0.0
+        self.assertEqual(set(self.reads(count=10)), {'replica2'})
+
+    def test_primary_when_every_replica_lags(self):
+        replicas.lag_guard.measure.return_value = 60.0
+        with self.assertLogs('project.replicas', 'WARNING'):
+            self.assertEqual(self.reads(), ['default'])
+
+    def test_unreachable_replica_is_skipped(self):
+        replicas.lag_guard.measure.side_effect = DatabaseError('unreachable')
+        with self.assertLogs('project.replicas', 'ERROR'):
+            self.assertEqual(self.reads(), ['default'])
+
+    def test_lag_is_checked_once_per_interval(self):
+        self.reads(count=3)
+        self.reads(count=3)
+        self.assertEqual(replicas.lag_guard.measure.call_count, len(REPLICAS))
+
+    def test_replicas_are_not_migrated(self):
+        self.assertFalse(self.router.allow_migrate('replica1', 'relationship'))
+        self.assertIsNone(self.router.allow_migrate('default', 'relationship'))
+
+
+class LoginReplicaTests(TransactionTestCase):
+    """ ログイン(セッションとlast_loginの書き込み)ではプライマリに固定されない
+
+    TestCaseだとトランザクションの中なので、レプリカを選んだかをchoose_replicaの呼び出しで確かめる
+    """
+
+    def setUp(self):
+        self.user = create_user('viewer')
+        for patcher in (mock.patch.object(replicas, 'DATABASE_REPLICAS', REPLICAS),
+                        mock.patch.object(replicas, 'choose_replica', return_value='default')):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def reads_replica(self):
+        replicas.choose_replica.reset_mock()
+        response = self.client.get(reverse('relationship:home'))
+        self.assertEqual(response.status_code, 200)
+        return replicas.choose_replica.called
+
+    def test_home_reads_replica_after_login(self):
+        response = self.client.post(reverse('register:login'),
+                                    {'username': self.user.email, 'password': 'password'})
+        self.assertEqual(response.status_code, 302)
+        self.assertNotIn(replicas.PIN_COOKIE, response.cookies)
+        self.user.refresh_from_db()
+        self.assertIsNotNone(self.user.last_login)
+        self.assertTrue(self.reads_replica())
+
+    def test_read_only_pages_do_not_pin(self):
+        self.client.force_login(self.user)
+        for url in (reverse('search:search') + '?q=投稿', reverse('index:top')):
+            with self.subTest(url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotIn(replicas.PIN_COOKIE, response.cookies)
+
+    def test_home_reads_replica_once_the_pin_expires(self):
+        self.client.force_login(self.user)
+        other = create_user('other')
+        post = Post.objects.create(author=other, content='投稿')
+        response = self.client.post(reverse('relationship:post_detail', args=[post.pk]),
+                                    {'follow': other.account_name})
+        self.assertIn(replicas.PIN_COOKIE, response.cookies)
+        self.assertFalse(self.reads_replica())
+        # max-ageが過ぎるとブラウザがクッキーを消す
+        del self.client.cookies[replicas.PIN_COOKIE]
+        self.assertTrue(self.reads_replica())
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'default'},
+    'pages': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'pages'},
+})
+class ConditionalPageTests(TestCase):
+    """ ConditionalPageMixinを相談一覧で確かめる """
+
+    def setUp(self):
+        # locmemの中身はテストをまたいで残る
+        for alias in ('default', 'pages'):
+            caches[alias].clear()
+        self.author = create_user('author')
+        self.seek = Seek.objects.create(author=self.author, content='相談',
+                                        date_posted=timezone.now() - timedelta(days=1))
+        self.url = reverse('seekforadvice:top')
+
+    def get(self, **headers):
+        return self.client.get(self.url, **headers)
+
+    def test_validators(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['ETag'].startswith('"'))
+        # 一覧の名前空間がまだキャッシュにないので、今変わったものとして扱う
+        self.assertGreaterEqual(parse_http_date(response['Last-Modified']), int(self.seek.date_posted.timestamp()))
+        self.assertIn('must-revalidate', response['Cache-Control'])
+
+    def test_not_modified(self):
+        response = self.get()
+        for headers in ({'HTTP_IF_NONE_MATCH': response['ETag']},
+                        {'HTTP_IF_MODIFIED_SINCE': response['Last-Modified']}):
+            with self.subTest(headers):
+                not_modified = self.get(**headers)
+                self.assertEqual(not_modified.status_code, 304)
+                self.assertEqual(not_modified['ETag'], response['ETag'])
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
+
+    def test_anonymous_pages_are_cached(self):
+        response = self.get()
+        # 検証用の最終更新日時を調べるだけになる
+        with self.assertNumQueries(1):
+            cached = self.get()
+        self.assertEqual(cached.content, response.content)
+        # ログインしていれば毎回作る
+        self.client.force_login(self.author)
+        for _ in range(2):
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.get().status_code, 200)
+            self.assertGreater(len(queries), 1)
+
+    def test_changes_invalidate(self):
+        changes = {
+            'seek': lambda: Seek.objects.create(author=self.author, content='別の相談'),
+            'advice': lambda: Advice.objects.create(author=self.author, post_connected=self.seek, content='アドバイス'),
+            'account_name': self.rename,
+            # サムネイルができて仮画像から変わる
+            'image': lambda: images.process(type(self.author), self.author.pk, 'image', 'image_ready',
+                                            self.author.image.name),
+        }
+        type(self.author).objects.filter(pk=self.author.pk).update(image_ready=False)
+        for name, change in changes.items():
+            with self.subTest(name):
+                etag = self.get()['ETag']
+                with mock.patch.object(images, 'make_variants'):
+                    change()
+                response = self.get(HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etag)
+
+    def rename(self):
+        self.author.account_name = 'renamed'
+        self.author.save()
+
+    def test_login_does_not_invalidate(self):
+        etag = self.get()['ETag']
+        self.author.last_login = timezone.now()
+        self.author.save(update_fields=['last_login'])
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+
+class CursorPaginationTests(TestCase):
+    """ CursorPaginationMixinをアドバイス一覧(1ページ20件)で確かめる """
+
+    def setUp(self):
+        author = create_user('author')
+        self.seek = Seek.objects.create(author=author, content='相談')
+        # 同じ日時のアドバイスがページの境目をまたぐようにする
+        now = timezone.now()
+        Advice.objects.bulk_create([
+            Advice(author=author, post_connected=self.seek, content=f'アドバイス{i}',
+                   date_posted=now - timedelta(minutes=i // 7))
+            for i in range(45)
+        ])
+        self.expected = list(Advice.objects.order_by('-date_posted', '-id').values_list('pk', flat=True))
+        self.url = reverse('seekforadvice:advice_list', args=[self.seek.pk])
+
+    def get(self, cursor=None):
+        return self.client.get(self.url, {'cursor': cursor} if cursor else None)
+
+    def page(self, cursor=None):
+        response = self.get(cursor)
+        self.assertEqual(response.status_code, 200)
+        return response.context['page_obj'], [advice.pk for advice in response.context['advices']]
+
+    def test_walk_forward_and_back(self):
+        forward = []
+        page, pks = self.page()
+        forward.append(pks)
+        while page.has_next():
+            page, pks = self.page(page.next_cursor)
+            forward.append(pks)
+        self.assertEqual([len(pks) for pks in forward], [20, 20, 5])
+        self.assertEqual([pk for pks in forward for pk in pks], self.expected)
+
+        backward = [pks]
+        while page.has_previous():
+            page, pks = self.page(page.previous_cursor)
+            backward.append(pks)
+        self.assertEqual(backward, forward[::-1])
+
+    def test_links_on_first_and_last_pages(self):
+        response = self.get()
+        page = response.context['page_obj']
+        self.assertEqual((page.has_previous(), page.has_next()), (False, True))
+        self.assertContains(response, '次へ')
+        self.assertNotContains(response, '前へ')
+
+        page, _ = self.page(page.next_cursor)
+        response = self.get(page.next_cursor)
+        page = response.context['page_obj']
+        self.assertEqual((page.has_previous(), page.has_next()), (True, False))
+        self.assertContains(response, '前へ')
+        self.assertNotContains(response, '次へ')
+
+    def test_single_page_has_no_links(self):
+        Advice.objects.exclude(pk__in=self.expected[:3]).delete()
+        response = self.get()
+        self.assertFalse(response.context['page_obj'].has_other_pages())
+        self.assertNotContains(response, '<nav>')
+
+    def test_invalid_cursor_is_404(self):
+        cursor = self.page()[0].next_cursor
+        salt = pagination.CursorPaginationMixin.cursor_salt
+        for invalid in ('garbage', cursor[:-2] + ('aa' if not cursor.endswith('aa') else 'bb'),
+                        signing.dumps({'p': ['not a date', 1]}, salt=salt),
+                        signing.dumps({'p': [timezone.now().isoformat()]}, salt=salt),
+                        signing.dumps(['p'], salt=salt),
+                        signing.dumps({'p': 1}, salt=salt)):
+            with self.subTest(invalid):
+                self.assertEqual(self.get(invalid).status_code, 404)
+
+    def test_no_count_query(self):
+        cursor = self.page()[0].next_cursor
+        for value in (None, cursor):
+            with self.subTest(value):
+                with CaptureQueriesContext(connection) as queries, self.assertNumQueries(1):
+                    self.get(value)
+                self.assertNotIn('COUNT(', queries[0]['sql'].upper())
+
+
+class IdentityMapTests(TestCase):
+
+    def setUp(self):
+        self.user = create_user('viewer')
+        self.User = type(self.user)
+
+    def call(self, view, **settings):
+        """ 設定を変えたIdentityMapMiddlewareを通してviewを呼ぶ """
+        with override_settings(**settings):
+            middleware = identity.IdentityMapMiddleware(view)
+        request = RequestFactory().get('/')
+        return middleware(request)
+
+    def test_repeated_lookups_come_from_the_map(self):
+        identity_map = identity.IdentityMap()
+        with self.assertNumQueries(1):
+            user = identity_map.get(self.User, pk=self.user.pk)
+            self.assertIs(identity_map.get(self.User, pk=self.user.pk), user)
+            # 他のユニークなキーでも引ける
+            self.assertIs(identity_map.get(self.User, account_name='viewer'), user)
+            self.assertIs(identity_map.get(self.User, email='viewer@example.com'), user)
+        identity_map.forget(user)
+        with self.assertNumQueries(1):
+            identity_map.get(self.User, pk=self.user.pk)
+
+    def test_request_user_is_seeded(self):
+        request = RequestFactory().get('/')
+        request.user = self.user
+        with self.assertNumQueries(0):
+            self.assertIs(identity.get_identity_map(request).get(self.User, pk=self.user.pk), self.user)
+
+    def test_get_or_404(self):
+        with self.assertRaises(Http404):
+            identity.IdentityMap().get_or_404(Post, pk=1)
+
+    def test_map_is_cleared_between_requests(self):
+        maps = []
+
+        def view(request):
+            maps.append(request.identity_map)
+            request.identity_map.get(self.User, pk=self.user.pk)
+            return HttpResponse()
+        for _ in range(2):
+            with self.assertNumQueries(1):
+                self.call(view, IDENTITY_MAP_CHECK_DUPLICATES=False)
+        self.assertIsNot(maps[0], maps[1])
+
+    def duplicated(self, request):
+        for _ in range(2):
+            list(self.User.objects.filter(pk=self.user.pk))
+        return HttpResponse()
+
+    def test_duplicate_queries_are_logged(self):
+        with self.assertLogs('project.identity', 'WARNING') as logs:
+            self.assertEqual(self.call(self.duplicated, IDENTITY_MAP_CHECK_DUPLICATES=True).status_code, 200)
+        self.assertIn('1 queries were repeated: 2x SELECT', logs.output[0])
+
+    def test_strict_raises(self):
+        with self.assertRaises(AssertionError):
+            self.call(self.duplicated, IDENTITY_MAP_CHECK_DUPLICATES=True, IDENTITY_MAP_STRICT=True)
+
+    def test_disabled_check_does_nothing(self):
+        def view(request):
+            wrappers.append(list(connection.execute_wrappers))
+            return self.duplicated(request)
+        wrappers = []
+        with self.assertNoLogs('project.identity'):
+            response = self.call(view, IDENTITY_MAP_CHECK_DUPLICATES=False, IDENTITY_MAP_STRICT=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(wrappers, [[]])
+
+
+class RecountCommandTests(TestCase):
+
+    def setUp(self):
+        self.user = create_user('author')
+        self.other = create_user('other')
+        follows.follow(self.user, self.other)
+        self.post = Post.objects.create(author=self.user, content='投稿')
+        Comment.objects.create(author=self.other, post_connected=self.post, content='コメント')
+
+    def call(self, name, *args):
+        out = StringIO()
+        call_command(name, *args, stdout=out)
+        return out.getvalue()
+
+    def test_consistent_counters_pass_check(self):
+        self.assertIn('consistent', self.call('rebuild_comment_counts', '--check'))
+        self.assertIn('consistent', self.call('rebuild_follow_counts', '--check'))
+
+    def test_check_reports_and_rebuild_fixes(self):
+        Post.objects.update(comment_count=5)
+        type(self.user).objects.filter(pk=self.other.pk).update(followers_count=3)
+        for name, stale in (('rebuild_comment_counts', 'comment_count 5 != 1'),
+                            ('rebuild_follow_counts', 'followers_count 3 != 1')):
+            with self.subTest(name):
+                with self.assertRaises(CommandError):
+                    out = StringIO()
+                    call_command(name, '--check', stdout=out)
+                self.assertIn(stale, out.getvalue())
+                self.assertIn('for 1 ', self.call(name))
+                self.assertIn('consistent', self.call(name, '--check'))
+        self.post.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual((self.post.comment_count, self.other.followers_count), (1, 1))
+
+
+class InstrumentationTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        patcher = mock.patch.object(instrumentation, 'INSTRUMENTATION_DIR', directory)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.registry = instrumentation.Registry()
+
+    def record(self, name='index:top', queries=3):
+        values = dict.fromkeys(instrumentation.METRICS, 1.0)
+        values['queries'] = queries
+        self.registry.record(name, values, False, {})
+
+    def dump(self, *args):
+        out = StringIO()
+        call_command('dump_instrumentation', '--json', *args, stdout=out)
+        rows = json.loads(out.getvalue().split('\nremoved')[0])
+        return {row['view']: row for row in rows}
+
+    def test_recorder_groups_repeated_statements(self):
+        recorder = instrumentation.QueryRecorder()
+
+        def execute(sql, params, many, context):
+            return None
+        for pk in range(5):
+            recorder(execute, 'SELECT * FROM post WHERE id = %s', (pk,), False, {})
+        recorder(execute, 'SELECT 1', None, False, {})
+        self.assertEqual(recorder.count, 6)
+        self.assertEqual(recorder.repeated(5), {'SELECT * FROM post WHERE id = %s': 5})
+        # 同じパラメータの重複はDuplicateQueryCounterと同じく数える
+        self.assertEqual(recorder.duplicates(), {})
+
+    def test_flushes_are_merged(self):
+        self.record()
+        self.registry.flush()
+        self.record(queries=5)
+        self.registry.flush()
+        row = self.dump()['index:top']
+        self.assertEqual((row['requests'], row['queries'], row['queries_max']), (2, 4.0, 5))
+
+    def test_reset_is_not_undone_by_running_processes(self):
+        self.record()
+        self.registry.flush()
+        self.assertEqual(self.dump('--reset')['index:top']['requests'], 1)
+        # リセット後にプロセスが書き出しても、リセット前の分は戻らない
+        self.record()
+        self.registry.flush()
+        self.assertEqual(self.dump()['index:top']['requests'], 1)
+
+    def files(self):
+        return {name: open(os.path.join(instrumentation.INSTRUMENTATION_DIR, name)).read().splitlines()
+                for name in os.listdir(instrumentation.INSTRUMENTATION_DIR) if name.endswith('.jsonl')}
+
+    def test_large_files_are_compacted(self):
+        with mock.patch.object(instrumentation, 'INSTRUMENTATION_MAX_FILE_BYTES', 1):
+            for queries in (3, 5, 7):
+                self.record(queries=queries)
+                self.registry.flush()
+        lines, = self.files().values()
+        self.assertEqual(len(lines), 1)
+        row = self.dump()['index:top']
+        self.assertEqual((row['requests'], row['queries'], row['queries_max']), (3, 5.0, 7))
+
+    def test_lines_before_reset_are_ignored(self):
+        self.record()
+        self.registry.flush()
+        lines, = self.files().values()
+        instrumentation.reset_files()
+        # リセットの直前に読まれてまとめ直された行が書き戻されたことにする
+        with open(os.path.join(instrumentation.INSTRUMENTATION_DIR, '1.jsonl'), 'w') as f:
+            f.write(lines[0] + '\n')
+        self.assertEqual(self.dump(), {})
+        with mock.patch.object(instrumentation, 'INSTRUMENTATION_MAX_FILE_BYTES', 1):
+            self.record(queries=5)
+            self.registry.flush()
+        self.assertEqual(self.dump()['index:top']['requests'], 1)
@@ -9,6 +9,7 @@ urlpatterns = [
     path('relationship/', include('relationship.urls')),
     path('seek-for-advice', include('seekforadvice.urls')),
     path('article/', include('article.urls')),
+    path('search/', include('search.urls')),
     path('summernote/', include('django_summernote.urls')),
     path('admin/', admin.site.urls),
 
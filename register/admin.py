@@ -2,7 +2,7 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.forms import UserChangeForm, UserCreationForm
 from django.utils.translation import ugettext_lazy as _
-from .models import User, UploadImage
+from .models import User, UploadImage, OutboundMail
 
 
 class MyUserChangeForm(UserChangeForm):
@@ -47,5 +47,12 @@ class UploadImageAdmin(admin.ModelAdmin):
     ordering = ('-user',)
 
 
+class OutboundMailAdmin(admin.ModelAdmin):
+    list_display = ('to', 'subject', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status',)
+    ordering = ('-id',)
+
+
 admin.site.register(User, MyUserAdmin)
-admin.site.register(UploadImage, UploadImageAdmin)
\ No newline at end of file
+admin.site.register(UploadImage, UploadImageAdmin)
+admin.site.register(OutboundMail, OutboundMailAdmin)
\ No newline at end of file
@@ -4,6 +4,7 @@ from django.contrib.auth.forms import (
     PasswordResetForm, SetPasswordForm
 )
 from django.contrib.auth import get_user_model
+from . import mailqueue
 from .models import UploadImage
 
 User = get_user_model()
@@ -110,6 +111,11 @@ class MyPasswordResetForm(PasswordResetForm):
         for field in self.fields.values():
             field.widget.attrs['class'] = 'form-control'
 
+    def send_mail(self, subject_template_name, email_template_name,
+                  context, from_email, to_email, html_email_template_name=None):
+        """リクエスト内では送らず、送信待ちに追加する"""
+        mailqueue.enqueue_template(subject_template_name, email_template_name, context, [to_email], from_email)
+
 
 class MySetPasswordForm(SetPasswordForm):
     """パスワード再設定用フォーム(パスワード忘れて再設定)"""
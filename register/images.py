@@ -0,0 +1,161 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.dispatch import Signal
+
+from PIL import Image
+
+from . import storage
+
+logger = logging.getLogger(__name__)
+
+# 作成するサムネイルの大きさ(px)
+PROFILE_IMAGE_SIZES = getattr(settings, 'PROFILE_IMAGE_SIZES', (48, 96, 200))
+# 処理が終わるまで表示する画像
+PROFILE_IMAGE_PLACEHOLDER = getattr(settings, 'PROFILE_IMAGE_PLACEHOLDER', 'media/profile_pics/default.png')
+# バックグラウンドのワーカー数
+PROFILE_IMAGE_WORKERS = getattr(settings, 'PROFILE_IMAGE_WORKERS', 2)
+# Trueならリクエスト内で処理する(テスト・開発用)
+PROFILE_IMAGE_SYNC = getattr(settings, 'PROFILE_IMAGE_SYNC', False)
+
+# サムネイルができて処理済みになった時に送る(sender=モデル, pk)
+image_processed = Signal()
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=PROFILE_IMAGE_WORKERS, thread_name_prefix='profile-image')
+    return _executor
+
+
+def variant_name(name, size, webp=False):
+    """ media/profile_pics/1_abc.jpg -> media/profile_pics/1_abc_96.jpg (.webp) """
+    root, ext = os.path.splitext(name)
+    return f'{root}_{size}{".webp" if webp else ext}'
+
+
+def variant_url(name, size, webp=False):
+    return default_storage.url(variant_name(name, size, webp))
+
+
+def _save(img, path, img_format):
+    if img_format == 'JPEG' and img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+    img.save(path, img_format)
+
+
+def make_variants(name):
+    """ 各サイズのサムネイルとWebPを作る
+
+    元画像は内容のハッシュで保存しているので書き換えない。同じ画像なら作成済みのものを使う
+    """
+    names = [variant_name(name, size, webp) for size in PROFILE_IMAGE_SIZES for webp in (False, True)]
+    if all(default_storage.exists(n) for n in names):
+        return
+
+    img = Image.open(default_storage.path(name))
+    img.load()
+    img_format = img.format or 'PNG'
+
+    for size in PROFILE_IMAGE_SIZES:
+        thumb = img.copy()
+        thumb.thumbnail((size, size))
+        _save(thumb, default_storage.path(variant_name(name, size)), img_format)
+        thumb.save(default_storage.path(variant_name(name, size, webp=True)), 'WEBP', quality=80)
+
+
+def process(model, pk, field_name, ready_field_name, name):
+    """ 画像を処理して、画像が差し替えられていなければ処理済みにする """
+    try:
+        make_variants(name)
+        if model._default_manager.filter(pk=pk, **{field_name: name}).update(**{ready_field_name: True}):
+            image_processed.send(sender=model, pk=pk)
+    except Exception:
+        logger.exception('failed to process %s for %s(pk=%s)', name, model.__name__, pk)
+    finally:
+        if not PROFILE_IMAGE_SYNC:
+            connections.close_all()
+
+
+def schedule(model, pk, field_name, ready_field_name, name):
+    """ コミット後に画像処理をワーカーへ渡す """
+    def submit():
+        if PROFILE_IMAGE_SYNC:
+            process(model, pk, field_name, ready_field_name, name)
+        else:
+            _get_executor().submit(process, model, pk, field_name, ready_field_name, name)
+    transaction.on_commit(submit)
+
+
+class ImagePipelineMixin:
+    """ 画像が変わった時だけバックグラウンドでリサイズするモデル用Mixin """
+    image_field_name = 'image'
+    ready_field_name = 'image_ready'
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        field = cls._meta.get_field(cls.image_field_name)
+        if field.attname in instance.__dict__:
+            instance._loaded_image_name = instance.__dict__[field.attname]
+        return instance
+
+    def _image_changed(self):
+        field = self._meta.get_field(self.image_field_name)
+        if field.attname not in self.__dict__:
+            return False
+        file = getattr(self, field.name)
+        if not file or self._state.adding:
+            return bool(file)
+        return file.name != getattr(self, '_loaded_image_name', None) or not file._committed
+
+    def save(self, *args, **kwargs):
+        field = self._meta.get_field(self.image_field_name)
+        changed = self._image_changed()
+        if changed:
+            # 既定画像はそのまま表示できる
+            is_default = getattr(self, field.name).name == field.get_default()
+            setattr(self, self.ready_field_name, is_default)
+            changed = not is_default
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | {self.ready_field_name}
+        old_name = getattr(self, '_loaded_image_name', None)
+        super().save(*args, **kwargs)
+        name = getattr(self, field.name).name
+        self._loaded_image_name = name
+        if name != old_name:
+            # 画像の参照数を付け替える(既定画像は数えない)
+            default = field.get_default()
+            if name != default:
+                storage.retain(name)
+            if old_name != default:
+                storage.release(old_name)
+        if changed:
+            schedule(self._meta.model, self.pk, field.name, self.ready_field_name, name)
+
+    def _image_name(self):
+        return getattr(self, self.image_field_name).name
+
+    def thumbnail_url(self, size=max(PROFILE_IMAGE_SIZES), webp=False):
+        """ 処理済みならサムネイル、処理中なら仮画像のURL """
+        name = self._image_name()
+        if not getattr(self, self.ready_field_name):
+            return default_storage.url(PROFILE_IMAGE_PLACEHOLDER)
+        if name == self._meta.get_field(self.image_field_name).get_default():
+            return default_storage.url(name)
+        return variant_url(name, size, webp)
+
+    @property
+    def image_url(self):
+        return self.thumbnail_url()
@@ -0,0 +1,160 @@
+import logging
+import smtplib
+import time
+import uuid
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.core.signing import dumps
+from django.utils import timezone
+
+from .mailtemplates import get_mail_template, get_mail_template_by_kind
+from .models import OutboundMail
+
+logger = logging.getLogger(__name__)
+
+# 送信に使うバックエンド(既定はEMAIL_BACKEND)
+MAIL_QUEUE_BACKEND = getattr(settings, 'MAIL_QUEUE_BACKEND', None)
+# 1回に送る件数
+MAIL_QUEUE_BATCH_SIZE = getattr(settings, 'MAIL_QUEUE_BATCH_SIZE', 100)
+# これを超えて失敗したら諦める
+MAIL_QUEUE_MAX_ATTEMPTS = getattr(settings, 'MAIL_QUEUE_MAX_ATTEMPTS', 5)
+# 再送までの待ち時間(秒)。失敗するたびに倍にする
+MAIL_QUEUE_RETRY_BASE = getattr(settings, 'MAIL_QUEUE_RETRY_BASE', 60)
+MAIL_QUEUE_RETRY_MAX = getattr(settings, 'MAIL_QUEUE_RETRY_MAX', 60 * 60)
+# ワーカーが取得したメールを他のワーカーが取らない時間(秒)
+MAIL_QUEUE_LEASE = getattr(settings, 'MAIL_QUEUE_LEASE', 5 * 60)
+
+# プロセス内の送信統計
+metrics = Counter()
+
+
+def enqueue(subject, body, to, from_email=None):
+    """ 送信待ちに追加する """
+    if isinstance(to, str):
+        to = [to]
+    mail = OutboundMail.objects.create(
+        subject=subject.strip(),
+        body=body,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        to='\n'.join(to),
+    )
+    metrics['queued'] += 1
+    return mail
+
+
+def enqueue_template(subject_template_name, body_template_name, context, to, from_email=None):
+    """ テンプレートを今描画して送信待ちに追加する """
+    subject, body = get_mail_template(subject_template_name, body_template_name).render_many([context])[0]
+    return enqueue(subject, body, to, from_email)
+
+
+def enqueue_many(mail_template, contexts, recipients, from_email=None, batch_size=1000):
+    """ 同じテンプレートのメールをまとめて描画し、bulk_createで送信待ちに追加する
+
+    contextsとrecipients(宛先のリスト)は同じ順番で渡す
+    """
+    from_email = from_email or settings.DEFAULT_FROM_EMAIL
+    mails = [
+        OutboundMail(subject=subject, body=body, from_email=from_email, to='\n'.join(to))
+        for (subject, body), to in zip(mail_template.render_many(contexts), recipients)
+    ]
+    OutboundMail.objects.bulk_create(mails, batch_size=batch_size)
+    metrics['queued'] += len(mails)
+    return len(mails)
+
+
+def enqueue_activation(users, protocol, domain, from_email=None):
+    """ 本登録用メールをまとめて送信待ちに追加する """
+    contexts = [{
+        'protocol': protocol,
+        'domain': domain,
+        'token': dumps(user.pk),
+        'user': user,
+    } for user in users]
+    return enqueue_many(get_mail_template_by_kind('create'), contexts, [[user.email] for user in users], from_email)
+
+
+def retry_delay(attempts):
+    return min(MAIL_QUEUE_RETRY_BASE * 2 ** (attempts - 1), MAIL_QUEUE_RETRY_MAX)
+
+
+def claim(batch_size):
+    """ 送信時刻になったメールをbatch_size件まで確保する """
+    now = timezone.now()
+    token = uuid.uuid4().hex
+    due = (OutboundMail.objects.filter(status=OutboundMail.Status.PENDING, next_attempt_at__lte=now)
+           .order_by('next_attempt_at', 'id').values_list('id', flat=True)[:batch_size])
+    OutboundMail.objects.filter(pk__in=list(due), status=OutboundMail.Status.PENDING,
+                                next_attempt_at__lte=now).update(
+        claim_token=token, next_attempt_at=now + timedelta(seconds=MAIL_QUEUE_LEASE))
+    return list(OutboundMail.objects.filter(claim_token=token).order_by('id'))
+
+
+def _failed(mail, error):
+    mail.attempts += 1
+    mail.last_error = f'{type(error).__name__}: {error}'
+    mail.claim_token = ''
+    if mail.attempts >= MAIL_QUEUE_MAX_ATTEMPTS:
+        mail.status = OutboundMail.Status.FAILED
+        metrics['failed'] += 1
+    else:
+        mail.next_attempt_at = timezone.now() + timedelta(seconds=retry_delay(mail.attempts))
+        metrics['retried'] += 1
+    mail.save(update_fields=['attempts', 'last_error', 'claim_token', 'status', 'next_attempt_at'])
+    logger.warning('mail %s failed (attempt %s): %s', mail.pk, mail.attempts, mail.last_error)
+
+
+def send_batch(batch_size=MAIL_QUEUE_BATCH_SIZE, connection=None):
+    """ 1つの接続を使い回してまとめて送信する。送信した件数を返す """
+    mails = claim(batch_size)
+    if not mails:
+        return 0
+
+    started = time.monotonic()
+    connection = connection or get_connection(MAIL_QUEUE_BACKEND)
+    sent = 0
+    sent_ids = []
+    try:
+        for mail in mails:
+            message = EmailMessage(mail.subject, mail.body, mail.from_email, mail.recipients,
+                                   connection=connection)
+            try:
+                connection.open()
+                message.send()
+            except Exception as error:
+                # 宛先やヘッダーの不備などで1通失敗しても、残りは送る
+                _failed(mail, error)
+                # smtplib.SMTPExceptionもOSErrorのサブクラス
+                if isinstance(error, smtplib.SMTPServerDisconnected) or (
+                        isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)):
+                    # 接続が切れたら次のメールで開き直す
+                    connection.close()
+                continue
+            sent_ids.append(mail.pk)
+            sent += 1
+    finally:
+        connection.close()
+        if sent_ids:
+            OutboundMail.objects.filter(pk__in=sent_ids).update(
+                status=OutboundMail.Status.SENT, sent_at=timezone.now(), claim_token='')
+
+    metrics['sent'] += sent
+    metrics['batches'] += 1
+    metrics['send_ms'] += int((time.monotonic() - started) * 1000)
+    return sent
+
+
+def send_queued(batch_size=MAIL_QUEUE_BATCH_SIZE, limit=None):
+    """ 送信待ちがなくなるまで(limit件まで)送る """
+    total = 0
+    while limit is None or total < limit:
+        size = batch_size if limit is None else min(batch_size, limit - total)
+        sent = send_batch(size)
+        if not sent and not OutboundMail.objects.filter(
+                status=OutboundMail.Status.PENDING, next_attempt_at__lte=timezone.now()).exists():
+            break
+        total += sent
+    return total
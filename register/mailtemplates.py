@@ -0,0 +1,70 @@
+import threading
+import time
+from collections import Counter
+
+from django.template.loader import get_template
+
+# 種類ごとの件名・本文テンプレート
+MAIL_TEMPLATES = {
+    'create': ('register/mail_template/create/subject.txt', 'register/mail_template/create/message.txt'),
+    'email_change': ('register/mail_template/email_change/subject.txt',
+                     'register/mail_template/email_change/message.txt'),
+    'password_reset': ('register/mail_template/password_reset/subject.txt',
+                       'register/mail_template/password_reset/message.txt'),
+}
+
+# 描画件数・時間などの統計
+counters = Counter()
+
+_templates = {}
+_lock = threading.Lock()
+
+
+def _compiled(name):
+    """ テンプレートはプロセス内で1回だけ読み込んでコンパイルする """
+    template = _templates.get(name)
+    if template is None:
+        with _lock:
+            template = _templates.get(name)
+            if template is None:
+                started = time.perf_counter()
+                template = get_template(name)
+                _templates[name] = template
+                counters['compiled'] += 1
+                counters['compile_us'] += int((time.perf_counter() - started) * 1_000_000)
+    return template
+
+
+class MailTemplate:
+    """ 件名と本文のテンプレートの組 """
+
+    def __init__(self, subject_template_name, body_template_name):
+        self.subject_template = _compiled(subject_template_name)
+        self.body_template = _compiled(body_template_name)
+
+    def render(self, context):
+        """ (件名, 本文)を返す。件名は1行にまとめる """
+        subject = ''.join(self.subject_template.render(context).splitlines())
+        return subject, self.body_template.render(context)
+
+    def render_many(self, contexts):
+        """ 複数の宛先分をまとめて描画する """
+        started = time.perf_counter()
+        rendered = [self.render(context) for context in contexts]
+        counters['rendered'] += len(rendered)
+        counters['render_us'] += int((time.perf_counter() - started) * 1_000_000)
+        return rendered
+
+
+def get_mail_template(subject_template_name, body_template_name):
+    return MailTemplate(subject_template_name, body_template_name)
+
+
+def get_mail_template_by_kind(kind):
+    return get_mail_template(*MAIL_TEMPLATES[kind])
+
+
+def clear():
+    """ テンプレートを変更した時など、キャッシュを捨てる """
+    with _lock:
+        _templates.clear()
@@ -0,0 +1,57 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from django.utils import timezone
+
+from register.images import PROFILE_IMAGE_SIZES, variant_name
+from register.models import ImageBlob, UploadImage, User
+
+
+class Command(BaseCommand):
+    """ 画像の参照数を数え直し、どこからも参照されていない画像を削除する """
+    help = 'Recount profile image references and delete unreferenced blobs and their thumbnails.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-seconds', type=int, default=60 * 60,
+                            help='Keep unreferenced blobs younger than this (uploads still being confirmed).')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be deleted.')
+
+    def handle(self, *args, **options):
+        # 参照数を数え直す
+        references = Counter()
+        for model, field in ((User, 'image'), (UploadImage, 'upload_img')):
+            for row in model.objects.order_by().values(field).annotate(n=Count('pk')):
+                references[row[field]] += row['n']
+
+        fixed = 0
+        for blob in ImageBlob.objects.only('pk', 'name', 'refcount').iterator():
+            refcount = references.get(blob.name, 0)
+            if blob.refcount != refcount:
+                fixed += 1
+                if not options['dry_run']:
+                    ImageBlob.objects.filter(pk=blob.pk).update(refcount=refcount)
+        self.stdout.write(f'corrected {fixed} reference counts')
+
+        # 参照されていない画像を削除する
+        cutoff = timezone.now() - timedelta(seconds=options['grace_seconds'])
+        garbage = ImageBlob.objects.filter(refcount=0, created_at__lt=cutoff)
+        if options['dry_run']:
+            garbage = [blob for blob in garbage if references.get(blob.name, 0) == 0]
+        deleted = freed = 0
+        for blob in garbage:
+            # 先に行を消し、その間に参照されて消せなかったものはファイルも残す
+            if not options['dry_run'] and not ImageBlob.objects.filter(pk=blob.pk, refcount=0).delete()[0]:
+                continue
+            names = [blob.name] + [variant_name(blob.name, size, webp)
+                                   for size in PROFILE_IMAGE_SIZES for webp in (False, True)]
+            for name in names:
+                if default_storage.exists(name):
+                    freed += default_storage.size(name)
+                    if not options['dry_run']:
+                        default_storage.delete(name)
+            deleted += 1
+        verb = 'would delete' if options['dry_run'] else 'deleted'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {deleted} blobs ({freed} bytes)'))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from register import images
+from register.models import UploadImage, User
+
+
+class Command(BaseCommand):
+    """ 処理待ちの画像のサムネイルを作る(既存の画像や、ワーカーで失敗した画像) """
+    help = 'Create thumbnails for profile images that are not processed yet.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        made = failed = 0
+        for model in (User, UploadImage):
+            field_name = model.image_field_name
+            pending = (model.objects.filter(**{model.ready_field_name: False})
+                       .only('pk', field_name).order_by('pk'))
+            last_pk = 0
+            while True:
+                chunk = list(pending.filter(pk__gt=last_pk)[:options['chunk_size']])
+                if not chunk:
+                    break
+                for instance in chunk:
+                    name = getattr(instance, field_name).name
+                    try:
+                        images.make_variants(name)
+                    except Exception as error:
+                        # 元画像がないものは仮画像のままにする
+                        failed += 1
+                        self.stderr.write(f'{model.__name__}(pk={instance.pk}) {name}: {error}')
+                        continue
+                    # 処理中に画像が差し替えられていれば、新しい画像の処理に任せる
+                    made += model.objects.filter(pk=instance.pk, **{field_name: name}).update(
+                        **{model.ready_field_name: True})
+                last_pk = chunk[-1].pk
+        self.stdout.write(self.style.SUCCESS(f'processed {made} images ({failed} failed)'))
@@ -0,0 +1,171 @@
+import json
+import os
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import router, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from register import mailqueue, storage
+from register.models import UploadImage
+
+User = get_user_model()
+
+
+def pending_users(cutoff):
+    """ 期限切れの仮登録ユーザー
+
+    退会したユーザーもis_active=Falseなので、一度もログインしていないものだけを対象にする。
+    メールを送り直したユーザーは送り直した時から数える
+    """
+    return User.objects.filter(
+        Q(activation_renotified_at__isnull=True) | Q(activation_renotified_at__lt=cutoff),
+        is_active=False, last_login__isnull=True, date_joined__lt=cutoff,
+    )
+
+
+def _references():
+    """ Userを参照している(モデル, フィールド)の一覧 """
+    for relation in User._meta.related_objects:
+        if relation.many_to_many:
+            yield relation.through, relation.field.m2m_reverse_field_name()
+        else:
+            yield relation.related_model, relation.field.name
+    for field in User._meta.many_to_many:
+        yield field.remote_field.through, field.m2m_field_name()
+
+
+def referenced_pks(pks):
+    """ pksのうち、他のテーブルから参照されているユーザーのpk """
+    referenced = set()
+    for model, field_name in _references():
+        remaining = pks - referenced
+        if not remaining:
+            break
+        attname = model._meta.get_field(field_name).attname
+        referenced.update(model._base_manager.filter(**{f'{attname}__in': remaining})
+                          .values_list(attname, flat=True).distinct())
+    return referenced
+
+
+def release_images(pks):
+    """ 削除するユーザーの画像の参照数を減らす """
+    references = Counter()
+    for model, field, lookup in ((User, 'image', 'pk__in'), (UploadImage, 'upload_img', 'user__in')):
+        default = model._meta.get_field(field).get_default()
+        rows = (model.objects.filter(**{lookup: pks}).exclude(**{field: default})
+                .order_by().values(field).annotate(n=Count('pk')))
+        for row in rows:
+            references[row[field]] += row['n']
+    for name, count in references.items():
+        storage.release(name, count)
+
+
+class Command(BaseCommand):
+    """ 期限切れの仮登録ユーザーを削除する(--renotifyなら本登録用メールを送り直す)
+
+    pkの順に一定件数ずつ処理し、1回のトランザクションは1チャンク分だけにするので、
+    userテーブルを長くロックしない。--state-fileを指定すると途中から再開できる
+    """
+    help = 'Purge (or re-notify) pending accounts older than ACTIVATION_TIMEOUT_SECONDS.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--renotify', action='store_true',
+                            help='Queue the activation mail again and restart the activation period.')
+        parser.add_argument('--timeout-seconds', type=int,
+                            default=getattr(settings, 'ACTIVATION_TIMEOUT_SECONDS', 60 * 60 * 24))
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--sleep', type=float, default=0, help='Seconds to wait between chunks.')
+        parser.add_argument('--start-after', type=int, default=0, help='Resume after this user pk.')
+        parser.add_argument('--state-file', help='Remember the last processed pk here and resume from it.')
+        parser.add_argument('--dry-run', action='store_true')
+        parser.add_argument('--domain', default='localhost:8000')
+        parser.add_argument('--protocol', default='https', choices=['http', 'https'])
+
+    def load_state(self, path, mode):
+        if not path or not os.path.exists(path):
+            return 0
+        with open(path) as f:
+            state = json.load(f)
+        if state.get('mode') != mode:
+            raise CommandError(f'{path} was written by --{state.get("mode")}, not --{mode}')
+        return state['last_pk']
+
+    def save_state(self, path, mode, last_pk):
+        if not path:
+            return
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'mode': mode, 'last_pk': last_pk}, f)
+        os.replace(tmp_path, path)
+
+    def handle(self, *args, **options):
+        mode = 'renotify' if options['renotify'] else 'purge'
+        state_file = options['state_file']
+        last_pk = max(options['start_after'], self.load_state(state_file, mode))
+        cutoff = timezone.now() - timedelta(seconds=options['timeout_seconds'])
+        users = pending_users(cutoff).order_by('pk')
+
+        started = time.perf_counter()
+        seen = done = 0
+        while True:
+            pks = list(users.filter(pk__gt=last_pk).values_list('pk', flat=True)[:options['chunk_size']])
+            if not pks:
+                break
+            seen += len(pks)
+            if not options['dry_run']:
+                if options['renotify']:
+                    done += self.renotify(cutoff, pks, options['protocol'], options['domain'])
+                else:
+                    done += self.purge(cutoff, pks)
+            last_pk = pks[-1]
+            self.save_state(state_file, mode, last_pk)
+
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f'{mode}: {done}/{seen} users (last pk {last_pk}, {seen / elapsed:.0f}/s)')
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        if state_file and os.path.exists(state_file):
+            os.remove(state_file)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'{mode}: {done} of {seen} expired pending users in {elapsed:.2f}s'
+            + (' (dry run)' if options['dry_run'] else '')))
+
+    def purge(self, cutoff, pks):
+        """ 参照されていないユーザーはDELETE1回で、それ以外は通常のdelete()で消す """
+        using = router.db_for_write(User)
+        with transaction.atomic(using=using):
+            # 処理中に本登録されたユーザーは消さない
+            pks = set(pending_users(cutoff).filter(pk__in=pks).select_for_update()
+                      .values_list('pk', flat=True))
+            if not pks:
+                return 0
+            release_images(pks)
+            referenced = referenced_pks(pks)
+            raw = pks - referenced
+            deleted = 0
+            if raw:
+                deleted += User.objects.filter(pk__in=raw)._raw_delete(using)
+            if referenced:
+                # UploadImageなどを連鎖削除する
+                _, per_model = User.objects.filter(pk__in=referenced).delete()
+                deleted += per_model.get(User._meta.label, 0)
+        return deleted
+
+    def renotify(self, cutoff, pks, protocol, domain):
+        """ メールを送り直し、activation_renotified_atを今にして本登録の期限を延ばす """
+        using = router.db_for_write(User)
+        with transaction.atomic(using=using):
+            chunk = list(pending_users(cutoff).filter(pk__in=pks).select_for_update()
+                         .only('pk', 'email', 'account_name'))
+            if not chunk:
+                return 0
+            User.objects.filter(pk__in=[user.pk for user in chunk]).update(activation_renotified_at=timezone.now())
+            return mailqueue.enqueue_activation(chunk, protocol, domain)
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from register import mailqueue
+
+
+class Command(BaseCommand):
+    """ 送信待ちメールを送るワーカー """
+    help = 'Deliver queued outbound mail in batches over a reused connection.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=mailqueue.MAIL_QUEUE_BATCH_SIZE)
+        parser.add_argument('--loop', action='store_true', help='Keep polling the queue.')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds to sleep between polls.')
+
+    def handle(self, *args, **options):
+        while True:
+            sent = mailqueue.send_queued(options['batch_size'])
+            if sent:
+                self.stdout.write(f'sent {sent} mails')
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS(
+            ' '.join(f'{key}={value}' for key, value in sorted(mailqueue.metrics.items()))))
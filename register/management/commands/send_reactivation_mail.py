@@ -0,0 +1,38 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from register import mailqueue, mailtemplates
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    """ 本登録していないユーザーへ本登録用メールを送り直す(送信待ちに追加する) """
+    help = 'Queue activation mail again for every inactive user.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--domain', default='localhost:8000')
+        parser.add_argument('--protocol', default='https', choices=['http', 'https'])
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        users = (User.objects.filter(is_active=False)
+                 .only('pk', 'email', 'account_name').order_by('pk'))
+        started = time.perf_counter()
+        total = 0
+        last_pk = 0
+        while True:
+            chunk = list(users.filter(pk__gt=last_pk)[:options['chunk_size']])
+            if not chunk:
+                break
+            total += mailqueue.enqueue_activation(chunk, options['protocol'], options['domain'])
+            last_pk = chunk[-1].pk
+            self.stdout.write(f'queued {total} mails')
+
+        elapsed = time.perf_counter() - started
+        rate = total / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'queued {total} mails in {elapsed:.2f}s ({rate:.0f}/s); '
+            + ' '.join(f'{key}={value}' for key, value in sorted(mailtemplates.counters.items()))))
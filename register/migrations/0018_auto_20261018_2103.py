@@ -0,0 +1,39 @@
+# Generated by Django 3.1.6 on 2026-10-18 12:03
+
+from django.db import migrations, models
+import register.models
+
+from project.counters import Recount
+
+
+def fill_follow_counts(apps, schema_editor):
+    User = apps.get_model('register', 'User')
+    Follow = apps.get_model('relationship', 'Follow')
+    Recount(User, follows_count=(Follow, 'user'), followers_count=(Follow, 'follow_user')).fill()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('register', '0017_auto_20210227_0157'),
+        ('relationship', '0012_auto_20261018_2102'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='followers count'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='follows_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='follows count'),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='image',
+            field=models.ImageField(default='media/profile_pics/default.png', upload_to=register.models.user_img_upload_to, validators=[register.models.validate_is_picture]),
+        ),
+        migrations.RunPython(fill_follow_counts, migrations.RunPython.noop),
+    ]
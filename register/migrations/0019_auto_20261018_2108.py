@@ -0,0 +1,29 @@
+# Generated by Django 3.1.6 on 2026-10-18 12:08
+
+from django.db import migrations, models
+import register.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('register', '0018_auto_20261018_2103'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadimage',
+            name='upload_img_ready',
+            field=models.BooleanField(default=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='image_ready',
+            field=models.BooleanField(default=True, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='image',
+            field=models.ImageField(default='media/profile_pics/default.png', upload_to=register.models.user_img_upload_to, validators=[register.models.validate_is_picture]),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 3.1.6 on 2026-10-18 12:10
+
+from django.db import migrations, models
+import register.models
+import register.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('register', '0019_auto_20261018_2108'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageBlob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('sha256', models.CharField(max_length=64)),
+                ('size', models.PositiveIntegerField(default=0)),
+                ('refcount', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'image_blob',
+                'verbose_name_plural': 'ImageBlob',
+            },
+        ),
+        migrations.AlterField(
+            model_name='uploadimage',
+            name='upload_img',
+            field=models.ImageField(default='media/profile_pics/default.png', storage=register.storage.ContentAddressedStorage(), upload_to=register.models.user_img_upload_to, validators=[register.models.validate_is_picture]),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='image',
+            field=models.ImageField(default='media/profile_pics/default.png', storage=register.storage.ContentAddressedStorage(), upload_to=register.models.user_img_upload_to, validators=[register.models.validate_is_picture]),
+        ),
+        migrations.AddIndex(
+            model_name='imageblob',
+            index=models.Index(fields=['refcount', 'created_at'], name='imageblob_refcount_idx'),
+        ),
+    ]
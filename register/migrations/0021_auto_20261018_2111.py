@@ -0,0 +1,50 @@
+# Generated by Django 3.1.6 on 2026-10-18 12:11
+
+from django.db import migrations, models
+import django.utils.timezone
+import register.models
+import register.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('register', '0020_auto_20261018_2110'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboundMail',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.CharField(max_length=255)),
+                ('body', models.TextField()),
+                ('from_email', models.CharField(blank=True, max_length=254)),
+                ('to', models.TextField()),
+                ('status', models.CharField(choices=[('pending', '送信待ち'), ('sent', '送信済み'), ('failed', '送信失敗')], default='pending', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('claim_token', models.CharField(blank=True, max_length=32)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'outbound_mail',
+                'verbose_name_plural': 'OutboundMail',
+            },
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='image',
+            field=models.ImageField(default='media/profile_pics/default.png', storage=register.storage.ContentAddressedStorage(), upload_to=register.models.user_img_upload_to, validators=[register.models.validate_is_picture]),
+        ),
+        migrations.AddIndex(
+            model_name='outboundmail',
+            index=models.Index(fields=['status', 'next_attempt_at'], name='outboundmail_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='outboundmail',
+            index=models.Index(fields=['claim_token'], name='outboundmail_claim_idx'),
+        ),
+    ]
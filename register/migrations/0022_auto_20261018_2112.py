@@ -0,0 +1,24 @@
+# Generated by Django 3.1.6 on 2026-10-18 12:12
+
+from django.db import migrations, models
+import register.models
+import register.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('register', '0021_auto_20261018_2111'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='image',
+            field=models.ImageField(default='media/profile_pics/default.png', storage=register.storage.ContentAddressedStorage(), upload_to=register.models.user_img_upload_to, validators=[register.models.validate_is_picture]),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['is_active', 'date_joined'], name='user_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations
+
+
+def mark_unprocessed(apps, schema_editor):
+    """ サムネイルを作る前の画像を処理待ちにする(make_profile_thumbnailsで作成する) """
+    for model_name, field_name, ready_field_name in (('User', 'image', 'image_ready'),
+                                                     ('UploadImage', 'upload_img', 'upload_img_ready')):
+        model = apps.get_model('register', model_name)
+        default = model._meta.get_field(field_name).get_default()
+        model.objects.exclude(**{field_name: default}).exclude(**{field_name: ''}).update(**{ready_field_name: False})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('register', '0022_auto_20261018_2112'),
+    ]
+
+    operations = [
+        migrations.RunPython(mark_unprocessed, migrations.RunPython.noop),
+    ]
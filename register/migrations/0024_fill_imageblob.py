@@ -0,0 +1,44 @@
+import hashlib
+from collections import Counter
+
+from django.core.files.storage import default_storage
+from django.db import migrations
+from django.db.models import Count
+
+
+def fill_image_blobs(apps, schema_editor):
+    """ 内容のハッシュで保存する前の画像もImageBlobに記録し、参照数を数える(ファイルはそのまま) """
+    ImageBlob = apps.get_model('register', 'ImageBlob')
+    references = Counter()
+    for model_name, field_name in (('User', 'image'), ('UploadImage', 'upload_img')):
+        model = apps.get_model('register', model_name)
+        default = model._meta.get_field(field_name).get_default()
+        rows = (model.objects.exclude(**{field_name: default}).exclude(**{field_name: ''})
+                .order_by().values(field_name).annotate(n=Count('pk')))
+        for row in rows:
+            references[row[field_name]] += row['n']
+
+    known = set(ImageBlob.objects.filter(name__in=references).values_list('name', flat=True))
+    blobs = []
+    for name, refcount in references.items():
+        # 元画像のないものは記録しない(削除するファイルもない)
+        if name in known or not default_storage.exists(name):
+            continue
+        digest = hashlib.sha256()
+        with default_storage.open(name) as file:
+            for chunk in file.chunks():
+                digest.update(chunk)
+        blobs.append(ImageBlob(name=name, sha256=digest.hexdigest(), size=default_storage.size(name),
+                               refcount=refcount))
+    ImageBlob.objects.bulk_create(blobs, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('register', '0023_mark_images_unprocessed'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_image_blobs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.6 on 2026-10-18 13:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('register', '0024_fill_imageblob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='activation_renotified_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
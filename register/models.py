@@ -10,7 +10,8 @@ from django.contrib.auth.base_user import AbstractBaseUser
 from django.utils.translation import ugettext_lazy as _
 from django.utils import timezone
 
-from PIL import Image
+from .images import ImagePipelineMixin
+from .storage import profile_image_storage
 
 
 class CustomUserManager(UserManager):
@@ -59,15 +60,23 @@ def validate_is_picture(value):
         raise ValidationError('「.jpg」・「.png」。「jpeg」のみ可能です」')
 
 
-class User(AbstractBaseUser, PermissionsMixin):
+class User(ImagePipelineMixin, AbstractBaseUser, PermissionsMixin):
     """カスタムユーザーモデル:emailアドレスをユーザー名として使う"""
     email = models.EmailField(_('email address'), unique=True)
     first_name = models.CharField(_('first name'), max_length=30, blank=True)
     last_name = models.CharField(_('last name'), max_length=150, blank=True)
     account_name = models.CharField(_('account name'), unique=True, blank=True, null=True, max_length=30)
-    image = models.ImageField(default='media/profile_pics/default.png', upload_to=user_img_upload_to, validators=[validate_is_picture])
+    image = models.ImageField(default='media/profile_pics/default.png', upload_to=user_img_upload_to,
+                              storage=profile_image_storage, validators=[validate_is_picture])
+    # サムネイル作成が終わるまでFalse(その間は仮画像を表示する)
+    image_ready = models.BooleanField(default=True, editable=False)
     job = models.CharField(max_length=30, null=True, blank=True,)
     date_joined = models.DateTimeField(_('date joined'), default=timezone.now)
+    # purge_pending_accounts --renotifyで本登録用メールを送り直した日時(本登録の期限はここから数える)
+    activation_renotified_at = models.DateTimeField(null=True, blank=True, editable=False)
+    # フォロー数・フォロワー数(Followの作成・削除時に更新する)
+    follows_count = models.PositiveIntegerField(_('follows count'), default=0)
+    followers_count = models.PositiveIntegerField(_('followers count'), default=0)
 
     is_staff = models.BooleanField(
         _('staff status'),
@@ -93,6 +102,10 @@ class User(AbstractBaseUser, PermissionsMixin):
     class Meta:
         verbose_name = _('user')
         verbose_name_plural = _('users')
+        indexes = [
+            # 期限切れの仮登録ユーザーを探すため
+            models.Index(fields=['is_active', 'date_joined'], name='user_pending_idx'),
+        ]
 
     def get_full_name(self):
         """Return the first_name plus the last_name, with a space in
@@ -108,15 +121,6 @@ class User(AbstractBaseUser, PermissionsMixin):
         """Send an email to this user."""
         send_mail(subject, message, from_email, [self.email], **kwargs)
 
-    def save(self, *args, **kwargs):
-        """ 画像のリサイズ """
-        super().save()
-        img = Image.open(self.image.path)
-        if img.height > 200 or img.width > 200:
-            output_size = (200, 200)
-            img.thumbnail(output_size)
-            img.save(self.image.path)
-
     @property
     def username(self):
         return self.email
@@ -132,23 +136,75 @@ def user_img_upload_to(instance, filename):
     return f'{saved_path}{hs_filename}'
 
 
-class UploadImage(models.Model):
+class UploadImage(ImagePipelineMixin, models.Model):
     """ アップロード画像 """
     user = models.OneToOneField(User, related_name='upload', on_delete=models.CASCADE)
-    upload_img = models.ImageField(default='media/profile_pics/default.png', upload_to=user_img_upload_to, validators=[validate_is_picture])
+    upload_img = models.ImageField(default='media/profile_pics/default.png', upload_to=user_img_upload_to,
+                                   storage=profile_image_storage, validators=[validate_is_picture])
+    upload_img_ready = models.BooleanField(default=True, editable=False)
+
+    image_field_name = 'upload_img'
+    ready_field_name = 'upload_img_ready'
 
     class Meta:
         verbose_name = "profile_image_upload"
         verbose_name_plural = "ProfileImageUpload"
 
-    def save(self, *args, **kwargs):
-        """ 画像のリサイズ """
-        super().save()
-        img = Image.open(self.upload_img.path)
-        if img.height > 200 or img.width > 200:
-            output_size = (200, 200)
-            img.thumbnail(output_size)
-            img.save(self.upload_img.path)
+    def __str__(self):
+        return str(self.user)
+
+
+class ImageBlob(models.Model):
+    """ 内容のハッシュで保存したプロフィール画像と参照数 """
+    name = models.CharField(max_length=255, unique=True)
+    sha256 = models.CharField(max_length=64)
+    size = models.PositiveIntegerField(default=0)
+    refcount = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "image_blob"
+        verbose_name_plural = "ImageBlob"
+        indexes = [
+            models.Index(fields=['refcount', 'created_at'], name='imageblob_refcount_idx'),
+        ]
 
     def __str__(self):
-        return str(self.user)
\ No newline at end of file
+        return self.name
+
+
+class OutboundMail(models.Model):
+    """ 送信待ちメール(リクエスト内では本文を作って保存するだけ) """
+
+    class Status(models.TextChoices):
+        PENDING = 'pending', '送信待ち'
+        SENT = 'sent', '送信済み'
+        FAILED = 'failed', '送信失敗'
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254, blank=True)
+    # 宛先は改行区切り
+    to = models.TextField()
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claim_token = models.CharField(max_length=32, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        verbose_name = "outbound_mail"
+        verbose_name_plural = "OutboundMail"
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outboundmail_due_idx'),
+            models.Index(fields=['claim_token'], name='outboundmail_claim_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.to}：{self.subject}'
+
+    @property
+    def recipients(self):
+        return [address for address in self.to.splitlines() if address]
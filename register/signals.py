@@ -0,0 +1,24 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from project import pagecache
+
+from .images import image_processed
+from .models import User
+
+# 相談一覧などのページに出しているユーザーのフィールド
+PAGE_FIELDS = {'account_name', 'image', 'image_ready'}
+
+
+@receiver(post_save, sender=User, dispatch_uid='user_invalidate_pages')
+def invalidate_user_pages(sender, created, update_fields=None, **kwargs):
+    """ 作成時とlast_loginだけの更新などはページに関係ないので無効にしない """
+    if created or (update_fields is not None and not PAGE_FIELDS & set(update_fields)):
+        return
+    pagecache.invalidate('user')
+
+
+@receiver(image_processed, sender=User, dispatch_uid='user_image_invalidate_pages')
+def invalidate_user_image_pages(sender, **kwargs):
+    # 仮画像からサムネイルに変わる
+    pagecache.invalidate('user')
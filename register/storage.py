@@ -0,0 +1,77 @@
+import hashlib
+import os
+import tempfile
+
+from django.apps import apps
+from django.core.files.storage import FileSystemStorage
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+# 画像本体を置くディレクトリ
+PROFILE_IMAGE_DIR = 'media/profile_pics/'
+
+
+def _blob_model():
+    return apps.get_model('register', 'ImageBlob')
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """ 内容のSHA-256をファイル名にして、同じ画像は1つだけ保存するストレージ
+
+    media/profile_pics/ab/abcdef....jpg のように保存し、ImageBlobに記録する
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # 同名 = 同じ内容なので、別名にする必要はない
+        return name
+
+    def _save(self, name, content):
+        ext = os.path.splitext(name)[1].lower()
+        tmp_dir = self.path(os.path.join(PROFILE_IMAGE_DIR, 'tmp'))
+        os.makedirs(tmp_dir, exist_ok=True)
+
+        # 書き込みながらハッシュを計算する
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    tmp.write(chunk)
+                    size += len(chunk)
+            sha256 = digest.hexdigest()
+            blob_name = f'{PROFILE_IMAGE_DIR}{sha256[:2]}/{sha256}{ext}'
+            # 行を先に作る。gc_profile_imagesが行を消した後なら、消されたファイルも置き直す
+            _, created = _blob_model().objects.get_or_create(name=blob_name, defaults={'sha256': sha256, 'size': size})
+            full_path = self.path(blob_name)
+            if not created and os.path.exists(full_path):
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                os.replace(tmp_path, full_path)
+                if self.file_permissions_mode is not None:
+                    os.chmod(full_path, self.file_permissions_mode)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return blob_name
+
+
+profile_image_storage = ContentAddressedStorage()
+
+
+def retain(name):
+    """ 画像の参照数を1増やす """
+    if name:
+        _blob_model().objects.filter(name=name).update(refcount=F('refcount') + 1)
+
+
+def release(name, count=1):
+    """ 画像の参照数をcount減らす(0になったものはgc_profile_imagesで消す) """
+    if name:
+        _blob_model().objects.filter(name=name, refcount__gte=count).update(refcount=F('refcount') - count)
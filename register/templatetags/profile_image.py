@@ -0,0 +1,15 @@
+from django import template
+
+register = template.Library()
+
+
+@register.filter
+def thumbnail(user, size):
+    """ {{ user|thumbnail:48 }} 指定サイズのプロフィール画像URL """
+    return user.thumbnail_url(int(size))
+
+
+@register.filter
+def thumbnail_webp(user, size):
+    """ {{ user|thumbnail_webp:48 }} 指定サイズのWebP画像URL """
+    return user.thumbnail_url(int(size), webp=True)
@@ -1,3 +1,451 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import smtplib
+import tempfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.tokens import default_token_generator
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.core.signing import dumps, loads
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.urls import reverse
+from django.utils.http import urlsafe_base64_encode
+
+from PIL import Image
+
+from project.testing import QueryBudgetTestCase, create_user
+from relationship import intimates
+
+from . import images, mailqueue, mailtemplates
+from .models import ImageBlob, OutboundMail, UploadImage, User
+
+
+class QueryCountTests(QueryBudgetTestCase):
+    query_budgets = {
+        'register:top': 2,
+        'register:login': 2,
+        'register:logout': 4,
+        'register:user_create': 2,
+        'register:user_create_done': 2,
+        'register:user_create_complete': 5,
+        'register:user_detail': 7,
+        'register:user_update': 3,
+        'register:upload_image': 3,
+        'register:confirm_image': 3,
+        'register:password_change': 2,
+        'register:password_change_done': 2,
+        'register:password_reset': 2,
+        'register:password_reset_done': 2,
+        'register:password_reset_confirm': 5,
+        'register:password_reset_complete': 2,
+        'register:email_change': 2,
+        'register:email_change_done': 2,
+        'register:email_change_complete': 4,
+    }
+
+    def setUp(self):
+        super().setUp()
+        self.users = 0
+
+    def new_user(self):
+        self.users += 1
+        return create_user(f'user{self.users}')
+
+    def test_static_pages(self):
+        for name in ('register:top', 'register:login', 'register:user_create', 'register:user_create_done',
+                     'register:password_change', 'register:password_change_done', 'register:password_reset',
+                     'register:password_reset_done', 'register:password_reset_complete', 'register:email_change',
+                     'register:email_change_done'):
+            with self.subTest(name):
+                self.assertQueryBudget(name)
+
+    def test_logout(self):
+        # LOGOUT_REDIRECT_URLへリダイレクトする
+        self.assertQueryBudget('register:logout', status=302)
+
+    def test_user_create_complete(self):
+        user = User.objects.create_user('pending@example.com', 'password', account_name='pending', is_active=False)
+        self.assertQueryBudget('register:user_create_complete', args=[dumps(user.pk)])
+
+    def test_user_detail(self):
+        def grow(count):
+            for _ in range(count):
+                # 承認待ち・リクエスト中・親しい友達・拒否したユーザーを1人ずつ
+                pending, requested, friend, rejected = (self.new_user() for _ in range(4))
+                intimates.send_request(pending, self.user)
+                intimates.send_request(self.user, requested)
+                intimates.send_request(friend, self.user)
+                intimates.approve(self.user, friend)
+                intimates.send_request(rejected, self.user)
+                intimates.reject(self.user, rejected)
+        self.assertQueryBudget('register:user_detail', args=[self.user.pk], grow=grow)
+
+    def test_user_update(self):
+        self.assertQueryBudget('register:user_update', args=[self.user.pk])
+
+    def test_upload_image(self):
+        self.assertQueryBudget('register:upload_image', args=[UploadImage.objects.get(user=self.user).pk])
+
+    def test_confirm_image(self):
+        self.assertQueryBudget('register:confirm_image', args=[self.user.pk])
+
+    def test_password_reset_confirm(self):
+        uid = urlsafe_base64_encode(force_bytes(self.user.pk))
+        token = default_token_generator.make_token(self.user)
+        # 正しいtokenはセッションに移して入力ページへリダイレクトする
+        self.assertQueryBudget('register:password_reset_confirm', args=[uid, token], status=302)
+
+    def test_email_change_complete(self):
+        self.assertQueryBudget('register:email_change_complete', args=[dumps('changed@example.com')])
+
+
+class MediaMixin:
+    """ 画像を一時ディレクトリへ保存する """
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def write_image(self, name, color='red'):
+        path = default_storage.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        Image.new('RGB', (300, 300), color).save(path, 'PNG')
+        return name
+
+    def upload(self, color='red'):
+        content = BytesIO()
+        Image.new('RGB', (300, 300), color).save(content, 'PNG')
+        return SimpleUploadedFile('upload.png', content.getvalue(), content_type='image/png')
+
+
+class ProfileThumbnailTests(MediaMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = create_user('owner')
+
+    def make_thumbnails(self):
+        call_command('make_profile_thumbnails', stdout=StringIO(), stderr=StringIO())
+        self.user.refresh_from_db()
+
+    def test_existing_image_shows_placeholder_until_processed(self):
+        # サムネイルを作る前にアップロードされた画像(マイグレーションで処理待ちにしたもの)
+        name = self.write_image('media/profile_pics/1_legacy.png')
+        User.objects.filter(pk=self.user.pk).update(image=name, image_ready=False)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.image_url, default_storage.url(images.PROFILE_IMAGE_PLACEHOLDER))
+
+        self.make_thumbnails()
+        self.assertTrue(self.user.image_ready)
+        self.assertEqual(self.user.thumbnail_url(96), default_storage.url(images.variant_name(name, 96)))
+        for size in images.PROFILE_IMAGE_SIZES:
+            self.assertTrue(default_storage.exists(images.variant_name(name, size, webp=True)))
+
+    def test_missing_image_stays_placeholder(self):
+        User.objects.filter(pk=self.user.pk).update(image='media/profile_pics/1_missing.png', image_ready=False)
+        self.make_thumbnails()
+        self.assertFalse(self.user.image_ready)
+        self.assertEqual(self.user.image_url, default_storage.url(images.PROFILE_IMAGE_PLACEHOLDER))
+
+
+class ImageRefcountTests(MediaMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.users = [create_user(f'user{i}') for i in range(2)]
+
+    def set_image(self, user, file):
+        user.image = file
+        user.save()
+        return user.image.name
+
+    def refcounts(self):
+        return dict(ImageBlob.objects.values_list('name', 'refcount'))
+
+    def gc(self, *args):
+        call_command('gc_profile_images', *args, stdout=StringIO())
+
+    def test_same_content_is_stored_once(self):
+        names = {self.set_image(user, self.upload()) for user in self.users}
+        self.assertEqual(len(names), 1)
+        name, = names
+        self.assertEqual(self.refcounts(), {name: 2})
+        self.assertEqual(os.listdir(os.path.dirname(default_storage.path(name))), [os.path.basename(name)])
+
+    def test_replacing_image_releases_old_blob(self):
+        old = self.set_image(self.users[0], self.upload('red'))
+        new = self.set_image(self.users[0], self.upload('blue'))
+        self.assertEqual(self.refcounts(), {old: 0, new: 1})
+
+    def test_gc_deletes_unreferenced_blobs_after_grace(self):
+        old = self.set_image(self.users[0], self.upload('red'))
+        new = self.set_image(self.users[0], self.upload('blue'))
+        self.gc()
+        # 猶予期間中は残す
+        self.assertTrue(default_storage.exists(old))
+        ImageBlob.objects.update(created_at=timezone.now() - timedelta(days=1))
+        self.gc()
+        self.assertEqual(self.refcounts(), {new: 1})
+        self.assertFalse(default_storage.exists(old))
+        self.assertTrue(default_storage.exists(new))
+
+    def test_gc_recounts_before_deleting(self):
+        name = self.set_image(self.users[0], self.upload())
+        ImageBlob.objects.update(refcount=0, created_at=timezone.now() - timedelta(days=1))
+        self.gc()
+        self.assertEqual(self.refcounts(), {name: 1})
+        self.assertTrue(default_storage.exists(name))
+
+    def test_reupload_after_gc_restores_file(self):
+        name = self.set_image(self.users[0], self.upload())
+        self.set_image(self.users[0], self.upload('blue'))
+        ImageBlob.objects.update(created_at=timezone.now() - timedelta(days=1))
+        self.gc()
+        self.assertEqual(self.set_image(self.users[1], self.upload()), name)
+        self.assertTrue(default_storage.exists(name))
+        self.assertEqual(self.refcounts()[name], 1)
+
+
+class ImageBlobMigrationTests(MediaMixin, TransactionTestCase):
+    """ 内容のハッシュで保存する前の画像をImageBlobに記録する """
+    before = ('register', '0023_mark_images_unprocessed')
+    after = ('register', '0024_fill_imageblob')
+
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate([target])
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes('register')[0])
+
+    def test_existing_images_are_counted(self):
+        # 今のモデルで作ってから戻す(後のマイグレーションで足した列がなくなる)
+        users = [create_user(f'user{i}') for i in range(3)]
+        self.migrate(self.before)
+        legacy = self.write_image('media/profile_pics/1_legacy.png')
+        User.objects.filter(pk__in=[users[0].pk, users[1].pk]).update(image=legacy)
+        UploadImage.objects.filter(user=users[2]).update(upload_img=legacy)
+        User.objects.filter(pk=users[2].pk).update(image='media/profile_pics/2_missing.png')
+
+        self.migrate(self.after)
+        blob = ImageBlob.objects.get()
+        self.assertEqual((blob.name, blob.refcount, blob.size), (legacy, 3, default_storage.size(legacy)))
+
+
+class FlakyBackend(BaseEmailBackend):
+    """ failuresに宛先と例外を登録すると、その宛先への送信で例外を出す """
+
+    def __init__(self, failures=None, **kwargs):
+        super().__init__(**kwargs)
+        self.failures = failures or {}
+        self.sent = []
+        self.closed = 0
+
+    def close(self):
+        self.closed += 1
+
+    def send_messages(self, messages):
+        for message in messages:
+            error = self.failures.get(message.to[0])
+            if error is not None:
+                raise error
+            self.sent.append(message.to[0])
+        return len(messages)
+
+
+class MailQueueTests(TestCase):
+
+    def enqueue(self, *recipients):
+        return [mailqueue.enqueue('件名', '本文', to) for to in recipients]
+
+    def send(self, **failures):
+        backend = FlakyBackend({f'{name}@example.com': error for name, error in failures.items()})
+        sent = mailqueue.send_batch(connection=backend)
+        return sent, backend
+
+    def reload(self, mails):
+        return [OutboundMail.objects.get(pk=mail.pk) for mail in mails]
+
+    def test_send_batch(self):
+        mails = self.enqueue('a@example.com', 'b@example.com')
+        sent, backend = self.send()
+        self.assertEqual(sent, 2)
+        self.assertEqual(backend.sent, ['a@example.com', 'b@example.com'])
+        self.assertEqual({mail.status for mail in self.reload(mails)}, {OutboundMail.Status.SENT})
+        # 送信済みは取り直さない
+        self.assertEqual(self.send()[0], 0)
+
+    def test_failure_is_retried_with_backoff(self):
+        mail, = self.enqueue('a@example.com')
+        before = timezone.now()
+        self.send(a=smtplib.SMTPRecipientsRefused({}))
+        mail, = self.reload([mail])
+        self.assertEqual((mail.status, mail.attempts), (OutboundMail.Status.PENDING, 1))
+        self.assertIn('SMTPRecipientsRefused', mail.last_error)
+        self.assertGreaterEqual(mail.next_attempt_at, before + timedelta(seconds=mailqueue.MAIL_QUEUE_RETRY_BASE))
+        # 待ち時間が過ぎるまでは送らない
+        self.assertEqual(self.send()[0], 0)
+
+    def test_retry_delay_doubles_up_to_max(self):
+        delays = [mailqueue.retry_delay(attempts) for attempts in range(1, 20)]
+        self.assertEqual(delays[:3], [mailqueue.MAIL_QUEUE_RETRY_BASE * 2 ** i for i in range(3)])
+        self.assertEqual(delays[-1], mailqueue.MAIL_QUEUE_RETRY_MAX)
+        self.assertEqual(delays, sorted(delays))
+
+    def test_gives_up_after_max_attempts(self):
+        mail, = self.enqueue('a@example.com')
+        for _ in range(mailqueue.MAIL_QUEUE_MAX_ATTEMPTS):
+            OutboundMail.objects.filter(pk=mail.pk).update(next_attempt_at=timezone.now())
+            self.send(a=smtplib.SMTPDataError(554, 'rejected'))
+        mail, = self.reload([mail])
+        self.assertEqual((mail.status, mail.attempts), (OutboundMail.Status.FAILED, mailqueue.MAIL_QUEUE_MAX_ATTEMPTS))
+
+    def test_one_bad_message_does_not_stop_the_batch(self):
+        mails = self.enqueue('a@example.com', 'b@example.com', 'c@example.com')
+        sent, backend = self.send(b=ValueError('bad header'))
+        self.assertEqual(sent, 2)
+        self.assertEqual(backend.sent, ['a@example.com', 'c@example.com'])
+        self.assertEqual([mail.status for mail in self.reload(mails)],
+                         [OutboundMail.Status.SENT, OutboundMail.Status.PENDING, OutboundMail.Status.SENT])
+
+    def test_reconnects_after_disconnect(self):
+        self.enqueue('a@example.com', 'b@example.com')
+        sent, backend = self.send(a=smtplib.SMTPServerDisconnected())
+        self.assertEqual(sent, 1)
+        # 切断された時と最後の2回
+        self.assertEqual(backend.closed, 2)
+
+    def test_claimed_mail_is_not_claimed_again(self):
+        self.enqueue('a@example.com')
+        self.assertEqual(len(mailqueue.claim(10)), 1)
+        self.assertEqual(mailqueue.claim(10), [])
+
+
+class MailTemplateTests(TestCase):
+
+    def setUp(self):
+        mailtemplates.clear()
+        self.addCleanup(mailtemplates.clear)
+        self.users = [User.objects.create_user(f'pending{i}@example.com', 'password', account_name=f'pending{i}',
+                                               is_active=False) for i in range(3)]
+
+    def test_templates_are_compiled_once(self):
+        with mock.patch.object(mailtemplates, 'get_template', wraps=mailtemplates.get_template) as get_template:
+            for _ in range(3):
+                mailtemplates.get_mail_template_by_kind('create')
+        self.assertEqual(get_template.call_count, 2)
+
+    def test_render_many_renders_each_context(self):
+        contexts = [{'protocol': 'https', 'domain': 'example.com', 'token': dumps(user.pk), 'user': user}
+                    for user in self.users]
+        rendered = mailtemplates.get_mail_template_by_kind('create').render_many(contexts)
+        self.assertEqual(len(rendered), len(self.users))
+        for (subject, body), context in zip(rendered, contexts):
+            self.assertNotIn('\n', subject)
+            self.assertIn(context['user'].email, body)
+            url = reverse('register:user_create_complete', args=[context['token']])
+            self.assertIn(f'https://example.com{url}', body)
+
+    def test_enqueue_activation_inserts_in_one_query(self):
+        # テンプレートを読み込んでおく
+        mailtemplates.get_mail_template_by_kind('create')
+        with self.assertNumQueries(1):
+            self.assertEqual(mailqueue.enqueue_activation(self.users, 'https', 'example.com'), len(self.users))
+        mails = OutboundMail.objects.order_by('id')
+        self.assertEqual([mail.to for mail in mails], [user.email for user in self.users])
+        for mail, user in zip(mails, self.users):
+            token = mail.body.rsplit('/user_create/complete/', 1)[1].split('/')[0]
+            self.assertEqual(loads(token), user.pk)
+
+    def test_send_reactivation_mail_walks_every_inactive_user(self):
+        create_user('active')
+        call_command('send_reactivation_mail', '--chunk-size', '2', stdout=StringIO())
+        self.assertEqual(sorted(OutboundMail.objects.values_list('to', flat=True)),
+                         sorted(user.email for user in self.users))
+
+
+class PurgePendingAccountsTests(TestCase):
+
+    def setUp(self):
+        expired = timezone.now() - timedelta(days=2)
+        # 画像アップロード用のインスタンスがあるもの(通常のdelete()で連鎖削除する)と、ないもの(DELETE1回で消す)
+        self.pending = [create_user('pending0', is_active=False, date_joined=expired),
+                        User.objects.create_user('pending1@example.com', 'password', account_name='pending1',
+                                                 is_active=False, date_joined=expired),
+                        create_user('pending2', is_active=False, date_joined=expired)]
+        self.kept = [
+            # 期限内の仮登録
+            create_user('recent', is_active=False),
+            # 退会したユーザー(ログインしたことがある)
+            create_user('withdrawn', is_active=False, date_joined=expired, last_login=expired),
+            create_user('active', date_joined=expired),
+        ]
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.state_file = os.path.join(directory, 'state.json')
+
+    def call(self, *args):
+        out = StringIO()
+        call_command('purge_pending_accounts', '--chunk-size', '1', *args, stdout=out)
+        return out.getvalue()
+
+    def remaining(self):
+        return set(User.objects.values_list('account_name', flat=True))
+
+    def test_purges_only_expired_pending_users(self):
+        self.assertIn('3 of 3', self.call())
+        self.assertEqual(self.remaining(), {'recent', 'withdrawn', 'active'})
+        self.assertEqual(set(UploadImage.objects.values_list('user__account_name', flat=True)),
+                         {'recent', 'withdrawn', 'active'})
+
+    def test_dry_run_deletes_nothing(self):
+        self.assertIn('0 of 3 expired pending users', self.call('--dry-run'))
+        self.assertEqual(len(self.remaining()), 6)
+
+    def test_resumes_from_state_file(self):
+        # 最初のチャンクの後で止まったことにする
+        with mock.patch('time.sleep', side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                self.call('--state-file', self.state_file, '--sleep', '1')
+        with open(self.state_file) as f:
+            self.assertEqual(json.load(f), {'mode': 'purge', 'last_pk': self.pending[0].pk})
+        self.assertEqual(self.remaining() & {'pending0', 'pending1', 'pending2'}, {'pending1', 'pending2'})
+
+        self.assertIn('2 of 2', self.call('--state-file', self.state_file))
+        self.assertEqual(self.remaining(), {'recent', 'withdrawn', 'active'})
+        self.assertFalse(os.path.exists(self.state_file))
+
+    def test_state_file_of_other_mode_is_refused(self):
+        with open(self.state_file, 'w') as f:
+            json.dump({'mode': 'purge', 'last_pk': 0}, f)
+        with self.assertRaises(CommandError):
+            self.call('--renotify', '--state-file', self.state_file)
+
+    def test_renotify_extends_the_activation_period(self):
+        date_joined = {user.pk: user.date_joined for user in self.pending}
+        self.assertIn('3 of 3', self.call('--renotify'))
+        self.assertEqual(sorted(OutboundMail.objects.values_list('to', flat=True)),
+                         sorted(user.email for user in self.pending))
+        for user in User.objects.filter(pk__in=date_joined):
+            # 登録日はそのまま
+            self.assertEqual(user.date_joined, date_joined[user.pk])
+            self.assertIsNotNone(user.activation_renotified_at)
+        # 送り直したばかりなので消さない
+        self.assertIn('0 of 0', self.call())
+        self.assertEqual(len(self.remaining()), 6)
+        User.objects.filter(pk__in=date_joined).update(activation_renotified_at=timezone.now() - timedelta(days=2))
+        self.assertIn('3 of 3', self.call())
@@ -1,5 +1,3 @@
-from datetime import datetime
-
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
@@ -8,17 +6,17 @@ from django.contrib.auth.views import (
     PasswordResetView, PasswordResetDoneView, PasswordResetConfirmView, PasswordResetCompleteView
 )
 from django.contrib.sites.shortcuts import get_current_site
-from django.core.mail import send_mail
 from django.core.signing import BadSignature, SignatureExpired, loads, dumps
 from django.http import HttpResponseBadRequest, Http404
-from django.shortcuts import redirect, resolve_url, render
-from django.template.loader import render_to_string
+from django.shortcuts import get_object_or_404, redirect, resolve_url, render
 from django.urls import reverse_lazy
 from django.views import generic
 
+from project.identity import IdentityMapObjectMixin, get_identity_map
 from project.settings import DEFAULT_FROM_EMAIL
-from relationship.models import Intimate
+from relationship import intimates
 
+from . import mailqueue
 from .models import UploadImage
 from .forms import (
     LoginForm, UserCreateForm, UserUpdateForm, MyPasswordChangeForm,
@@ -66,15 +64,13 @@ class UserCreate(generic.CreateView):
             'user': user,
         }
 
-        subject = render_to_string('register/mail_template/create/subject.txt', context)
-        message = render_to_string('register/mail_template/create/message.txt', context)
-
-        # 編集
-        send_mail(
-            subject,
-            message,
-            DEFAULT_FROM_EMAIL,
+        # 送信はsend_queued_mailワーカーが行う
+        mailqueue.enqueue_template(
+            'register/mail_template/create/subject.txt',
+            'register/mail_template/create/message.txt',
+            context,
             [user.email],
+            DEFAULT_FROM_EMAIL,
         )
         return redirect('register:user_create_done')
 
@@ -132,7 +128,7 @@ class OnlyYouMixin(UserPassesTestMixin):
         return user.pk == self.kwargs['pk'] or user.is_superuser
 
 
-class UserDetail(OnlyYouMixin, generic.DetailView):
+class UserDetail(OnlyYouMixin, IdentityMapObjectMixin, generic.DetailView):
     """ユーザーの詳細ページ"""
     model = User
     template_name = 'register/user_detail.html'
@@ -141,76 +137,46 @@ class UserDetail(OnlyYouMixin, generic.DetailView):
         ctx = super().get_context_data()
         request_user = self.request.user
         """ あなたの承認待ちユーザーリスト """
-        ctx['approval_pending_list'] = Intimate.objects.filter(receiver=request_user,
-                                                               request=True, approval=False).exclude(reject=True)
+        ctx['approval_pending_list'] = intimates.pending_for(request_user)
 
         """ 相手の承認待ちユーザーリスト """
-        ctx['request_list'] = Intimate.objects.filter(sender=request_user,
-                                                      request=True, approval=False)
-
-        """ 親しい友達リスト """
-        intimate_qs1 = Intimate.objects.filter(sender=request_user, request=True, approval=True)
-        intimate_qs2 = Intimate.objects.filter(receiver=request_user, request=True, approval=True)
-        intimate_dic = {}
-        for user in intimate_qs1:
-            intimate_dic[(str(user.receiver.account_name))] = user.date
-        for user in intimate_qs2:
-            intimate_dic[str(user.sender.account_name)] = user.date
-        # 繋がった日付でソート
-        intimate_dic_sorted = sorted(intimate_dic.items(), key=lambda x: x[1])
-        ctx['intimate_dic_sorted'] = intimate_dic_sorted
+        ctx['request_list'] = intimates.requested_by(request_user)
+
+        """ 親しい友達リスト(繋がった日付順) """
+        ctx['intimate_dic_sorted'] = intimates.get_intimate_friends(request_user)
 
         """ 拒否したユーザーリスト """
-        ctx['reject_lst'] = Intimate.objects.filter(receiver=request_user, reject=True)
+        ctx['reject_lst'] = intimates.rejected_by(request_user)
 
         """ upload_image用 """
-        upload_img = UploadImage.objects.get(user=request_user)
+        upload_img = get_identity_map(self.request).get(UploadImage, user=request_user)
         ctx['upload_user_pk'] = upload_img.pk
         return ctx
 
     def post(self, *args, **kwargs):
         if self.request.method == 'POST':
             request_user = self.request.user
-            now = datetime.now()
 
             """ リクエストを承認する """
             if 'approval' in self.request.POST:
-                sender_user = self.request.POST['approval']
-                # sender と recieverを取得
-                request_user_ins = User.objects.get(email=request_user)
-                sender_user_ins = User.objects.get(account_name=sender_user)
-                # それぞれUserインスタンスを取得し、approval：True、date：承認した時間を保存する
-                intimate_ins = Intimate.objects.get(sender=sender_user_ins, receiver=request_user_ins)
-                intimate_ins.approval = True
-                intimate_ins.reject = False
-                intimate_ins.date = now
-                intimate_ins.save()
+                sender_user_ins = get_object_or_404(User, account_name=self.request.POST['approval'])
+                intimates.approve(request_user, sender_user_ins)
 
             """ リクエストを拒否する(拒否通知はしない) """
             if 'reject' in self.request.POST:
-                reject_user = self.request.POST['reject']
-                # それぞれUserインスタンスを取得し、reject：Trueで保存する
-                request_user_ins = User.objects.get(email=request_user)
-                reject_user_ins = User.objects.get(account_name=reject_user)
-                intimate_ins = Intimate.objects.get(sender=reject_user_ins, receiver=request_user_ins)
-                intimate_ins.reject = True
-                intimate_ins.save()
+                reject_user_ins = get_object_or_404(User, account_name=self.request.POST['reject'])
+                intimates.reject(request_user, reject_user_ins)
                 return self.get(self, *args, **kwargs)
 
             """ リクエストを取り消す """
             if 'cancel' in self.request.POST:
-                cancel_user = self.request.POST['cancel']
-                # それぞれUserインスタンスを取得し、reject：Trueで保存する
-                request_user_ins = User.objects.get(email=request_user)
-                cancel_user_ins = User.objects.get(account_name=cancel_user)
-                intimate_ins = Intimate.objects.get(sender=request_user_ins, receiver=cancel_user_ins)
-                intimate_ins.request = False
-                intimate_ins.save()
+                cancel_user_ins = get_object_or_404(User, account_name=self.request.POST['cancel'])
+                intimates.cancel(request_user, cancel_user_ins)
 
             """ 画像を取り消す """
             if 'delete' in self.request.POST:
-                user_ins = User.objects.get(pk=request_user.pk)
-                user_ins.image = 'media/profile_pics/default.jpg'
+                user_ins = get_identity_map(self.request).get(User, pk=request_user.pk)
+                user_ins.image = User._meta.get_field('image').get_default()
                 user_ins.save()
 
             return self.get(self, *args, **kwargs)
@@ -234,12 +200,12 @@ class UpdateImage(LoginRequiredMixin, generic.UpdateView):
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data()
-        user = User.objects.get(pk=self.request.user.pk)
+        user = get_identity_map(self.request).get(User, pk=self.request.user.pk)
         ctx['current_img'] = user.image
         return ctx
 
     def get_success_url(self):
-        upload_user = UploadImage.objects.get(user=self.request.user)
+        upload_user = get_identity_map(self.request).get(UploadImage, user=self.request.user)
         upload_user_pk = upload_user.pk
         return resolve_url('register:confirm_image', pk=upload_user_pk)
 
@@ -249,7 +215,7 @@ class UpdateImage(LoginRequiredMixin, generic.UpdateView):
         return super().post(self.request, *args, **kwargs)
 
 
-class ConfirmImage(LoginRequiredMixin, generic.DetailView):
+class ConfirmImage(LoginRequiredMixin, IdentityMapObjectMixin, generic.DetailView):
     """ユーザープロフィール画像確認"""
     model = User
     template_name = 'register/module/confirm_user_img.html'
@@ -257,15 +223,16 @@ class ConfirmImage(LoginRequiredMixin, generic.DetailView):
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data()
-        user = UploadImage.objects.get(user=self.request.user)
+        user = get_identity_map(self.request).get(UploadImage, user=self.request.user)
         ctx['post_img'] = user.upload_img
         return ctx
 
     def post(self, *args, **kwargs):
         if self.request.method == 'POST':
             if 'done' in self.request.POST:
-                user = UploadImage.objects.get(user=self.request.user)
-                user_ins = User.objects.get(pk=self.request.user.pk)
+                identity_map = get_identity_map(self.request)
+                user = identity_map.get(UploadImage, user=self.request.user)
+                user_ins = identity_map.get(User, pk=self.request.user.pk)
                 user_ins.image = user.upload_img
                 user_ins.save()
                 return redirect('register:user_detail', pk=self.request.user.pk)
@@ -331,9 +298,12 @@ class EmailChange(LoginRequiredMixin, generic.FormView):
             'user': user,
         }
 
-        subject = render_to_string('register/mail_template/email_change/subject.txt', context)
-        message = render_to_string('register/mail_template/email_change/message.txt', context)
-        send_mail(subject, message, None, [new_email])
+        mailqueue.enqueue_template(
+            'register/mail_template/email_change/subject.txt',
+            'register/mail_template/email_change/message.txt',
+            context,
+            [new_email],
+        )
 
         return redirect('register:email_change_done')
 
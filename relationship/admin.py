@@ -1,7 +1,8 @@
 from django.contrib import admin
-from .models import Follow, Post, Comment, Intimate
+from .models import Follow, Post, Comment, Intimate, Reaction
 
 admin.site.register(Follow)
 admin.site.register(Post)
 admin.site.register(Comment)
 admin.site.register(Intimate)
+admin.site.register(Reaction)
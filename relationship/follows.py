@@ -0,0 +1,72 @@
+from django.db import transaction
+
+from . import timeline
+from .models import Follow
+
+
+def is_following(user, follow_user_id):
+    """ userがfollow_user_idをフォローしているか """
+    return Follow.objects.filter(user=user, follow_user_id=follow_user_id).exists()
+
+
+def follow(user, follow_user):
+    """ フォローする。新しくフォローした場合はTrueを返す
+
+    (user, follow_user)のユニーク制約があるので、同時に押されても1行しか作られない
+    """
+    if user.pk == follow_user.pk:
+        return False
+    with transaction.atomic():
+        _, created = Follow.objects.get_or_create(user=user, follow_user=follow_user)
+    if created:
+        timeline.backfill(user, follow_user)
+    return created
+
+
+def unfollow(user, follow_user):
+    """ フォローを解除する。解除した場合はTrueを返す """
+    with transaction.atomic():
+        deleted, _ = Follow.objects.filter(user=user, follow_user=follow_user).delete()
+        if deleted:
+            Follow.adjust_counts(user.pk, follow_user.pk, -deleted)
+    if deleted:
+        timeline.remove_author(user, follow_user)
+    return bool(deleted)
+
+
+def followed_ids(user, author_ids):
+    """ author_idsのうちuserがフォローしているidの集合を1クエリで返す """
+    author_ids = set(author_ids)
+    if not author_ids:
+        return set()
+    return set(Follow.objects.filter(user=user, follow_user_id__in=author_ids)
+               .values_list('follow_user_id', flat=True))
+
+
+class FollowState:
+    """ 1リクエスト内のフォロー状態キャッシュ """
+
+    def __init__(self, user):
+        self.user = user
+        self.known = {}
+
+    def load(self, author_ids):
+        """ 未取得のidだけまとめて問い合わせる """
+        missing = {author_id for author_id in author_ids if author_id not in self.known}
+        if missing:
+            found = followed_ids(self.user, missing)
+            for author_id in missing:
+                self.known[author_id] = author_id in found
+
+    def is_following(self, author_id):
+        self.load([author_id])
+        return self.known[author_id]
+
+
+def follow_state(request):
+    """ requestに紐づいたFollowStateを返す """
+    state = getattr(request, '_follow_state', None)
+    if state is None or state.user != request.user:
+        state = FollowState(request.user)
+        request._follow_state = state
+    return state
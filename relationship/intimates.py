@@ -0,0 +1,84 @@
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import Intimate, IntimateEdge
+
+Status = Intimate.Status
+
+
+def _transition(status, lookup, **values):
+    """ 許可された遷移元からstatusへ1回のUPDATEで遷移させる。遷移したらTrue """
+    return Intimate.objects.filter(status__in=Intimate.TRANSITIONS[status], **lookup).update(
+        status=status, **values) > 0
+
+
+def send_request(sender, receiver):
+    """ 承認リクエストを送る。どちらかから既にリクエスト済みならFalse """
+    if sender.pk == receiver.pk:
+        return False
+    user_low, user_high = sorted((sender.pk, receiver.pk))
+    with transaction.atomic():
+        # 取り消し済みのペアは送り直しとして再利用する
+        if Intimate.objects.filter(user_low=user_low, user_high=user_high, status=Status.CANCELLED).update(
+                sender=sender, receiver=receiver, status=Status.PENDING, date=None):
+            return True
+        try:
+            with transaction.atomic():
+                Intimate.objects.create(sender=sender, receiver=receiver, status=Status.PENDING)
+        except IntegrityError:
+            return False
+    return True
+
+
+def approve(receiver, sender):
+    """ senderからのリクエストを承認する(拒否済みも承認できる) """
+    now = timezone.now()
+    with transaction.atomic():
+        approved = _transition(Status.APPROVED, {'sender': sender, 'receiver': receiver}, date=now)
+        if approved:
+            connect(sender, receiver, now)
+    return approved
+
+
+def reject(receiver, sender):
+    """ senderからのリクエストを拒否する(拒否通知はしない) """
+    return _transition(Status.REJECTED, {'sender': sender, 'receiver': receiver})
+
+
+def cancel(sender, receiver):
+    """ 自分が送ったリクエストを取り消す """
+    return _transition(Status.CANCELLED, {'sender': sender, 'receiver': receiver})
+
+
+def has_requested(sender, receiver_id):
+    """ senderがreceiver_idへリクエスト中・承認済みなどで送り直せない状態か """
+    return Intimate.objects.filter(sender=sender, receiver_id=receiver_id).exclude(status=Status.CANCELLED).exists()
+
+
+def pending_for(receiver):
+    """ あなたの承認待ち """
+    return Intimate.objects.filter(receiver=receiver, status=Status.PENDING).select_related('sender')
+
+
+def requested_by(sender):
+    """ 相手の承認待ち """
+    return Intimate.objects.filter(sender=sender, status=Status.PENDING).select_related('receiver')
+
+
+def rejected_by(receiver):
+    """ 拒否したユーザー """
+    return Intimate.objects.filter(receiver=receiver, status=Status.REJECTED).select_related('sender')
+
+
+def connect(sender, receiver, date):
+    """ 承認された2人を双方向の辺として登録する """
+    with transaction.atomic():
+        for user, friend in ((sender, receiver), (receiver, sender)):
+            IntimateEdge.objects.update_or_create(user=user, friend=friend, defaults={'date': date})
+
+
+def get_intimate_friends(user):
+    """ 親しい友達の(account_name, 繋がった日)を繋がった日順に1クエリで返す """
+    return list(IntimateEdge.objects.filter(user=user)
+                .order_by('date', 'friend')
+                .values_list('friend__account_name', 'date'))
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from relationship import reactions
+
+
+class Command(BaseCommand):
+    """ いいね数のシャードをPostへ畳み込む """
+    help = 'Fold sharded reaction counters back into Post.likes / Post.dislikes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep folding periodically.')
+        parser.add_argument('--interval', type=float, default=60.0, help='Seconds to sleep between runs.')
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            folded = reactions.fold()
+            total += folded
+            if folded:
+                self.stdout.write(f'folded counters of {folded} posts')
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS(f'folded counters of {total} posts'))
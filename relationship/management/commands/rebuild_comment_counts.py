@@ -0,0 +1,7 @@
+from project.counters import Recount, RecountCommand
+from relationship.models import Comment, Post
+
+
+class Command(RecountCommand):
+    """ Post.comment_count を実際のComment件数と照合・再計算する """
+    recount = Recount(Post, comment_count=(Comment, 'post_connected'))
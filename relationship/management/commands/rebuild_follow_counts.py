@@ -0,0 +1,11 @@
+from django.contrib.auth import get_user_model
+
+from project.counters import Recount, RecountCommand
+from relationship.models import Follow
+
+User = get_user_model()
+
+
+class Command(RecountCommand):
+    """ User.follows_count / followers_count を実際のFollow件数と照合・再計算する """
+    recount = Recount(User, follows_count=(Follow, 'user'), followers_count=(Follow, 'follow_user'))
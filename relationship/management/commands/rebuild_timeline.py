@@ -0,0 +1,24 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from relationship import timeline
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    """ 既存のPost・Followからホームタイムラインを作り直す """
+    help = 'Rebuild the materialized home timeline for every user (or the given pks).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('user_pks', nargs='*', type=int)
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(is_active=True).order_by('pk')
+        if options['user_pks']:
+            users = users.filter(pk__in=options['user_pks'])
+        count = 0
+        for user in users.iterator():
+            timeline.rebuild(user)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f'rebuilt {count} timelines'))
@@ -0,0 +1,25 @@
+# Generated by Django 3.1.6 on 2026-10-18 12:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('relationship', '0011_auto_20261018_2100'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['user', '-date', '-id'], name='follow_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['follow_user', '-date', '-id'], name='follow_follow_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', '-date_posted', '-id'], name='post_author_date_idx'),
+        ),
+    ]
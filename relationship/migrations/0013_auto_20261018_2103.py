@@ -0,0 +1,35 @@
+# Generated by Django 3.1.6 on 2026-10-18 12:03
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+from project.counters import Recount
+
+
+def remove_duplicate_follows(apps, schema_editor):
+    """ ユニーク制約を張る前に重複したFollowを消してカウンタを再計算する """
+    Follow = apps.get_model('relationship', 'Follow')
+    User = apps.get_model('register', 'User')
+    duplicates = (Follow.objects.values('user', 'follow_user')
+                  .annotate(first=Min('id'), n=Count('id')).filter(n__gt=1))
+    if not duplicates:
+        return
+    for row in duplicates:
+        Follow.objects.filter(user=row['user'], follow_user=row['follow_user']).exclude(id=row['first']).delete()
+    Recount(User, follows_count=(Follow, 'user'), followers_count=(Follow, 'follow_user')).fill()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('relationship', '0012_auto_20261018_2102'),
+        ('register', '0018_auto_20261018_2103'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_follows, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(fields=('user', 'follow_user'), name='unique_follow'),
+        ),
+    ]
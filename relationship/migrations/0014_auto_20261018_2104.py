@@ -0,0 +1,37 @@
+# Generated by Django 3.1.6 on 2026-10-18 12:04
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('relationship', '0013_auto_20261018_2103'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IntimateEdge',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateTimeField(blank=True, null=True, verbose_name='登録日')),
+                ('friend', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='intimate_edges', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'intimate edge',
+                'verbose_name_plural': 'IntimateEdge',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='intimateedge',
+            index=models.Index(fields=['user', 'date'], name='intimate_edge_user_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='intimateedge',
+            constraint=models.UniqueConstraint(fields=('user', 'friend'), name='unique_intimate_edge'),
+        ),
+    ]
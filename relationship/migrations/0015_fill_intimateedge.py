@@ -0,0 +1,27 @@
+from django.db import migrations
+
+
+def fill_intimate_edges(apps, schema_editor):
+    """ 承認済みのIntimateから双方向の辺を作る """
+    Intimate = apps.get_model('relationship', 'Intimate')
+    IntimateEdge = apps.get_model('relationship', 'IntimateEdge')
+    edges = {}
+    approved = Intimate.objects.filter(request=True, approval=True).order_by('id')
+    for sender_id, receiver_id, date in approved.values_list('sender_id', 'receiver_id', 'date'):
+        edges[(sender_id, receiver_id)] = date
+        edges[(receiver_id, sender_id)] = date
+    IntimateEdge.objects.bulk_create(
+        [IntimateEdge(user_id=user_id, friend_id=friend_id, date=date) for (user_id, friend_id), date in edges.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('relationship', '0014_auto_20261018_2104'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_intimate_edges, migrations.RunPython.noop),
+    ]
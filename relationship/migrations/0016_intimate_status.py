@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('relationship', '0015_fill_intimateedge'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='intimate',
+            name='status',
+            field=models.CharField(choices=[('pending', '承認待ち'), ('approved', '承認済み'), ('rejected', '拒否'), ('cancelled', '取り消し')], default='pending', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='intimate',
+            name='user_low',
+            field=models.PositiveIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='intimate',
+            name='user_high',
+            field=models.PositiveIntegerField(editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,40 @@
+from django.db import migrations
+
+
+def fill_status(apps, schema_editor):
+    """ request/approval/rejectの組み合わせをstatusへ移し、順序なしペアの重複を除く """
+    Intimate = apps.get_model('relationship', 'Intimate')
+    # 同じペアが複数あれば、承認済み > 承認待ち > 拒否 > 取り消し の順で1件だけ残す
+    rank = {'approved': 0, 'pending': 1, 'rejected': 2, 'cancelled': 3}
+    kept = {}
+    for intimate in Intimate.objects.order_by('id'):
+        # 0015で辺を作ったのと同じく、request・approvalの両方がTrueのものだけを承認済みとする
+        if not intimate.request:
+            intimate.status = 'cancelled'
+        elif intimate.approval:
+            intimate.status = 'approved'
+        elif intimate.reject:
+            intimate.status = 'rejected'
+        else:
+            intimate.status = 'pending'
+        intimate.user_low, intimate.user_high = sorted((intimate.sender_id, intimate.receiver_id))
+        key = (intimate.user_low, intimate.user_high)
+        current = kept.get(key)
+        if current is None or rank[intimate.status] < rank[current.status]:
+            if current is not None:
+                current.delete()
+            kept[key] = intimate
+            intimate.save()
+        else:
+            intimate.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('relationship', '0016_intimate_status'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_status, migrations.RunPython.noop),
+    ]
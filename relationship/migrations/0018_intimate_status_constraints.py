@@ -0,0 +1,45 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('relationship', '0017_fill_intimate_status'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='intimate',
+            name='user_low',
+            field=models.PositiveIntegerField(editable=False),
+        ),
+        migrations.AlterField(
+            model_name='intimate',
+            name='user_high',
+            field=models.PositiveIntegerField(editable=False),
+        ),
+        migrations.RemoveField(
+            model_name='intimate',
+            name='approval',
+        ),
+        migrations.RemoveField(
+            model_name='intimate',
+            name='reject',
+        ),
+        migrations.RemoveField(
+            model_name='intimate',
+            name='request',
+        ),
+        migrations.AddIndex(
+            model_name='intimate',
+            index=models.Index(fields=['receiver', 'status'], name='intimate_receiver_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='intimate',
+            index=models.Index(fields=['sender', 'status'], name='intimate_sender_status_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='intimate',
+            constraint=models.UniqueConstraint(fields=('user_low', 'user_high'), name='unique_intimate_pair'),
+        ),
+    ]
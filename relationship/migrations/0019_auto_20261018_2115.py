@@ -0,0 +1,17 @@
+# Generated by Django 3.1.6 on 2026-10-18 12:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('relationship', '0018_intimate_status_constraints'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post_connected', '-date_posted', '-id'], name='comment_post_date_idx'),
+        ),
+    ]
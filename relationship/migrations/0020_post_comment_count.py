@@ -0,0 +1,27 @@
+# Generated by Django 3.1.6 on 2026-10-18 12:15
+
+from django.db import migrations, models
+
+from project.counters import Recount
+
+
+def fill_comment_count(apps, schema_editor):
+    Post = apps.get_model('relationship', 'Post')
+    Comment = apps.get_model('relationship', 'Comment')
+    Recount(Post, comment_count=(Comment, 'post_connected')).fill()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('relationship', '0019_auto_20261018_2115'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_comment_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 3.1.6 on 2026-10-18 12:16
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('relationship', '0020_post_comment_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReactionCounterShard',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('likes', models.IntegerField(default=0)),
+                ('dislikes', models.IntegerField(default=0)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='counter_shards', to='relationship.post')),
+            ],
+            options={
+                'verbose_name': 'reaction counter shard',
+                'verbose_name_plural': 'ReactionCounterShard',
+            },
+        ),
+        migrations.CreateModel(
+            name='Reaction',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('like', 'いいね'), ('dislike', 'よくないね')], max_length=10)),
+                ('date', models.DateTimeField(auto_now=True)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reactions', to='relationship.post')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reactions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'reaction',
+                'verbose_name_plural': 'Reaction',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='reactioncountershard',
+            constraint=models.UniqueConstraint(fields=('post', 'shard'), name='unique_reaction_counter_shard'),
+        ),
+        migrations.AddConstraint(
+            model_name='reaction',
+            constraint=models.UniqueConstraint(fields=('user', 'post'), name='unique_reaction'),
+        ),
+    ]
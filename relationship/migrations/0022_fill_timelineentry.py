@@ -0,0 +1,31 @@
+from django.db import migrations
+
+# relationship.timeline.TIMELINE_LENGTHと同じ(これより古い投稿は読み込み時に取得される)
+TIMELINE_LENGTH = 50
+
+
+def fill_timelines(apps, schema_editor):
+    """ 既存のユーザーのタイムラインを、本人とフォロー中のユーザーの新しい投稿で作る """
+    User = apps.get_model('register', 'User')
+    Follow = apps.get_model('relationship', 'Follow')
+    Post = apps.get_model('relationship', 'Post')
+    TimelineEntry = apps.get_model('relationship', 'TimelineEntry')
+    for user_id in User.objects.filter(is_active=True).order_by('pk').values_list('pk', flat=True).iterator():
+        author_ids = [user_id, *Follow.objects.filter(user_id=user_id).values_list('follow_user_id', flat=True)]
+        posts = (Post.objects.filter(author_id__in=author_ids).order_by('-date_posted', '-id')
+                 .values_list('pk', 'date_posted')[:TIMELINE_LENGTH])
+        TimelineEntry.objects.bulk_create(
+            [TimelineEntry(owner_id=user_id, post_id=post_id, date_posted=date_posted) for post_id, date_posted in posts],
+            batch_size=1000, ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('relationship', '0021_auto_20261018_2116'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,6 @@
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
 from django.utils import timezone
 
 User = get_user_model()
@@ -12,6 +13,7 @@ class Post(models.Model):
     author = models.ForeignKey(User, on_delete=models.CASCADE)
     likes = models.IntegerField(default=0)
     dislikes = models.IntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return self.content[:5]
@@ -19,6 +21,9 @@ class Post(models.Model):
     class Meta:
         verbose_name = "post"
         verbose_name_plural = "UserPosts"
+        indexes = [
+            models.Index(fields=['author', '-date_posted', '-id'], name='post_author_date_idx'),
+        ]
 
 
 class Follow(models.Model):
@@ -30,9 +35,43 @@ class Follow(models.Model):
     def __str__(self):
         return f'FROM：{str(self.user.account_name)}――＞TO：{str(self.follow_user.account_name)}'
 
+    @staticmethod
+    def adjust_counts(user_id, follow_user_id, delta):
+        """ フォロー数・フォロワー数をdeltaだけ増減する(トランザクション内で呼ぶ) """
+        if delta > 0:
+            User.objects.filter(pk=user_id).update(follows_count=F('follows_count') + delta)
+            User.objects.filter(pk=follow_user_id).update(followers_count=F('followers_count') + delta)
+        else:
+            User.objects.filter(pk=user_id, follows_count__gte=-delta).update(
+                follows_count=F('follows_count') + delta)
+            User.objects.filter(pk=follow_user_id, followers_count__gte=-delta).update(
+                followers_count=F('followers_count') + delta)
+
+    def save(self, *args, **kwargs):
+        """ 新規フォロー時にフォロー数・フォロワー数を加算 """
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                self.adjust_counts(self.user_id, self.follow_user_id, 1)
+
+    def delete(self, *args, **kwargs):
+        """ フォロー解除時にフォロー数・フォロワー数を減算 """
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            self.adjust_counts(self.user_id, self.follow_user_id, -1)
+        return result
+
     class Meta:
         verbose_name = "follow"
         verbose_name_plural = "UserFollow"
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'follow_user'], name='unique_follow'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-date', '-id'], name='follow_user_date_idx'),
+            models.Index(fields=['follow_user', '-date', '-id'], name='follow_follow_user_date_idx'),
+        ]
 
 
 class Comment(models.Model):
@@ -45,24 +84,162 @@ class Comment(models.Model):
     def __str__(self):
         return f'{str(self.author.account_name)}：{str(self.date_posted)}'
 
+    @staticmethod
+    def adjust_count(post_id, delta):
+        """ 投稿のコメント数をdeltaだけ増減する(トランザクション内で呼ぶ) """
+        posts = Post.objects.filter(pk=post_id)
+        if delta < 0:
+            posts = posts.filter(comment_count__gte=-delta)
+        posts.update(comment_count=F('comment_count') + delta)
+
+    def save(self, *args, **kwargs):
+        """ 新規コメント時にコメント数を加算 """
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                self.adjust_count(self.post_connected_id, 1)
+
+    def delete(self, *args, **kwargs):
+        """ コメント削除時にコメント数を減算 """
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            self.adjust_count(self.post_connected_id, -1)
+        return result
+
     class Meta:
         verbose_name = "comment"
         verbose_name_plural = "PostComment"
+        indexes = [
+            # 投稿ごとのコメントを新しい順に取得するため
+            models.Index(fields=['post_connected', '-date_posted', '-id'], name='comment_post_date_idx'),
+        ]
 
 
 class Intimate(models.Model):
     """ 親密な関係 """
+
+    class Status(models.TextChoices):
+        PENDING = 'pending', '承認待ち'
+        APPROVED = 'approved', '承認済み'
+        REJECTED = 'rejected', '拒否'
+        CANCELLED = 'cancelled', '取り消し'
+
+    # 遷移先ごとの、遷移できる元のステータス
+    TRANSITIONS = {
+        Status.PENDING: [Status.CANCELLED],
+        Status.APPROVED: [Status.PENDING, Status.REJECTED],
+        Status.REJECTED: [Status.PENDING],
+        Status.CANCELLED: [Status.PENDING],
+    }
+
     sender = models.ForeignKey(User, related_name='sender', on_delete=models.CASCADE)
     receiver = models.ForeignKey(User, related_name='receiver', on_delete=models.CASCADE)
-    request = models.BooleanField(default=False)
-    approval = models.BooleanField(default=False)
-    reject = models.BooleanField(default=False)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    # 順序なしペアの一意性のため、小さい方と大きい方のidを持つ
+    user_low = models.PositiveIntegerField(editable=False)
+    user_high = models.PositiveIntegerField(editable=False)
     date = models.DateTimeField(verbose_name='登録日', auto_now_add=False, auto_now=False, blank=True, null=True)
 
     def __str__(self):
         return f'{str(self.sender.account_name)}――{str(self.receiver.account_name)}' \
-               f'｜request―{self.request}｜approval―{self.approval}'
+               f'｜status―{self.status}'
+
+    def save(self, *args, **kwargs):
+        self.user_low, self.user_high = sorted((self.sender_id, self.receiver_id))
+        super().save(*args, **kwargs)
 
     class Meta:
         verbose_name = "intimate"
         verbose_name_plural = "Intimate"
+        constraints = [
+            models.UniqueConstraint(fields=['user_low', 'user_high'], name='unique_intimate_pair'),
+        ]
+        indexes = [
+            models.Index(fields=['receiver', 'status'], name='intimate_receiver_status_idx'),
+            models.Index(fields=['sender', 'status'], name='intimate_sender_status_idx'),
+        ]
+
+
+class IntimateEdge(models.Model):
+    """ 承認済みの親密な関係(双方向に1行ずつ持つ隣接リスト) """
+    user = models.ForeignKey(User, related_name='intimate_edges', on_delete=models.CASCADE)
+    friend = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+    date = models.DateTimeField(verbose_name='登録日', blank=True, null=True)
+
+    def __str__(self):
+        return f'{str(self.user.account_name)}――{str(self.friend.account_name)}'
+
+    class Meta:
+        verbose_name = "intimate edge"
+        verbose_name_plural = "IntimateEdge"
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'friend'], name='unique_intimate_edge'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'date'], name='intimate_edge_user_date_idx'),
+        ]
+
+
+class TimelineEntry(models.Model):
+    """ ホームタイムライン(投稿時にフォロワーへ展開しておく) """
+    owner = models.ForeignKey(User, related_name='timeline', on_delete=models.CASCADE)
+    post = models.ForeignKey(Post, related_name='timeline_entries', on_delete=models.CASCADE)
+    date_posted = models.DateTimeField()
+
+    def __str__(self):
+        return f'{str(self.owner.account_name)}：{str(self.post)}'
+
+    class Meta:
+        verbose_name = "timeline"
+        verbose_name_plural = "Timeline"
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'post'], name='unique_timeline_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['owner', '-date_posted', '-post'], name='timeline_owner_date_idx'),
+        ]
+
+
+class Reaction(models.Model):
+    """ 投稿へのいいね・よくないね(1ユーザー1投稿につき1つ) """
+
+    class Kind(models.TextChoices):
+        LIKE = 'like', 'いいね'
+        DISLIKE = 'dislike', 'よくないね'
+
+    # 種類ごとに加算するPostのカウンター
+    COUNTER_FIELDS = {Kind.LIKE: 'likes', Kind.DISLIKE: 'dislikes'}
+
+    user = models.ForeignKey(User, related_name='reactions', on_delete=models.CASCADE)
+    post = models.ForeignKey(Post, related_name='reactions', on_delete=models.CASCADE)
+    kind = models.CharField(max_length=10, choices=Kind.choices)
+    date = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{str(self.user.account_name)}：{self.kind}：{str(self.post)}'
+
+    class Meta:
+        verbose_name = "reaction"
+        verbose_name_plural = "Reaction"
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'post'], name='unique_reaction'),
+        ]
+
+
+class ReactionCounterShard(models.Model):
+    """ 人気の投稿のいいね数を分散して加算する行(定期的にPostへ畳み込む) """
+    post = models.ForeignKey(Post, related_name='counter_shards', on_delete=models.CASCADE)
+    shard = models.PositiveSmallIntegerField()
+    likes = models.IntegerField(default=0)
+    dislikes = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f'{str(self.post)}：{self.shard}'
+
+    class Meta:
+        verbose_name = "reaction counter shard"
+        verbose_name_plural = "ReactionCounterShard"
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'shard'], name='unique_reaction_counter_shard'),
+        ]
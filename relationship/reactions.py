@@ -0,0 +1,110 @@
+import random
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+
+from .models import Post, Reaction, ReactionCounterShard
+
+Kind = Reaction.Kind
+
+# 人気の投稿1件あたりのシャード数
+REACTION_SHARDS = getattr(settings, 'REACTION_SHARDS', 8)
+# いいね・よくないねの合計がこれ以上の投稿はシャードへ加算する
+REACTION_HOT_THRESHOLD = getattr(settings, 'REACTION_HOT_THRESHOLD', 1000)
+# 1回で件数を返す投稿数の上限
+REACTION_BATCH_LIMIT = getattr(settings, 'REACTION_BATCH_LIMIT', 100)
+
+
+def is_hot(post):
+    """ 書き込みが集中しそうな投稿か(Postの値が多少古くてもよい) """
+    return post.likes + post.dislikes >= REACTION_HOT_THRESHOLD
+
+
+def _add(post, deltas):
+    """ {'likes': 1, 'dislikes': -1}のような増減をPostかシャードへ加算する(トランザクション内で呼ぶ) """
+    values = {field: F(field) + delta for field, delta in deltas.items() if delta}
+    if not values:
+        return
+    if not is_hot(post):
+        Post.objects.filter(pk=post.pk).update(**values)
+        return
+    # ランダムなシャードへ加算して、1行への書き込みの集中を避ける
+    shard = random.randrange(REACTION_SHARDS)
+    shards = ReactionCounterShard.objects.filter(post=post, shard=shard)
+    if shards.update(**values):
+        return
+    try:
+        with transaction.atomic():
+            ReactionCounterShard.objects.create(post=post, shard=shard, **deltas)
+    except IntegrityError:
+        shards.update(**values)
+
+
+def react(user, post, kind):
+    """ いいね・よくないねする(別の種類を付けていれば付け替える)。変わった場合はTrue """
+    kind = Kind(kind)
+    with transaction.atomic():
+        reaction, created = Reaction.objects.get_or_create(user=user, post=post, defaults={'kind': kind})
+        if created:
+            _add(post, {Reaction.COUNTER_FIELDS[kind]: 1})
+            return True
+        old_kind = Kind(reaction.kind)
+        if old_kind == kind:
+            return False
+        # 同時に付け替えられても二重に数えないよう、元の種類を条件にする
+        if not Reaction.objects.filter(pk=reaction.pk, kind=old_kind).update(kind=kind):
+            return False
+        _add(post, {Reaction.COUNTER_FIELDS[old_kind]: -1, Reaction.COUNTER_FIELDS[kind]: 1})
+    return True
+
+
+def unreact(user, post):
+    """ いいね・よくないねを取り消す。取り消した場合はTrue """
+    with transaction.atomic():
+        reaction = Reaction.objects.filter(user=user, post=post).first()
+        if reaction is None or not Reaction.objects.filter(pk=reaction.pk, kind=reaction.kind).delete()[0]:
+            return False
+        _add(post, {Reaction.COUNTER_FIELDS[Kind(reaction.kind)]: -1})
+    return True
+
+
+def counts(post_ids):
+    """ {post_id: {'likes': n, 'dislikes': n}}をシャードの分も含めて2クエリで返す """
+    result = {pk: {'likes': likes, 'dislikes': dislikes} for pk, likes, dislikes in
+              Post.objects.filter(pk__in=set(post_ids)).values_list('pk', 'likes', 'dislikes')}
+    if not result:
+        return result
+    pending = (ReactionCounterShard.objects.filter(post_id__in=result).exclude(likes=0, dislikes=0)
+               .order_by().values('post_id').annotate(shard_likes=Sum('likes'), shard_dislikes=Sum('dislikes')))
+    for row in pending:
+        result[row['post_id']]['likes'] += row['shard_likes']
+        result[row['post_id']]['dislikes'] += row['shard_dislikes']
+    return result
+
+
+def reacted_kinds(user, post_ids):
+    """ {post_id: kind} userが付けたいいね・よくないね """
+    return dict(Reaction.objects.filter(user=user, post_id__in=set(post_ids)).values_list('post_id', 'kind'))
+
+
+def fold(post_ids=None):
+    """ シャードの値をPostへ畳み込む。畳み込んだ投稿数を返す
+
+    シャードは0にせず読んだ分だけ引くので、畳み込み中の加算も失われない
+    """
+    shards = ReactionCounterShard.objects.exclude(likes=0, dislikes=0)
+    if post_ids is not None:
+        shards = shards.filter(post_id__in=post_ids)
+    folded = 0
+    for post_id in list(shards.order_by('post_id').values_list('post_id', flat=True).distinct()):
+        with transaction.atomic():
+            rows = list(shards.filter(post_id=post_id).values_list('pk', 'likes', 'dislikes'))
+            for pk, likes, dislikes in rows:
+                ReactionCounterShard.objects.filter(pk=pk).update(
+                    likes=F('likes') - likes, dislikes=F('dislikes') - dislikes)
+            Post.objects.filter(pk=post_id).update(
+                likes=F('likes') + sum(row[1] for row in rows),
+                dislikes=F('dislikes') + sum(row[2] for row in rows))
+        folded += 1
+    return folded
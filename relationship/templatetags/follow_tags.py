@@ -0,0 +1,18 @@
+from django import template
+
+from relationship.follows import follow_state
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def is_following(context, author_id):
+    """ 閲覧ユーザーがauthor_idをフォローしているか
+
+    {% is_following post.author_id as following %}
+    ビューでfollow_state(request).load(ids)しておけば、一覧でも1クエリで済む
+    """
+    request = context.get('request')
+    if request is None or not request.user.is_authenticated:
+        return False
+    return follow_state(request).is_following(author_id)
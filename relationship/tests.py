@@ -1,3 +1,433 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from project.testing import FIXTURE_SIZES, QueryBudgetTestCase, create_user
+
+from . import follows, intimates, reactions, timeline
+from .models import Comment, Follow, Intimate, IntimateEdge, Post, Reaction, ReactionCounterShard, TimelineEntry
+
+
+class QueryCountTests(QueryBudgetTestCase):
+    query_budgets = {
+        'relationship:home': 6,
+        'relationship:follow': 3,
+        'relationship:follower': 4,
+        'relationship:post_detail': 9,
+        'relationship:comment_list': 3,
+        'relationship:reaction_counts': 5,
+        'relationship:post_create': 2,
+        'relationship:post_update': 3,
+        'relationship:user_profile': 5,
+        'relationship:post_detail:follow': 16,
+        'relationship:post_detail:comment': 7,
+        'relationship:post_detail:reaction': 10,
+    }
+
+    def setUp(self):
+        super().setUp()
+        self.users = 0
+        self.author = self.new_user()
+        self.post = Post.objects.create(author=self.author, content='投稿')
+
+    def new_user(self):
+        self.users += 1
+        return create_user(f'user{self.users}')
+
+    def test_home(self):
+        def grow(count):
+            for _ in range(count):
+                author = self.new_user()
+                follows.follow(self.user, author)
+                timeline.fanout_post(Post.objects.create(author=author, content='投稿'))
+        self.assertQueryBudget('relationship:home', grow=grow)
+
+    def test_follow(self):
+        def grow(count):
+            for _ in range(count):
+                follows.follow(self.user, self.new_user())
+        self.assertQueryBudget('relationship:follow', grow=grow)
+
+    def test_follower(self):
+        def grow(count):
+            for i in range(count):
+                follower = self.new_user()
+                follows.follow(follower, self.user)
+                # 半分はフォローし返しておく
+                if i % 2:
+                    follows.follow(self.user, follower)
+        self.assertQueryBudget('relationship:follower', grow=grow)
+
+    def test_post_detail(self):
+        def grow(count):
+            for _ in range(count):
+                commenter = self.new_user()
+                Comment.objects.create(author=commenter, post_connected=self.post, content='コメント')
+                reactions.react(commenter, self.post, Reaction.Kind.LIKE)
+        self.assertQueryBudget('relationship:post_detail', args=[self.post.pk], grow=grow)
+
+    def test_comment_list(self):
+        def grow(count):
+            for _ in range(count):
+                Comment.objects.create(author=self.new_user(), post_connected=self.post, content='コメント')
+        self.assertQueryBudget('relationship:comment_list', args=[self.post.pk], grow=grow)
+
+    def test_reaction_counts(self):
+        posts = []
+        counts = {}
+        for size in FIXTURE_SIZES:
+            while len(posts) < size:
+                post = Post.objects.create(author=self.new_user(), content='投稿')
+                reactions.react(self.user, post, Reaction.Kind.LIKE)
+                posts.append(post)
+            counts[size] = self.count_queries(
+                reverse('relationship:reaction_counts'), data={'ids': ','.join(str(post.pk) for post in posts)})
+        budget = self.query_budgets['relationship:reaction_counts']
+        self.assertLessEqual(max(counts.values()), budget, f'{counts} queries exceed the budget of {budget}')
+        self.assertEqual(len(set(counts.values())), 1, f'query count grows with rows {counts}')
+
+    def test_post_create(self):
+        self.assertQueryBudget('relationship:post_create')
+
+    def test_post_update(self):
+        self.assertQueryBudget('relationship:post_update', args=[self.post.pk])
+
+    def test_user_profile(self):
+        intimates.send_request(self.user, self.author)
+        self.assertQueryBudget('relationship:user_profile', args=[self.author.pk])
+
+    def test_post_detail_follow(self):
+        self.assertQueryBudget('relationship:post_detail', args=[self.post.pk], key='relationship:post_detail:follow',
+                               method='post', data={'follow': self.author.account_name}, status=302)
+
+    def test_post_detail_comment(self):
+        self.assertQueryBudget('relationship:post_detail', args=[self.post.pk], key='relationship:post_detail:comment',
+                               method='post', data={'confirm': '', 'content': 'コメント'}, status=302)
+
+    def test_post_detail_reaction(self):
+        self.assertQueryBudget('relationship:post_detail', args=[self.post.pk], key='relationship:post_detail:reaction',
+                               method='post', data={'reaction': Reaction.Kind.LIKE}, status=302)
+
+
+class FollowServiceTests(TestCase):
+
+    def setUp(self):
+        self.user = create_user('follower')
+        self.target = create_user('target')
+
+    def counts(self):
+        self.user.refresh_from_db()
+        self.target.refresh_from_db()
+        return self.user.follows_count, self.target.followers_count
+
+    def test_follow_once(self):
+        self.assertTrue(follows.follow(self.user, self.target))
+        self.assertFalse(follows.follow(self.user, self.target))
+        self.assertEqual(Follow.objects.filter(user=self.user, follow_user=self.target).count(), 1)
+        self.assertEqual(self.counts(), (1, 1))
+        self.assertTrue(follows.is_following(self.user, self.target.pk))
+
+    def test_cannot_follow_self(self):
+        self.assertFalse(follows.follow(self.user, self.user))
+        self.assertFalse(Follow.objects.exists())
+
+    def test_unique_constraint(self):
+        Follow.objects.create(user=self.user, follow_user=self.target)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Follow.objects.create(user=self.user, follow_user=self.target)
+        # 失敗した方のカウンターは加算されない
+        self.assertEqual(self.counts(), (1, 1))
+
+    def test_unfollow(self):
+        follows.follow(self.user, self.target)
+        self.assertTrue(follows.unfollow(self.user, self.target))
+        self.assertFalse(follows.unfollow(self.user, self.target))
+        self.assertEqual(self.counts(), (0, 0))
+
+    def test_counts_never_go_negative(self):
+        Follow.adjust_counts(self.user.pk, self.target.pk, -1)
+        self.assertEqual(self.counts(), (0, 0))
+
+    def test_unfollow_removes_posts_from_timeline(self):
+        timeline.fanout_post(Post.objects.create(author=self.user, content='自分の投稿'))
+        follows.follow(self.user, self.target)
+        post = Post.objects.create(author=self.target, content='投稿')
+        timeline.fanout_post(post)
+        self.assertIn(post, timeline.get_timeline(self.user))
+        follows.unfollow(self.user, self.target)
+        self.assertNotIn(post, timeline.get_timeline(self.user))
+
+    def test_followed_ids_batches(self):
+        others = [create_user(f'other{i}') for i in range(3)]
+        follows.follow(self.user, others[0])
+        follows.follow(self.user, others[2])
+        with self.assertNumQueries(1):
+            self.assertEqual(follows.followed_ids(self.user, [user.pk for user in others]), {others[0].pk, others[2].pk})
+
+
+class ReactionTests(TestCase):
+    LIKE, DISLIKE = Reaction.Kind.LIKE, Reaction.Kind.DISLIKE
+
+    def setUp(self):
+        self.post = Post.objects.create(author=create_user('author'), content='投稿')
+        self.users = [create_user(f'reader{i}') for i in range(6)]
+
+    def hot(self):
+        """ 全ての投稿をシャードへ加算する """
+        patcher = mock.patch.object(reactions, 'REACTION_HOT_THRESHOLD', 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def stored(self):
+        post = Post.objects.get(pk=self.post.pk)
+        return post.likes, post.dislikes
+
+    def counted(self):
+        counts = reactions.counts([self.post.pk])[self.post.pk]
+        return counts['likes'], counts['dislikes']
+
+    def test_react_switch_and_unreact(self):
+        user = self.users[0]
+        self.assertTrue(reactions.react(user, self.post, self.LIKE))
+        self.assertFalse(reactions.react(user, self.post, self.LIKE))
+        self.assertEqual(self.stored(), (1, 0))
+        self.assertTrue(reactions.react(user, self.post, self.DISLIKE))
+        self.assertEqual(self.stored(), (0, 1))
+        self.assertTrue(reactions.unreact(user, self.post))
+        self.assertFalse(reactions.unreact(user, self.post))
+        self.assertEqual(self.stored(), (0, 0))
+
+    def test_hot_post_adds_to_shards(self):
+        self.hot()
+        for user in self.users[:4]:
+            reactions.react(user, self.post, self.LIKE)
+        reactions.react(self.users[4], self.post, self.DISLIKE)
+        self.assertEqual(self.stored(), (0, 0))
+        self.assertEqual(self.counted(), (4, 1))
+        self.assertLessEqual(ReactionCounterShard.objects.filter(post=self.post).count(), reactions.REACTION_SHARDS)
+
+    def test_fold_moves_shards_into_post(self):
+        self.hot()
+        for user in self.users[:3]:
+            reactions.react(user, self.post, self.LIKE)
+        self.assertEqual(reactions.fold(), 1)
+        self.assertEqual(self.stored(), (3, 0))
+        self.assertEqual(self.counted(), (3, 0))
+        self.assertFalse(ReactionCounterShard.objects.exclude(likes=0, dislikes=0).exists())
+        # 畳み込むものがなければ何もしない
+        self.assertEqual(reactions.fold(), 0)
+
+    def test_fold_keeps_negative_shards(self):
+        # Postへ数えた後に人気になり、取り消しはシャードから引かれる
+        for user in self.users[:2]:
+            reactions.react(user, self.post, self.LIKE)
+        self.hot()
+        reactions.react(self.users[0], self.post, self.DISLIKE)
+        reactions.unreact(self.users[1], self.post)
+        self.assertEqual(self.counted(), (0, 1))
+        reactions.fold()
+        self.assertEqual(self.stored(), (0, 1))
+
+    def test_fold_keeps_additions_made_while_folding(self):
+        self.hot()
+        reactions.react(self.users[0], self.post, self.LIKE)
+        added = []
+
+        def add_while_folding(name):
+            # シャードを読み取った後、引く前に別のリクエストが加算する
+            if not added:
+                added.append(ReactionCounterShard.objects.filter(post=self.post).update(likes=F('likes') + 1))
+            return F(name)
+        with mock.patch.object(reactions, 'F', side_effect=add_while_folding):
+            reactions.fold()
+        self.assertEqual(self.stored(), (1, 0))
+        self.assertEqual(self.counted(), (2, 0))
+
+    def test_fold_only_given_posts(self):
+        self.hot()
+        other = Post.objects.create(author=self.post.author, content='別の投稿')
+        reactions.react(self.users[0], self.post, self.LIKE)
+        reactions.react(self.users[0], other, self.LIKE)
+        self.assertEqual(reactions.fold([other.pk]), 1)
+        self.assertEqual(self.stored(), (0, 0))
+        self.assertEqual(self.counted(), (1, 0))
+
+
+class TimelineTests(TestCase):
+
+    def setUp(self):
+        self.user = create_user('reader')
+        self.author = create_user('author')
+        self.other = create_user('other')
+        Follow.objects.create(user=self.user, follow_user=self.other)
+        now = timezone.now()
+        # 展開する件数より多い投稿
+        self.posts = [Post.objects.create(author=author, content='投稿', date_posted=now - timedelta(minutes=i))
+                      for i, author in enumerate([self.author, self.other] * 60)]
+
+    def expected(self, *authors):
+        return [post.pk for post in self.posts if post.author in authors]
+
+    def read_all(self, size=20):
+        """ 前から順に全ページを読む """
+        pks = []
+        position = None
+        while True:
+            page = timeline.get_timeline(self.user, size, position)
+            pks += [post.pk for post in page]
+            if len(page) < size:
+                return pks
+            position = (page[-1].date_posted, page[-1].pk)
+
+    def test_pages_past_materialized_entries(self):
+        timeline.rebuild(self.user)
+        self.assertEqual(TimelineEntry.objects.filter(owner=self.user).count(), timeline.TIMELINE_LENGTH)
+        self.assertEqual(self.read_all(), self.expected(self.other))
+
+    def test_empty_timeline_reads_posts(self):
+        # マイグレーション前などエントリがなくても表示できる
+        self.assertEqual(self.read_all(), self.expected(self.other))
+
+    def test_follow_backfill_keeps_every_post_reachable(self):
+        timeline.rebuild(self.user)
+        follows.follow(self.user, self.author)
+        self.assertEqual(self.read_all(), self.expected(self.author, self.other))
+
+    def test_previous_page(self):
+        timeline.rebuild(self.user)
+        pages = [timeline.get_timeline(self.user, 20)]
+        for _ in range(2):
+            last = pages[-1][-1]
+            pages.append(timeline.get_timeline(self.user, 20, (last.date_posted, last.pk)))
+        first = pages[-1][0]
+        previous = timeline.get_timeline(self.user, 20, (first.date_posted, first.pk), reverse=True)
+        self.assertEqual([post.pk for post in reversed(previous)], [post.pk for post in pages[-2]])
+
+
+class IntimateServiceTests(TestCase):
+
+    def setUp(self):
+        self.sender = create_user('sender')
+        self.receiver = create_user('receiver')
+
+    def status(self):
+        return Intimate.objects.get().status
+
+    def edges(self):
+        return set(IntimateEdge.objects.values_list('user__account_name', 'friend__account_name'))
+
+    def test_send_request(self):
+        self.assertTrue(intimates.send_request(self.sender, self.receiver))
+        self.assertEqual(self.status(), Intimate.Status.PENDING)
+        self.assertEqual(list(intimates.pending_for(self.receiver).values_list('sender', flat=True)), [self.sender.pk])
+        self.assertEqual(list(intimates.requested_by(self.sender).values_list('receiver', flat=True)),
+                         [self.receiver.pk])
+        self.assertTrue(intimates.has_requested(self.sender, self.receiver.pk))
+        # 同じペアへは、どちらからも送り直せない
+        self.assertFalse(intimates.send_request(self.sender, self.receiver))
+        self.assertFalse(intimates.send_request(self.receiver, self.sender))
+        self.assertFalse(intimates.send_request(self.sender, self.sender))
+        self.assertEqual(Intimate.objects.count(), 1)
+
+    def test_approve_connects_both_ways(self):
+        intimates.send_request(self.sender, self.receiver)
+        self.assertTrue(intimates.approve(self.receiver, self.sender))
+        intimate = Intimate.objects.get()
+        self.assertEqual(intimate.status, Intimate.Status.APPROVED)
+        self.assertIsNotNone(intimate.date)
+        self.assertEqual(self.edges(), {('sender', 'receiver'), ('receiver', 'sender')})
+        self.assertEqual(intimates.get_intimate_friends(self.sender), [('receiver', intimate.date)])
+        self.assertEqual(intimates.get_intimate_friends(self.receiver), [('sender', intimate.date)])
+
+    def test_reject(self):
+        intimates.send_request(self.sender, self.receiver)
+        self.assertTrue(intimates.reject(self.receiver, self.sender))
+        self.assertEqual(self.status(), Intimate.Status.REJECTED)
+        self.assertEqual(list(intimates.rejected_by(self.receiver).values_list('sender', flat=True)), [self.sender.pk])
+        # 拒否されても送り直せない(拒否したことは知らせない)
+        self.assertFalse(intimates.send_request(self.sender, self.receiver))
+        self.assertEqual(self.status(), Intimate.Status.REJECTED)
+        # 拒否した側は後から承認できる
+        self.assertTrue(intimates.approve(self.receiver, self.sender))
+        self.assertEqual(len(self.edges()), 2)
+
+    def test_cancel_and_send_again(self):
+        intimates.send_request(self.sender, self.receiver)
+        self.assertTrue(intimates.cancel(self.sender, self.receiver))
+        self.assertEqual(self.status(), Intimate.Status.CANCELLED)
+        self.assertFalse(intimates.has_requested(self.sender, self.receiver.pk))
+        self.assertFalse(intimates.approve(self.receiver, self.sender))
+        # 取り消した後は、相手からも送れる(同じ行を使う)
+        self.assertTrue(intimates.send_request(self.receiver, self.sender))
+        intimate = Intimate.objects.get()
+        self.assertEqual((intimate.sender, intimate.receiver, intimate.status),
+                         (self.receiver, self.sender, Intimate.Status.PENDING))
+        self.assertTrue(intimates.approve(self.sender, self.receiver))
+
+    def test_invalid_transitions(self):
+        intimates.send_request(self.sender, self.receiver)
+        # 自分が送ったリクエストは承認・拒否できず、相手は取り消せない
+        self.assertFalse(intimates.approve(self.sender, self.receiver))
+        self.assertFalse(intimates.reject(self.sender, self.receiver))
+        self.assertFalse(intimates.cancel(self.receiver, self.sender))
+        self.assertEqual(self.status(), Intimate.Status.PENDING)
+        self.assertEqual(self.edges(), set())
+
+        self.assertTrue(intimates.approve(self.receiver, self.sender))
+        # 承認済みからはどこへも遷移しない
+        for transition, args in ((intimates.approve, (self.receiver, self.sender)),
+                                 (intimates.reject, (self.receiver, self.sender)),
+                                 (intimates.cancel, (self.sender, self.receiver))):
+            with self.subTest(transition.__name__):
+                self.assertFalse(transition(*args))
+        self.assertEqual(self.status(), Intimate.Status.APPROVED)
+        self.assertEqual(IntimateEdge.objects.count(), 2)
+
+    def test_edges_are_removed_together(self):
+        intimates.send_request(self.sender, self.receiver)
+        intimates.approve(self.receiver, self.sender)
+        self.receiver.delete()
+        self.assertFalse(IntimateEdge.objects.exists())
+        self.assertFalse(Intimate.objects.exists())
+
+
+class IntimateMigrationTests(TransactionTestCase):
+    """ request/approval/rejectからstatusと辺への移行 """
+    before = ('relationship', '0014_auto_20261018_2104')
+    after = ('relationship', '0018_intimate_status_constraints')
+
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate([target])
+        return executor.loader.project_state([target]).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes('relationship')[0])
+
+    def test_status_matches_edges(self):
+        apps = self.migrate(self.before)
+        Intimate = apps.get_model('relationship', 'Intimate')
+        users = [create_user(f'user{i}') for i in range(5)]
+        owner = users[0]
+        # 承認済み、承認後に取り消し、拒否、承認待ち
+        for user, request, approval, reject in ((users[1], True, True, False), (users[2], False, True, False),
+                                                (users[3], True, False, True)):
+            Intimate.objects.create(sender_id=user.pk, receiver_id=owner.pk, request=request, approval=approval,
+                                    reject=reject)
+        Intimate.objects.create(sender_id=owner.pk, receiver_id=users[4].pk, request=True)
+
+        apps = self.migrate(self.after)
+        Intimate = apps.get_model('relationship', 'Intimate')
+        IntimateEdge = apps.get_model('relationship', 'IntimateEdge')
+        self.assertEqual(dict(Intimate.objects.values_list('sender_id', 'status')), {
+            users[1].pk: 'approved', users[2].pk: 'cancelled', users[3].pk: 'rejected', owner.pk: 'pending'})
+        approved = set(Intimate.objects.filter(status='approved').values_list('sender_id', 'receiver_id'))
+        self.assertEqual(set(IntimateEdge.objects.values_list('user_id', 'friend_id')),
+                         approved | {(receiver, sender) for sender, receiver in approved})
@@ -0,0 +1,143 @@
+import heapq
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Q
+
+from project.pagination import keyset_filter
+
+from .models import Follow, Post, TimelineEntry
+
+User = get_user_model()
+
+# フォロワーがこの人数以上の投稿者は展開せず、読み込み時に取得する
+TIMELINE_FANOUT_LIMIT = getattr(settings, 'TIMELINE_FANOUT_LIMIT', 5000)
+# ホームに表示する件数
+TIMELINE_LENGTH = getattr(settings, 'TIMELINE_LENGTH', 50)
+# フォロー時にタイムラインへ取り込む過去投稿数
+TIMELINE_BACKFILL = getattr(settings, 'TIMELINE_BACKFILL', 50)
+# bulk_create 1回あたりの件数
+TIMELINE_BATCH_SIZE = getattr(settings, 'TIMELINE_BATCH_SIZE', 1000)
+
+ENTRY_ORDERING = ('-date_posted', '-post')
+POST_ORDERING = ('-date_posted', '-id')
+
+
+def _sort_key(post):
+    return post.date_posted, post.pk
+
+
+def is_large_author(author_id):
+    """ 展開対象外の投稿者か判定 """
+    return User.objects.filter(pk=author_id, followers_count__gte=TIMELINE_FANOUT_LIMIT).exists()
+
+
+def large_author_ids(user):
+    """ userがフォローしている展開対象外の投稿者 """
+    return list(
+        Follow.objects.filter(user=user, follow_user__followers_count__gte=TIMELINE_FANOUT_LIMIT)
+        .values_list('follow_user_id', flat=True)
+    )
+
+
+def fanout_post(post):
+    """ 投稿を本人とフォロワーのタイムラインへ書き込む """
+    owner_ids = [post.author_id]
+    if not is_large_author(post.author_id):
+        owner_ids += Follow.objects.filter(follow_user=post.author_id).values_list('user_id', flat=True)
+    entries = [TimelineEntry(owner_id=owner_id, post=post, date_posted=post.date_posted)
+               for owner_id in owner_ids]
+    TimelineEntry.objects.bulk_create(entries, batch_size=TIMELINE_BATCH_SIZE, ignore_conflicts=True)
+
+
+def backfill(user, follow_user):
+    """ フォローした相手の投稿のうち、展開済みの範囲に入るものをタイムラインへ取り込む
+
+    それより古い投稿は読み込み時に取得されるので取り込まない
+    """
+    if is_large_author(follow_user.pk):
+        return
+    oldest = horizon(user)
+    if oldest is None:
+        return
+    posts = list(Post.objects.filter(author=follow_user).filter(keyset_filter(POST_ORDERING, oldest, reverse=True))
+                 .order_by(*POST_ORDERING)[:TIMELINE_BACKFILL])
+    entries = [TimelineEntry(owner=user, post=post, date_posted=post.date_posted) for post in posts]
+    TimelineEntry.objects.bulk_create(entries, batch_size=TIMELINE_BATCH_SIZE, ignore_conflicts=True)
+    if len(posts) == TIMELINE_BACKFILL:
+        # 取り込めなかった投稿と同じ範囲のエントリは消し、そこから先は読み込み時に取得する
+        oldest = posts[-1]
+        TimelineEntry.objects.filter(owner=user).filter(
+            keyset_filter(ENTRY_ORDERING, (oldest.date_posted, oldest.pk))).delete()
+
+
+def remove_author(user, follow_user):
+    """ フォロー解除した相手の投稿をタイムラインから除く """
+    TimelineEntry.objects.filter(owner=user, post__author=follow_user).delete()
+
+
+def rebuild(user):
+    """ userのタイムラインを作り直す """
+    TimelineEntry.objects.filter(owner=user).delete()
+    author_ids = [user.pk]
+    large_ids = set(large_author_ids(user))
+    for follow_user_id in Follow.objects.filter(user=user).values_list('follow_user_id', flat=True):
+        if follow_user_id not in large_ids:
+            author_ids.append(follow_user_id)
+    posts = Post.objects.filter(author_id__in=author_ids).order_by('-date_posted', '-id')[:TIMELINE_LENGTH]
+    entries = [TimelineEntry(owner=user, post=post, date_posted=post.date_posted) for post in posts]
+    TimelineEntry.objects.bulk_create(entries, batch_size=TIMELINE_BATCH_SIZE, ignore_conflicts=True)
+
+
+def horizon(user):
+    """ 展開済みのエントリのうち一番古い(date_posted, post_id)
+
+    エントリは常に新しい方から隙間なく展開しているので、これより新しい投稿は全てエントリにある
+    """
+    return (TimelineEntry.objects.filter(owner=user).order_by('date_posted', 'post')
+            .values_list('date_posted', 'post_id').first())
+
+
+def _ordered(queryset, ordering, position, reverse):
+    """ positionの次(reverse=Trueなら前)から並べる """
+    if position is not None:
+        queryset = queryset.filter(keyset_filter(ordering, position, reverse))
+    if reverse:
+        return queryset.order_by(*(field.lstrip('-') for field in ordering))
+    return queryset.order_by(*ordering)
+
+
+def get_timeline(user, limit=TIMELINE_LENGTH, position=None, reverse=False):
+    """ タイムラインを新しい順に最大limit件返す
+
+    展開済みの投稿と、フォロー中の大規模投稿者の投稿と、展開済みのエントリより古い投稿をマージする。
+    position(date_posted, id)を渡すとその次から、reverse=Trueなら前を古い順に返す
+    """
+    entries = TimelineEntry.objects.filter(owner=user).select_related('post__author')
+    posts = [entry.post for entry in _ordered(entries, ENTRY_ORDERING, position, reverse)[:limit]]
+    sources = [posts]
+
+    large_ids = large_author_ids(user)
+    if large_ids:
+        pulled = Post.objects.filter(author_id__in=large_ids).select_related('author')
+        sources.append(_ordered(pulled, POST_ORDERING, position, reverse)[:limit])
+
+    # エントリが足りない時(前のページへ戻る時も)は、展開済みより古い投稿を直接取得する
+    if reverse or len(posts) < limit:
+        followed = Follow.objects.filter(user=user).values('follow_user_id')
+        older = Post.objects.filter(Q(author=user) | Q(author__in=followed)).select_related('author')
+        oldest = horizon(user)
+        if oldest is not None:
+            older = older.filter(keyset_filter(POST_ORDERING, oldest))
+        sources.append(_ordered(older, POST_ORDERING, position, reverse)[:limit])
+
+    if len(sources) == 1:
+        return posts
+    merged = []
+    seen = set()
+    # 展開後に大規模投稿者になった場合などは同じ投稿が複数にあるので除く
+    for post in heapq.merge(*sources, key=_sort_key, reverse=not reverse):
+        if post.pk not in seen:
+            seen.add(post.pk)
+            merged.append(post)
+    return merged[:limit]
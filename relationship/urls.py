@@ -6,6 +6,8 @@ app_name = 'relationship'
 urlpatterns = [
     path('', views.PostList.as_view(), name='home'),
     path('post-details/<int:pk>', views.PostDetail.as_view(), name='post_detail'),
+    path('post-details/<int:pk>/comments', views.CommentList.as_view(), name='comment_list'),
+    path('reactions/', views.ReactionCounts.as_view(), name='reaction_counts'),
     path('follow/', views.FollowList.as_view(), name='follow'),
     path('follower/', views.FollowerList.as_view(), name='follower'),
     path('new/', views.PostCreate.as_view(), name="post_create"),
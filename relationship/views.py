@@ -1,72 +1,77 @@
 from django.contrib.auth import get_user_model
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.shortcuts import render, redirect
+from django.http import HttpResponseBadRequest, JsonResponse
+from django.shortcuts import get_object_or_404, render, redirect
 from django.urls import reverse_lazy
 from django.views import generic
 
-from .models import Follow, Post, Comment, Intimate
+from project.identity import IdentityMapObjectMixin, get_identity_map
+from project.pagination import CursorPaginationMixin
+
+from . import follows, intimates, reactions, timeline
+from .models import Follow, Post, Comment, Reaction
 from .forms import CommentForm
 
 User = get_user_model()
 
 
-class PostList(LoginRequiredMixin, generic.ListView):
+class PostList(LoginRequiredMixin, CursorPaginationMixin, generic.ListView):
     template_name = 'relationship/home.html'
     model = Post
     context_object_name = 'object_list'
+    cursor_ordering = ('-date_posted', '-id')
 
-    def queryset(self):
-        """ 自分とフォローしているユーザーを取得してPost.objectを表示 """
-        request_user = self.request.user
-        qs = Follow.objects.filter(user=request_user)
-        follows = [request_user, ]
-        for user in qs:
-            follows.append(user.follow_user)
-        queryset = Post.objects.filter(author__in=follows).order_by('-date_posted')
-        return queryset
+    def get_cursor_slice(self, queryset, position, reverse, size):
+        """ 展開済みのタイムラインから自分とフォローしているユーザーのPostを表示 """
+        return timeline.get_timeline(self.request.user, size, position, reverse)
 
     def get_context_data(self, *args, **kwargs):
         ctx = super().get_context_data()
         request_user = self.request.user
-        # フォロー数をカウント
-        ctx['follows_count'] = Follow.objects.filter(user=request_user).count()
-        # フォロワー数をカウント
-        ctx['followers_count'] = Follow.objects.filter(follow_user=request_user).count()
+        # フォロー数
+        ctx['follows_count'] = request_user.follows_count
+        # フォロワー数
+        ctx['followers_count'] = request_user.followers_count
         return ctx
 
 
-class FollowList(LoginRequiredMixin, generic.ListView):
+class FollowList(LoginRequiredMixin, CursorPaginationMixin, generic.ListView):
     """ フォローリスト """
     model = Follow
     template_name = 'relationship/follow_list.html'
-    context_object_name = 'objects_list'
+    context_object_name = 'follow_users'
+    cursor_ordering = ('-date', '-id')
+
+    def get_queryset(self):
+        """ フォローユーザーを表示 """
+        return Follow.objects.filter(user=self.request.user).select_related('follow_user')
 
     def get_context_data(self, *args, **kwargs):
         ctx = super().get_context_data()
         request_user = self.request.user
-        # フォローユーザーを表示
-        ctx['follow_users'] = Follow.objects.filter(user=request_user)
-        # フォローユーザー数をカウント
-        ctx['follow_user_count'] = Follow.objects.filter(user=request_user).count()
+        # フォローユーザー数
+        ctx['follow_user_count'] = request_user.follows_count
         return ctx
 
 
-class FollowerList(LoginRequiredMixin, generic.ListView):
+class FollowerList(LoginRequiredMixin, CursorPaginationMixin, generic.ListView):
     """ フォロワーリスト """
     model = Follow
     template_name = 'relationship/follower_list.html'
+    context_object_name = 'my_followers'
+    cursor_ordering = ('-date', '-id')
+
+    def get_queryset(self):
+        """ フォロワーユーザーを表示 """
+        return Follow.objects.filter(follow_user=self.request.user).select_related('user')
 
     def get_context_data(self, *args, **kwargs):
         ctx = super().get_context_data()
         request_user = self.request.user
-        # フォロワーユーザーを表示
-        ctx['my_followers'] = Follow.objects.filter(follow_user=request_user)
-        # フォロワーユーザー数をカウント
-        ctx['my_followers_count'] = Follow.objects.filter(follow_user=request_user).count()
-        # フォローリスト(qs)を返す
-        qs = Follow.objects.filter(user=request_user)
-        follow_lst = [i for i in qs]
-        ctx['follower_lst'] = follow_lst
+        # フォロワーユーザー数
+        ctx['my_followers_count'] = request_user.followers_count
+        # 表示中のフォロワーをフォローしているかを1クエリで取得しておく
+        follows.follow_state(self.request).load(follower.user_id for follower in ctx['my_followers'])
         return ctx
 
     def post(self, *args, **kwargs):
@@ -75,29 +80,25 @@ class FollowerList(LoginRequiredMixin, generic.ListView):
             # request_userを取得
             request_user = self.request.user
 
-            # follow_request_userを取得
-            follow_request_user = self.request.POST['follow']
-            str_follow_request_user = str(follow_request_user)
-
-            # フォローリストを作成
-            get_user_qs = Follow.objects.filter(user=request_user)
-            follow_lst = []
-            for follow in get_user_qs:
-                follow_lst.append(str(follow.follow_user))
-
-            # リスト内にいなければ追加、いればスルーする
-            if str_follow_request_user in follow_lst:
-                pass
-            else:
-                my_instance = User.objects.get(account_name=request_user.account_name)
-                follow_user = User.objects.get(account_name=follow_request_user)
-                new = Follow(user=my_instance, follow_user=follow_user)
-                new.save()
+            # follow_request_userを取得して、まだフォローしていなければ追加する
+            follow_user = get_object_or_404(User, account_name=self.request.POST['follow'])
+            if follows.follow(request_user, follow_user):
                 return redirect('relationship:home')
         return self.get(self, *args, **kwargs)
 
 
-class PostDetail(LoginRequiredMixin, generic.DetailView):
+class CommentList(LoginRequiredMixin, CursorPaginationMixin, generic.ListView):
+    """ 投稿に紐づいたコメント(新しい順) """
+    model = Comment
+    template_name = 'relationship/comment_list.html'
+    context_object_name = 'comments'
+    cursor_ordering = ('-date_posted', '-id')
+
+    def get_queryset(self):
+        return Comment.objects.filter(post_connected=self.kwargs['pk']).select_related('author')
+
+
+class PostDetail(LoginRequiredMixin, IdentityMapObjectMixin, generic.DetailView):
     """ 投稿内容の表示 """
     template_name = 'relationship/post_detail.html'
     model = Post
@@ -111,37 +112,36 @@ class PostDetail(LoginRequiredMixin, generic.DetailView):
             """ フォロー機能 """
             if 'follow' in self.request.POST:
 
-                # follow_request_userを取得
-                follow_request_user = self.request.POST['follow']
-                str_follow_request_user = str(follow_request_user)
-
-                # フォローリストを作成
-                get_user_qs = Follow.objects.filter(user=request_user)
-                follow_lst = []
-                for follow in get_user_qs:
-                    follow_lst.append(str(follow.follow_user))
-
-                # リスト内にいなければ追加、いればスルーする
-                if str_follow_request_user in follow_lst:
-                    pass
-                else:
-                    my_instance = User.objects.get(account_name=request_user.account_name)
-                    follow_user = User.objects.get(account_name=follow_request_user)
-                    new = Follow(user=my_instance, follow_user=follow_user)
-                    new.save()
+                # follow_request_userを取得して、まだフォローしていなければ追加する
+                follow_user = get_object_or_404(User, account_name=self.request.POST['follow'])
+                if follows.follow(request_user, follow_user):
                     return redirect('relationship:home')
                 return self.get(self, *args, **kwargs)
 
+            """ いいね・よくないね """
+            if 'reaction' in self.request.POST:
+                kind = self.request.POST['reaction']
+                post = get_identity_map(self.request).get_or_404(Post, pk=self.kwargs['pk'])
+                if kind in Reaction.Kind.values:
+                    reactions.react(request_user, post, kind)
+                elif kind == 'cancel':
+                    reactions.unreact(request_user, post)
+                else:
+                    return HttpResponseBadRequest()
+                return redirect('relationship:post_detail', self.kwargs['pk'])
+
             """ コメント投稿 """
             if 'comment' in self.request.POST:
                 get_form = CommentForm(self.request.POST)
+                if not get_form.is_valid():
+                    return self.get(self, *args, **kwargs)
                 form = get_form.save(commit=False)
                 form.author = request_user
-                form.post_connected = Post.objects.get(pk=self.kwargs.get('pk'))
+                form.post_connected = get_identity_map(self.request).get_or_404(Post, pk=self.kwargs['pk'])
                 content = {
                     'author': request_user,
                     'form': form,
-                    'post_connected': Post.objects.get(pk=self.kwargs.get('pk')),
+                    'post_connected': form.post_connected,
                     'comment_form': CommentForm(),
                 }
             # 確認画面へ渡す
@@ -150,11 +150,11 @@ class PostDetail(LoginRequiredMixin, generic.DetailView):
             """ コメント確認画面 """
             if 'confirm' in self.request.POST:
                 form = CommentForm(self.request.POST)
-                commit = form.save(commit=False)
-                commit.author = User.objects.get(account_name=request_user)
-                commit.content = self.request.POST['content']
-                commit.post_connected = Post.objects.get(content=Post.objects.get(pk=self.kwargs.get('pk')))
                 if form.is_valid():
+                    commit = form.save(commit=False)
+                    commit.author = request_user
+                    # 投稿は主キーで1回だけ取得する
+                    commit.post_connected = get_identity_map(self.request).get_or_404(Post, pk=self.kwargs['pk'])
                     commit.save()
                     return redirect('relationship:post_detail', self.kwargs["pk"])
                 return self.get(self, *args, **kwargs)
@@ -162,8 +162,14 @@ class PostDetail(LoginRequiredMixin, generic.DetailView):
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data()
-        # 投稿に紐づいたコメント
-        ctx['comments'] = Comment.objects.filter(post_connected=self.kwargs.get('pk'))
+        # 投稿に紐づいたコメント(CommentListと同じページング)
+        comment_list = CommentList()
+        comment_list.setup(self.request, *self.args, **self.kwargs)
+        _, ctx['page_obj'], ctx['comments'], _ = comment_list.paginate_queryset(
+            comment_list.get_queryset(), comment_list.paginate_by)
+        # いいね・よくないねの数と、自分が付けたもの
+        ctx['reaction_counts'] = reactions.counts([self.object.pk])[self.object.pk]
+        ctx['my_reaction'] = reactions.reacted_kinds(self.request.user, [self.object.pk]).get(self.object.pk)
         # コメント投稿
         ctx['form'] = CommentForm(instance=self.request.user)
         # 自分自身
@@ -171,6 +177,23 @@ class PostDetail(LoginRequiredMixin, generic.DetailView):
         return ctx
 
 
+class ReactionCounts(LoginRequiredMixin, generic.View):
+    """ ?ids=1,2,3 の投稿のいいね・よくないねの数をまとめて返す """
+
+    def get(self, request, *args, **kwargs):
+        try:
+            post_ids = [int(pk) for pk in request.GET.get('ids', '').split(',') if pk]
+        except ValueError:
+            return HttpResponseBadRequest()
+        if len(post_ids) > reactions.REACTION_BATCH_LIMIT:
+            return HttpResponseBadRequest()
+        counts = reactions.counts(post_ids)
+        reacted = reactions.reacted_kinds(request.user, counts)
+        return JsonResponse({
+            'posts': {str(pk): dict(value, reacted=reacted.get(pk)) for pk, value in counts.items()},
+        })
+
+
 class PostUpdate(LoginRequiredMixin, generic.UpdateView):
     template_name = 'relationship/post_create.html'
     model = Post
@@ -190,10 +213,13 @@ class PostCreate(LoginRequiredMixin, generic.CreateView):
 
     def form_valid(self, form):
         form.instance.author = self.request.user
-        return super().form_valid(form)
+        response = super().form_valid(form)
+        # フォロワーのタイムラインへ展開
+        timeline.fanout_post(self.object)
+        return response
 
 
-class UserProfile(LoginRequiredMixin, generic.DetailView):
+class UserProfile(LoginRequiredMixin, IdentityMapObjectMixin, generic.DetailView):
     model = User
     template_name = 'relationship/user_profile.html'
     context_object_name = 'objects'
@@ -202,13 +228,10 @@ class UserProfile(LoginRequiredMixin, generic.DetailView):
         ctx = super().get_context_data()
         """ リクエスト済みユーザーの判定 """
         # 本人と閲覧ユーザーのUser情報を取得
-        user = User.objects.get(email=self.request.user)
-        request_user = User.objects.get(pk=self.kwargs.get('pk'))
+        user = self.request.user
+        request_user = self.object
         # 既にリクエストしているか判定してTemplateに返す
-        if Intimate.objects.filter(sender=user, receiver=request_user):
-            ctx['request_done'] = True
-        else:
-            ctx['request_done'] = False
+        ctx['request_done'] = intimates.has_requested(user, request_user.pk)
         # 自分自身かを判定
         if user.email == request_user.email:
             ctx['myself'] = True
@@ -217,24 +240,11 @@ class UserProfile(LoginRequiredMixin, generic.DetailView):
     def post(self, *args, **kwargs):
         if self.request.method == 'POST':
             """ 承認リクエスト """
-            get_sender = self.request.user
             get_receiver = self.kwargs.get('pk')
-            sender_ins = User.objects.get(email=get_sender)
-            receiver_ins = User.objects.get(pk=get_receiver)
+            receiver_ins = get_object_or_404(User, pk=get_receiver)
 
-            # リクエスト済みユーザーなら保存しない
-            sender_qs = Intimate.objects.filter(sender=sender_ins)
-            for i in sender_qs:
-                if i.sender == get_sender and receiver_ins.email == str(i.receiver):
-                    return self.get(self, *args, **kwargs)
-
-            # リクエストされていたら保存しない
-            receiver_qs = Intimate.objects.filter(sender=receiver_ins)
-            for u in receiver_qs:
-                if u.sender.email == receiver_ins.email and u.receiver == get_sender:
-                    return self.get(self, *args, **kwargs)
-
-            intimate_ins = Intimate(sender=sender_ins, receiver=receiver_ins, request=True, approval=False)
-            intimate_ins.save()
+            # どちらかから既にリクエストされていたら保存しない
+            if not intimates.send_request(self.request.user, receiver_ins):
+                return self.get(self, *args, **kwargs)
             return redirect('relationship:user_profile', get_receiver)
         return self.get(self, *args, **kwargs)
\ No newline at end of file
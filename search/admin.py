@@ -0,0 +1,9 @@
+from django.contrib import admin
+from .models import Document
+
+
+@admin.register(Document)
+class DocumentAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'object_id', 'title', 'date')
+    list_filter = ('kind',)
+    search_fields = ('title',)
@@ -0,0 +1,168 @@
+import math
+from collections import Counter
+
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import Case, Count, F, FloatField, IntegerField, Max, Q, Sum, Value, When
+
+from .models import Document, Posting
+from .text import query_terms, tokenize
+
+# 'fts5' / 'inverted' / None(SQLiteでFTS5が使えればfts5)
+SEARCH_BACKEND = getattr(settings, 'SEARCH_BACKEND', None)
+
+FTS_TABLE = 'search_document_fts'
+
+
+def fts5_available(connection):
+    """ SQLiteがFTS5付きでビルドされているか """
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        if cursor.fetchone()[0]:
+            return True
+        # ローダブル拡張として入っている場合もあるので作ってみる
+        try:
+            cursor.execute('CREATE VIRTUAL TABLE temp.search_fts5_probe USING fts5(x)')
+        except Exception:
+            return False
+        cursor.execute('DROP TABLE temp.search_fts5_probe')
+    return True
+
+
+class InvertedIndexBackend:
+    """ PostingテーブルにPythonで作った転置インデックスを持つ(どのDBでも動く) """
+    name = 'inverted'
+
+    def __init__(self, using):
+        self.using = using
+
+    def ensure_schema(self):
+        pass
+
+    def index(self, documents):
+        """ Documentの語を登録し直す """
+        Posting.objects.using(self.using).filter(document__in=documents)._raw_delete(self.using)
+        Posting.objects.using(self.using).bulk_create([
+            Posting(term=term, document=document, tf=tf)
+            for document in documents
+            for term, tf in Counter(tokenize(f'{document.title} {document.body}')).items()
+        ], batch_size=1000)
+
+    def remove(self, document_ids):
+        # Postingは文書と一緒に消える
+        pass
+
+    def clear(self):
+        Posting.objects.using(self.using).all()._raw_delete(self.using)
+
+    def search(self, query, offset, limit, kinds=None):
+        """ 全ての語を含む文書を TF-IDF の降順で (document_id, score) のリストにする(kindsがあればその種類だけ) """
+        terms = query_terms(query)
+        if not terms:
+            return []
+        conditions = [Q(term__startswith=term) if prefix else Q(term=term) for term, prefix in terms]
+        postings = Posting.objects.using(self.using).filter(_any(conditions))
+
+        # 語ごとの文書頻度からIDFを求める
+        total = Document.objects.using(self.using).count()
+        frequencies = postings.aggregate(**{
+            f'df{i}': Count('document', filter=condition, distinct=True) for i, condition in enumerate(conditions)})
+        if not all(frequencies.values()):
+            return []
+        idf = [math.log(1 + total / frequencies[f'df{i}']) for i in range(len(conditions))]
+
+        matched = sum(Max(Case(When(condition, then=Value(1)), default=Value(0), output_field=IntegerField()))
+                      for condition in conditions)
+        score = Sum(Case(*[When(condition, then=F('tf') * Value(weight)) for condition, weight in zip(conditions, idf)],
+                         default=Value(0.0), output_field=FloatField()))
+        if kinds is not None:
+            postings = postings.filter(document__kind__in=kinds)
+        rows = (postings.order_by().values('document')
+                .annotate(matched=matched, score=score).filter(matched=len(conditions))
+                .order_by('-score', '-document').values_list('document', 'score')[offset:offset + limit])
+        return list(rows)
+
+
+class Fts5Backend:
+    """ SQLiteのFTS5を使う(語の分割はInvertedIndexBackendと同じtokenize) """
+    name = 'fts5'
+
+    def __init__(self, using):
+        self.using = using
+
+    @property
+    def connection(self):
+        return connections[self.using]
+
+    def ensure_schema(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(title, body)')
+
+    def index(self, documents):
+        documents = list(documents)
+        self.remove([document.pk for document in documents])
+        rows = [(document.pk, ' '.join(tokenize(document.title)), ' '.join(tokenize(document.body)))
+                for document in documents]
+        with self.connection.cursor() as cursor:
+            # executemanyはdebug_toolbarのSQLパネルが扱えないので、複数行のINSERTにする
+            for start in range(0, len(rows), 300):
+                chunk = rows[start:start + 300]
+                cursor.execute(
+                    f'INSERT INTO {FTS_TABLE} (rowid, title, body) VALUES {", ".join(["(%s, %s, %s)"] * len(chunk))}',
+                    [value for row in chunk for value in row])
+
+    def remove(self, document_ids):
+        document_ids = list(document_ids)
+        with self.connection.cursor() as cursor:
+            for start in range(0, len(document_ids), 500):
+                chunk = document_ids[start:start + 500]
+                cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({", ".join(["%s"] * len(chunk))})', chunk)
+
+    def clear(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+
+    def search(self, query, offset, limit, kinds=None):
+        """ 全ての語を含む文書を bm25 の順に (document_id, score) のリストにする(kindsがあればその種類だけ) """
+        terms = query_terms(query)
+        if not terms:
+            return []
+        match = ' '.join(f'"{term}"*' if prefix else f'"{term}"' for term, prefix in terms)
+        join = where = ''
+        params = [match]
+        if kinds is not None:
+            kinds = list(kinds)
+            table = Document._meta.db_table
+            join = f' JOIN {table} ON {table}.id = {FTS_TABLE}.rowid'
+            where = f' AND {table}.kind IN ({", ".join(["%s"] * len(kinds))})' if kinds else ' AND 0'
+            params += kinds
+        with self.connection.cursor() as cursor:
+            # タイトルの一致を本文の2倍に数える。bm25は小さいほど良い
+            cursor.execute(
+                f'SELECT {FTS_TABLE}.rowid, -bm25({FTS_TABLE}, 2.0, 1.0) AS score FROM {FTS_TABLE}{join} '
+                f'WHERE {FTS_TABLE} MATCH %s{where} ORDER BY score DESC, {FTS_TABLE}.rowid DESC LIMIT %s OFFSET %s',
+                params + [limit, offset])
+            return cursor.fetchall()
+
+
+def _any(conditions):
+    q = Q()
+    for condition in conditions:
+        q |= condition
+    return q
+
+
+_backends = {}
+
+
+def get_backend(using=None):
+    """ DBに合った検索バックエンドを返す """
+    using = using or router.db_for_write(Document)
+    if using not in _backends:
+        if SEARCH_BACKEND == 'inverted' or (SEARCH_BACKEND is None and not fts5_available(connections[using])):
+            _backends[using] = InvertedIndexBackend(using)
+        else:
+            _backends[using] = Fts5Backend(using)
+    return _backends[using]
@@ -0,0 +1,152 @@
+import datetime
+
+from django.apps import apps
+from django.db import transaction
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.html import strip_tags
+
+from .backends import get_backend
+from .models import Document
+
+Kind = Document.Kind
+
+
+class Source:
+    """ 検索対象のモデルと、Documentへの変換方法 """
+
+    def __init__(self, kind, model, body, url, title=None, date='date_posted', url_field='pk'):
+        self.kind = kind
+        self.model_label = model
+        self.body = body
+        self.title = title
+        self.date = date
+        self.url = url
+        self.url_field = url_field
+
+    @property
+    def model(self):
+        return apps.get_model(self.model_label)
+
+    def queryset(self):
+        fields = {'pk', self.body, self.date, self.url_field} | ({self.title} if self.title else set())
+        return self.model._default_manager.only(*fields).order_by('pk')
+
+    def url_arg(self, obj):
+        if self.url_field == 'pk':
+            return obj.pk
+        return getattr(obj, self.model._meta.get_field(self.url_field).attname)
+
+    def to_document(self, obj):
+        date = getattr(obj, self.date)
+        if not isinstance(date, datetime.datetime):
+            date = timezone.make_aware(datetime.datetime.combine(date, datetime.time.min))
+        return Document(
+            kind=self.kind,
+            object_id=obj.pk,
+            title=strip_tags(getattr(obj, self.title))[:50] if self.title else '',
+            body=strip_tags(getattr(obj, self.body)),
+            url=reverse(self.url, args=[self.url_arg(obj)]),
+            date=date,
+        )
+
+
+SOURCES = {
+    Kind.POST: Source(Kind.POST, 'relationship.Post', 'content', 'relationship:post_detail'),
+    Kind.SEEK: Source(Kind.SEEK, 'seekforadvice.Seek', 'content', 'seekforadvice:detail'),
+    Kind.ADVICE: Source(Kind.ADVICE, 'seekforadvice.Advice', 'content', 'seekforadvice:detail',
+                        url_field='post_connected'),
+    Kind.ARTICLE: Source(Kind.ARTICLE, 'article.Article', 'text', 'article:detail',
+                         title='title', date='created_at'),
+}
+
+# ログインしないと詳細を見られない種類
+LOGIN_REQUIRED_KINDS = (Kind.POST,)
+
+
+def source_for(model):
+    for source in SOURCES.values():
+        if source.model is model:
+            return source
+    return None
+
+
+def index_objects(source, objs):
+    """ objsのDocumentを作り直して索引に登録する """
+    documents = [source.to_document(obj) for obj in objs]
+    if not documents:
+        return 0
+    with transaction.atomic():
+        existing = dict(Document.objects.filter(kind=source.kind, object_id__in=[d.object_id for d in documents])
+                        .values_list('object_id', 'pk'))
+        for document in documents:
+            document.pk = existing.get(document.object_id)
+        updates = [document for document in documents if document.pk is not None]
+        Document.objects.bulk_update(updates, ['title', 'body', 'url', 'date'], batch_size=500)
+        Document.objects.bulk_create([document for document in documents if document.pk is None], batch_size=500)
+        if any(document.pk is None for document in documents):
+            # bulk_createでpkが返らないDBでは取り直す
+            ids = dict(Document.objects.filter(kind=source.kind, object_id__in=[d.object_id for d in documents])
+                       .values_list('object_id', 'pk'))
+            for document in documents:
+                document.pk = ids[document.object_id]
+        get_backend().index(documents)
+    return len(documents)
+
+
+def remove_objects(kind, object_ids):
+    """ 削除されたオブジェクトのDocumentを索引から外す """
+    with transaction.atomic():
+        documents = Document.objects.filter(kind=kind, object_id__in=object_ids)
+        get_backend().remove(list(documents.values_list('pk', flat=True)))
+        documents.delete()
+
+
+def rebuild(kinds=None, chunk_size=1000, progress=None):
+    """ 索引を作り直す。progress(kind, 件数)で進捗を通知する """
+    backend = get_backend()
+    backend.ensure_schema()
+    kinds = kinds or list(SOURCES)
+    if set(kinds) == set(SOURCES):
+        backend.clear()
+        Document.objects.all()._raw_delete(Document.objects.db)
+    else:
+        for kind in kinds:
+            documents = Document.objects.filter(kind=kind)
+            backend.remove(documents.values_list('pk', flat=True))
+            documents.delete()
+
+    total = 0
+    for kind in kinds:
+        source = SOURCES[kind]
+        queryset = source.queryset()
+        last_pk = 0
+        while True:
+            chunk = list(queryset.filter(pk__gt=last_pk)[:chunk_size])
+            if not chunk:
+                break
+            total += index_objects(source, chunk)
+            last_pk = chunk[-1].pk
+            if progress:
+                progress(kind, total)
+    return total
+
+
+def visible_kinds(user):
+    """ userが検索できる種類(Noneなら全て)。投稿はログインしないと見られない """
+    if user.is_authenticated:
+        return None
+    return [kind for kind in SOURCES if kind not in LOGIN_REQUIRED_KINDS]
+
+
+def search(query, offset=0, limit=20, kinds=None):
+    """ 検索結果のDocumentを関連度の高い順に返す(kindsがあればその種類だけ) """
+    rows = get_backend().search(query, offset, limit, kinds)
+    documents = Document.objects.in_bulk([document_id for document_id, _ in rows])
+    results = []
+    for document_id, score in rows:
+        document = documents.get(document_id)
+        if document is not None:
+            document.score = score
+            results.append(document)
+    return results
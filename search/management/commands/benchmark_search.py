@@ -0,0 +1,108 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.utils import timezone
+
+from search.backends import Fts5Backend, InvertedIndexBackend, fts5_available
+from search.models import Document
+
+# ベンチマーク用の文書の種類(テスト用DBに入れるので実際の検索結果には出ない)
+BENCH_KIND = Document.Kind.POST
+
+WORDS = (
+    '相談', '仕事', '転職', '恋愛', '友達', '家族', '勉強', '健康', '睡眠', '料理',
+    '旅行', '趣味', '音楽', '映画', '読書', '運動', '筋トレ', 'ダイエット', '貯金', '投資',
+    'プログラミング', 'デザイン', '英語', '資格', '面接', '上司', '同僚', '先輩', '後輩', '結婚',
+    '引っ越し', '一人暮らし', 'ペット', 'カフェ', 'ラーメン', '東京', '大阪', '週末', '朝活', '夜更かし',
+    'python', 'django', 'sqlite', 'career', 'remote', 'startup', 'design', 'music', 'travel', 'coffee',
+)
+
+
+class Command(BaseCommand):
+    """ 大量の文書を入れた時の検索の速さを測る
+
+    文書はテストと同じくtest_の付いた別のDBに入れ、終わったらDBごと消す
+    """
+    help = 'Measure search query latency against a large synthetic index.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--documents', type=int, default=1_000_000)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--backend', choices=['fts5', 'inverted'], default=None,
+                            help='Backend to measure (default: the one the site uses).')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Keep the benchmark database and add to its documents on the next run.')
+
+    def get_backend(self, name):
+        using = Document.objects.db
+        if name is None:
+            name = 'fts5' if fts5_available(connections[using]) else 'inverted'
+        if name == 'fts5':
+            if not fts5_available(connections[using]):
+                raise CommandError('FTS5 is not available on this database')
+            return Fts5Backend(using)
+        return InvertedIndexBackend(using)
+
+    def handle(self, *args, **options):
+        connection = connections[Document.objects.db]
+        old_name = connection.settings_dict['NAME']
+        # 本番の索引に文書を入れないよう、テスト用のDBへ切り替える
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False,
+                                           keepdb=options['keepdb'])
+        try:
+            backend = self.get_backend(options['backend'])
+            backend.ensure_schema()
+            rng = random.Random(options['seed'])
+            # よく使われる語ほど多く出てくるようにする(Zipf分布)
+            weights = [1 / rank for rank in range(1, len(WORDS) + 1)]
+            self.fill(backend, rng, weights, options['documents'], options['chunk_size'])
+            self.measure(backend, rng, weights, options['queries'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+
+    def fill(self, backend, rng, weights, count, chunk_size):
+        started = time.perf_counter()
+        now = timezone.now()
+        start = (Document.objects.filter(kind=BENCH_KIND).order_by('-object_id')
+                 .values_list('object_id', flat=True).first() or 0) + 1
+        for offset in range(start, start + count, chunk_size):
+            ids = range(offset, min(offset + chunk_size, start + count))
+            with transaction.atomic():
+                Document.objects.bulk_create([Document(
+                    kind=BENCH_KIND, object_id=i, url='', date=now,
+                    body='、'.join(rng.choices(WORDS, weights, k=rng.randint(5, 30))) + 'について',
+                ) for i in ids])
+                backend.index(Document.objects.filter(kind=BENCH_KIND, object_id__in=ids))
+            done = ids[-1] - start + 1
+            self.stdout.write(f'indexed {done}/{count} documents '
+                              f'({done / (time.perf_counter() - started):.0f}/s)')
+
+    def measure(self, backend, rng, weights, count):
+        queries = []
+        for _ in range(count):
+            # 1語・2語・よく出る語と珍しい語の組み合わせを混ぜる
+            words = rng.choices(WORDS, weights, k=rng.randint(1, 2))
+            if rng.random() < 0.3:
+                words.append(rng.choice(WORDS[-10:]))
+            queries.append(' '.join(words))
+
+        latencies = []
+        for query in queries:
+            started = time.perf_counter()
+            backend.search(query, 0, 20)
+            latencies.append((time.perf_counter() - started) * 1000)
+        latencies.sort()
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))]
+
+        total = Document.objects.filter(kind=BENCH_KIND).count()
+        self.stdout.write(self.style.SUCCESS(
+            f'{backend.name}: {len(queries)} queries over {total} documents: '
+            f'mean {statistics.mean(latencies):.1f}ms p50 {percentile(50):.1f}ms '
+            f'p95 {percentile(95):.1f}ms p99 {percentile(99):.1f}ms'))
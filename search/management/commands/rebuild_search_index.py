@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from search import documents
+from search.backends import get_backend
+
+
+class Command(BaseCommand):
+    """ 検索用の索引を作り直す """
+    help = 'Rebuild the search index for posts, seeks, advices and articles.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kinds', nargs='*', help='Only rebuild these kinds (default: all).')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        unknown = set(options['kinds']) - set(documents.SOURCES)
+        if unknown:
+            raise CommandError(f'unknown kinds: {", ".join(sorted(unknown))} (choose from {", ".join(documents.SOURCES)})')
+        started = time.perf_counter()
+
+        def progress(kind, total):
+            self.stdout.write(f'{kind}: indexed {total} documents')
+
+        total = documents.rebuild(options['kinds'], options['chunk_size'], progress)
+        self.stdout.write(self.style.SUCCESS(
+            f'indexed {total} documents with {get_backend().name} in {time.perf_counter() - started:.2f}s'))
@@ -0,0 +1,52 @@
+# Generated by Django 3.1.6 on 2026-10-18 12:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Document',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('post', '投稿'), ('seek', '相談'), ('advice', 'アドバイス'), ('article', '記事')], max_length=10)),
+                ('object_id', models.PositiveIntegerField()),
+                ('title', models.CharField(blank=True, max_length=50)),
+                ('body', models.TextField()),
+                ('url', models.CharField(max_length=200)),
+                ('date', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'document',
+                'verbose_name_plural': 'SearchDocument',
+            },
+        ),
+        migrations.CreateModel(
+            name='Posting',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('tf', models.PositiveIntegerField()),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='postings', to='search.document')),
+            ],
+            options={
+                'verbose_name': 'posting',
+                'verbose_name_plural': 'SearchPosting',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='document',
+            constraint=models.UniqueConstraint(fields=('kind', 'object_id'), name='unique_search_document'),
+        ),
+        migrations.AddConstraint(
+            model_name='posting',
+            constraint=models.UniqueConstraint(fields=('term', 'document'), name='unique_search_posting'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations
+
+from search.backends import FTS_TABLE, get_backend
+
+
+def create_fts_table(apps, schema_editor):
+    # FTS5が使えないDBではPostingテーブルを使うので何もしない
+    get_backend(schema_editor.connection.alias).ensure_schema()
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
@@ -0,0 +1,45 @@
+from django.db import models
+
+
+class Document(models.Model):
+    """ 検索対象の文書(投稿・相談・アドバイス・記事を1つの表にまとめたもの) """
+
+    class Kind(models.TextChoices):
+        POST = 'post', '投稿'
+        SEEK = 'seek', '相談'
+        ADVICE = 'advice', 'アドバイス'
+        ARTICLE = 'article', '記事'
+
+    kind = models.CharField(max_length=10, choices=Kind.choices)
+    object_id = models.PositiveIntegerField()
+    title = models.CharField(max_length=50, blank=True)
+    body = models.TextField()
+    url = models.CharField(max_length=200)
+    date = models.DateTimeField()
+
+    def __str__(self):
+        return f'{self.kind}：{self.object_id}'
+
+    class Meta:
+        verbose_name = "document"
+        verbose_name_plural = "SearchDocument"
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='unique_search_document'),
+        ]
+
+
+class Posting(models.Model):
+    """ 転置インデックス(FTS5が使えないDB用) """
+    term = models.CharField(max_length=64)
+    document = models.ForeignKey(Document, related_name='postings', on_delete=models.CASCADE)
+    tf = models.PositiveIntegerField()
+
+    def __str__(self):
+        return f'{self.term}：{self.document_id}'
+
+    class Meta:
+        verbose_name = "posting"
+        verbose_name_plural = "SearchPosting"
+        constraints = [
+            models.UniqueConstraint(fields=['term', 'document'], name='unique_search_posting'),
+        ]
@@ -0,0 +1,23 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from .documents import SOURCES, index_objects, remove_objects, source_for
+
+
+def _saved(sender, instance, raw=False, **kwargs):
+    """ 保存された投稿などをコミット後に索引へ登録する """
+    if raw:
+        return
+    transaction.on_commit(partial(index_objects, source_for(sender), [instance]))
+
+
+def _deleted(sender, instance, **kwargs):
+    transaction.on_commit(partial(remove_objects, source_for(sender).kind, [instance.pk]))
+
+
+def connect():
+    for kind, source in SOURCES.items():
+        post_save.connect(_saved, sender=source.model, dispatch_uid=f'search_index_{kind}')
+        post_delete.connect(_deleted, sender=source.model, dispatch_uid=f'search_remove_{kind}')
@@ -0,0 +1,43 @@
+from django.test import TestCase
+from django.urls import reverse
+
+from project.testing import create_user
+from relationship.models import Post
+from seekforadvice.models import Seek
+
+from . import documents
+from .backends import InvertedIndexBackend
+from .models import Document
+
+Kind = Document.Kind
+
+
+class SearchTests(TestCase):
+
+    def setUp(self):
+        self.user = create_user('searcher')
+        Post.objects.create(author=self.user, content='django の投稿')
+        Seek.objects.create(author=self.user, content='django の相談')
+        documents.rebuild()
+
+    def search(self):
+        response = self.client.get(reverse('search:search'), {'q': 'django'})
+        self.assertEqual(response.status_code, 200)
+        return {result.kind for result in response.context['results']}
+
+    def test_anonymous_users_do_not_see_posts(self):
+        self.assertEqual(self.search(), {Kind.SEEK})
+
+    def test_logged_in_users_see_every_kind(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.search(), {Kind.POST, Kind.SEEK})
+
+    def test_backends_filter_kinds(self):
+        inverted = InvertedIndexBackend(Document.objects.db)
+        inverted.index(list(Document.objects.all()))
+        seek = Document.objects.get(kind=Kind.SEEK).pk
+        for backend in (documents.get_backend(), inverted):
+            with self.subTest(backend.name):
+                self.assertEqual(len(backend.search('django', 0, 20)), 2)
+                self.assertEqual([pk for pk, _ in backend.search('django', 0, 20, [Kind.SEEK])], [seek])
+                self.assertEqual(backend.search('django', 0, 20, []), [])
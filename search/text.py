@@ -0,0 +1,40 @@
+import re
+import unicodedata
+
+# ひらがな・カタカナ・漢字(単語の区切りがないので2文字ずつに分ける)
+_CJK = '々぀-ヿ㐀-䶿一-鿿豈-﫿'
+_TOKEN_RE = re.compile(f'([{_CJK}]+)|((?:(?![{_CJK}])[^\\W_])+)')
+
+# 1つの語の最大の長さ(Posting.term)
+MAX_TERM_LENGTH = 64
+
+
+def normalize(text):
+    """ 全角英数・半角カナなどを揃えて小文字にする """
+    return unicodedata.normalize('NFKC', text).lower()
+
+
+def tokenize(text):
+    """ 英数字は単語ごと、日本語は2文字ずつ(bi-gram)に分ける
+
+    「機械学習」 -> ['機械', '械学', '学習']、1文字だけなら ['機']
+    """
+    tokens = []
+    for cjk, word in _TOKEN_RE.findall(normalize(text)):
+        if cjk:
+            if len(cjk) == 1:
+                tokens.append(cjk)
+            else:
+                tokens.extend(cjk[i:i + 2] for i in range(len(cjk) - 1))
+        else:
+            tokens.append(word[:MAX_TERM_LENGTH])
+    return tokens
+
+
+def query_terms(query):
+    """ 検索語を (語, 前方一致か) のリストにする
+
+    日本語1文字の語は、その文字から始まるbi-gramにも一致させる
+    """
+    terms = dict.fromkeys(tokenize(query))
+    return [(term, len(term) == 1 and bool(re.match(f'[{_CJK}]', term))) for term in terms]
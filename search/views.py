@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.http import Http404
+from django.views import generic
+
+from . import documents
+
+# 検索語の最大の長さ
+SEARCH_QUERY_MAX_LENGTH = getattr(settings, 'SEARCH_QUERY_MAX_LENGTH', 100)
+
+
+class Search(generic.TemplateView):
+    """ 投稿・相談・アドバイス・記事の検索(関連度順) """
+    template_name = 'search/search.html'
+    paginate_by = 20
+    # 関連度順はカーソルにできないので、辿れるページ数を制限する
+    max_pages = 50
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        query = self.request.GET.get('q', '').strip()[:SEARCH_QUERY_MAX_LENGTH]
+        try:
+            page = int(self.request.GET.get('page', 1))
+        except ValueError:
+            raise Http404('Invalid page')
+        if not 1 <= page <= self.max_pages:
+            raise Http404('Invalid page')
+
+        results = []
+        if query:
+            # 1件多く取得して次ページの有無を判定する
+            results = documents.search(query, (page - 1) * self.paginate_by, self.paginate_by + 1,
+                                       documents.visible_kinds(self.request.user))
+        ctx['query'] = query
+        ctx['results'] = results[:self.paginate_by]
+        ctx['page'] = page
+        ctx['has_next'] = len(results) > self.paginate_by and page < self.max_pages
+        ctx['has_previous'] = page > 1
+        return ctx
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class SeekforadviceConfig(AppConfig):
     name = 'seekforadvice'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,7 @@
+from project.counters import Recount, RecountCommand
+from seekforadvice.models import Advice, Seek
+
+
+class Command(RecountCommand):
+    """ Seek.advice_count を実際のAdvice件数と照合・再計算する """
+    recount = Recount(Seek, advice_count=(Advice, 'post_connected'))
@@ -0,0 +1,17 @@
+# Generated by Django 3.1.6 on 2026-10-18 12:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seekforadvice', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='seek',
+            index=models.Index(fields=['-date_posted', '-id'], name='seek_date_idx'),
+        ),
+    ]
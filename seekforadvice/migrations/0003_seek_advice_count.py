@@ -0,0 +1,27 @@
+# Generated by Django 3.1.6 on 2026-10-18 12:15
+
+from django.db import migrations, models
+
+from project.counters import Recount
+
+
+def fill_advice_count(apps, schema_editor):
+    Seek = apps.get_model('seekforadvice', 'Seek')
+    Advice = apps.get_model('seekforadvice', 'Advice')
+    Recount(Seek, advice_count=(Advice, 'post_connected')).fill()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seekforadvice', '0002_auto_20261018_2102'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='seek',
+            name='advice_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_advice_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.1.6 on 2026-10-18 12:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seekforadvice', '0003_seek_advice_count'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='advice',
+            index=models.Index(fields=['post_connected', '-date_posted', '-id'], name='advice_seek_date_idx'),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
 from django.utils import timezone
 
 User = get_user_model()
@@ -10,6 +11,7 @@ class Seek(models.Model):
     content = models.TextField(max_length=1000)
     date_posted = models.DateTimeField(default=timezone.now)
     author = models.ForeignKey(User, on_delete=models.CASCADE)
+    advice_count = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return self.content[:15]
@@ -17,6 +19,9 @@ class Seek(models.Model):
     class Meta:
         verbose_name = "seek"
         verbose_name_plural = "seek"
+        indexes = [
+            models.Index(fields=['-date_posted', '-id'], name='seek_date_idx'),
+        ]
 
 
 class Advice(models.Model):
@@ -29,6 +34,33 @@ class Advice(models.Model):
     def __str__(self):
         return f'{str(self.author.account_name)}：{str(self.date_posted)}'
 
+    @staticmethod
+    def adjust_count(seek_id, delta):
+        """ アドバイス数をdeltaだけ増減する(トランザクション内で呼ぶ) """
+        seeks = Seek.objects.filter(pk=seek_id)
+        if delta < 0:
+            seeks = seeks.filter(advice_count__gte=-delta)
+        seeks.update(advice_count=F('advice_count') + delta)
+
+    def save(self, *args, **kwargs):
+        """ 新規アドバイス時にアドバイス数を加算 """
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                self.adjust_count(self.post_connected_id, 1)
+
+    def delete(self, *args, **kwargs):
+        """ アドバイス削除時にアドバイス数を減算 """
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            self.adjust_count(self.post_connected_id, -1)
+        return result
+
     class Meta:
         verbose_name = "advice"
-        verbose_name_plural = "advice"
\ No newline at end of file
+        verbose_name_plural = "advice"
+        indexes = [
+            # 相談ごとのアドバイスを新しい順に取得するため
+            models.Index(fields=['post_connected', '-date_posted', '-id'], name='advice_seek_date_idx'),
+        ]
\ No newline at end of file
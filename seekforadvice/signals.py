@@ -0,0 +1,16 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from project import pagecache
+
+from .models import Advice, Seek
+
+
+@receiver([post_save, post_delete], sender=Seek, dispatch_uid='seek_invalidate_pages')
+def invalidate_seek_pages(sender, **kwargs):
+    pagecache.invalidate('seek')
+
+
+@receiver([post_save, post_delete], sender=Advice, dispatch_uid='advice_invalidate_pages')
+def invalidate_advice_pages(sender, **kwargs):
+    pagecache.invalidate('advice')
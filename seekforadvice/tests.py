@@ -1,3 +1,66 @@
 from django.test import TestCase
+from django.urls import reverse
 
-# Create your tests here.
+from project.testing import QueryBudgetTestCase, create_user
+
+from .models import Advice, Seek
+
+
+class QueryCountTests(QueryBudgetTestCase):
+    query_budgets = {
+        'seekforadvice:top': 4,
+        'seekforadvice:detail': 2,
+        'seekforadvice:advice_list': 1,
+        'seekforadvice:detail:add': 8,
+    }
+
+    def setUp(self):
+        super().setUp()
+        self.users = 0
+        self.seek = Seek.objects.create(author=self.new_user(), content='相談')
+
+    def new_user(self):
+        self.users += 1
+        return create_user(f'user{self.users}')
+
+    def add_advices(self, count):
+        for _ in range(count):
+            Advice.objects.create(author=self.new_user(), post_connected=self.seek, content='アドバイス')
+
+    def test_top(self):
+        def grow(count):
+            for _ in range(count):
+                Seek.objects.create(author=self.new_user(), content='相談')
+        self.assertQueryBudget('seekforadvice:top', grow=grow)
+
+    def test_detail(self):
+        self.assertQueryBudget('seekforadvice:detail', args=[self.seek.pk], grow=self.add_advices)
+
+    def test_advice_list(self):
+        self.assertQueryBudget('seekforadvice:advice_list', args=[self.seek.pk], grow=self.add_advices)
+
+    def test_add_advice(self):
+        self.assertQueryBudget('seekforadvice:detail', args=[self.seek.pk], key='seekforadvice:detail:add',
+                               method='post', data={'add': '', 'content': 'アドバイス'}, status=302)
+
+
+class AdviceListTests(TestCase):
+
+    def setUp(self):
+        self.seek = Seek.objects.create(author=create_user('author'), content='相談')
+
+    def get(self, pk):
+        return self.client.get(reverse('seekforadvice:advice_list', args=[pk]))
+
+    def test_unknown_seek_is_404(self):
+        self.assertEqual(self.get(self.seek.pk + 1).status_code, 404)
+
+    def test_seek_without_advices_renders_page(self):
+        response = self.get(self.seek.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '<html')
+        self.assertContains(response, reverse('seekforadvice:detail', args=[self.seek.pk]))
+
+    def test_lists_advices(self):
+        Advice.objects.create(author=create_user('adviser'), post_connected=self.seek, content='アドバイス')
+        self.assertContains(self.get(self.seek.pk), 'アドバイス')
@@ -6,4 +6,5 @@ app_name = 'seekforadvice'
 urlpatterns = [
     path('', views.SoA_List.as_view(), name='top'),
     path('detail/<int:pk>', views.SoA_details.as_view(), name='detail'),
+    path('detail/<int:pk>/advices', views.AdviceList.as_view(), name='advice_list'),
 ]
\ No newline at end of file
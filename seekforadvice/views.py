@@ -1,21 +1,53 @@
 from django.contrib.auth import get_user_model
+from django.contrib.auth.views import redirect_to_login
+from django.db import IntegrityError, transaction
+from django.db.models import Max
+from django.http import Http404
 from django.shortcuts import redirect
 from django.views import generic
 
+from project.pagecache import ConditionalPageMixin
+from project.pagination import CursorPaginationMixin
+
 from .models import Seek, Advice
 from .forms import AddAdvice
 
 User = get_user_model()
 
 
-class SoA_List(generic.ListView):
+class SoA_List(ConditionalPageMixin, CursorPaginationMixin, generic.ListView):
     template_name = 'seekforadvice/soa_list.html'
     context_object_name = 'objects_list'
     model = Seek
+    cursor_ordering = ('-date_posted', '-id')
+    # アドバイス数と投稿者のアカウント名・画像も表示しているので、それらが変わっても作り直す
+    page_namespaces = ('seek', 'advice', 'user')
+
+    def get_last_modified(self):
+        return Seek.objects.aggregate(last_modified=Max('date_posted'))['last_modified']
 
     def get_queryset(self):
-        queryset = Seek.objects.order_by('-date_posted')
-        return  queryset
+        queryset = Seek.objects.select_related('author')
+        return queryset
+
+
+class AdviceList(CursorPaginationMixin, generic.ListView):
+    """ 相談に紐づいたアドバイス(新しい順) """
+    template_name = 'seekforadvice/advice_list_page.html'
+    context_object_name = 'advices'
+    model = Advice
+    cursor_ordering = ('-date_posted', '-id')
+
+    def get_queryset(self):
+        return Advice.objects.filter(post_connected=self.kwargs['pk']).select_related('author')
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        # アドバイスがない時だけ、相談があるかを確かめる
+        if not ctx['advices'] and not Seek.objects.filter(pk=self.kwargs['pk']).exists():
+            raise Http404('No Seek matches the given query.')
+        ctx['seek_pk'] = self.kwargs['pk']
+        return ctx
 
 
 class SoA_details(generic.DetailView):
@@ -23,25 +55,34 @@ class SoA_details(generic.DetailView):
     context_object_name = 'objects'
     model = Seek
 
+    def get_queryset(self):
+        return Seek.objects.select_related('author')
+
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data()
-        """ 紐づいたアドバイスを表示 """
-        seek = self.kwargs.get('pk')
-        ctx['advices'] = Advice.objects.filter(post_connected=seek)
+        """ 紐づいたアドバイスを表示(AdviceListと同じページング) """
+        advice_list = AdviceList()
+        advice_list.setup(self.request, *self.args, **self.kwargs)
+        _, ctx['page_obj'], ctx['advices'], _ = advice_list.paginate_queryset(
+            advice_list.get_queryset(), advice_list.paginate_by)
         """ アドバイスを追加 """
-        ctx['form'] = AddAdvice()
+        ctx['form'] = kwargs.get('form') or AddAdvice()
         return ctx
 
     def post(self, *args, **kwargs):
-        if self.request.method == 'POST':
-            if 'add' in self.request.POST:
-                form = AddAdvice(self.request.POST)
-                if form.is_valid():
-                    add_advice = Advice()
-                    add_advice.author = User.objects.get(pk=self.request.user.pk)
-                    add_advice.content = self.request.POST.get('content')
-                    add_advice.post_connected = Seek.objects.get(pk=self.kwargs.get('pk'))
-                    add_advice.save()
-                else:
-                    return redirect('seekforadvice:top')
-            return self.get(self, *args, **kwargs)
\ No newline at end of file
+        if 'add' not in self.request.POST:
+            return redirect('seekforadvice:detail', self.kwargs['pk'])
+        if not self.request.user.is_authenticated:
+            return redirect_to_login(self.request.get_full_path())
+        form = AddAdvice(self.request.POST)
+        if not form.is_valid():
+            self.object = self.get_object()
+            return self.render_to_response(self.get_context_data(form=form))
+        # 投稿者・相談はidのまま保存する(存在しない相談なら外部キー制約で弾かれる)
+        try:
+            with transaction.atomic():
+                Advice.objects.create(author_id=self.request.user.pk, post_connected_id=self.kwargs['pk'],
+                                      content=form.cleaned_data['content'])
+        except IntegrityError:
+            raise Http404('No Seek matches the given query.')
+        return redirect('seekforadvice:detail', self.kwargs['pk'])